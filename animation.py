@@ -106,7 +106,10 @@ class Animation:
         surface = self.frames[int(frame) % len(self.frames)]
         game.imageManager.drawGameObjectAt(surface, drawLoc)
         if logger.getLogLevel() == logger.LOG_DEBUG:
-            # Draw the bounding polygon and location information
+            # Draw the bounding polygon and location information. They're
+            # drawn immediately, so flush the queued sprites first, or the
+            # sprites would end up on top of them.
+            game.imageManager.flushSprites()
             self.polygon.draw(loc)
             gridLoc = loc.toGridspace()
             game.fontManager.drawText('MODENINE', 12,
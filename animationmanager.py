@@ -47,6 +47,10 @@ class AnimationManager:
             logger.fatal("Unable to find a spriteConfig.py file anywhere in the path",spriteName)
 
 
+        # Load all of the group's frames at once, so that they can share
+        # textures.
+        game.imageManager.loadAnimationSet(spriteName)
+
         modulePath = os.path.join(modulePath, constants.spriteFilename)
         spriteModule = game.dynamicClassManager.loadModuleItems(modulePath, ['sprites'])
         animations = {}
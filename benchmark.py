@@ -0,0 +1,219 @@
+#!/usr/local/bin/python2.5
+
+import constants
+# Make maps as `jetblade.py --justmapgen` does, without a display.
+constants.isHeadless = True
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import optparse
+import multiprocessing
+
+## @package benchmark This package runs a reproducible map generation
+# benchmark. It generates maps headlessly for a fixed set of seeds at several
+# universe sizes, records the time and memory used by each stage of
+# Map.createMap() (see the mapgen.profiler module), and compares the results
+# against a stored baseline, flagging any stage that got slower by more than
+# a threshold. Each map is made in a fresh process, so that memory figures
+# aren't polluted by earlier maps.
+#
+# Typical use is to save a baseline before making a change:
+#
+#     benchmark.py --save baseline.json
+#
+# and then compare against it afterwards:
+#
+#     benchmark.py --baseline baseline.json
+#
+# which exits with a nonzero status if anything regressed. Timings are only
+# comparable on the same machine, so baselines aren't checked in. Run
+# `benchmark.py -h` for the full list of options.
+
+## Universe sizes, in blocks to a side, to benchmark by default.
+defaultSizes = [200, 500, 1000, 2000]
+## Seeds to benchmark by default.
+defaultSeeds = [1, 2, 3]
+## Default fraction by which a time or memory figure must exceed the baseline
+# to count as a regression.
+defaultThreshold = .2
+## Stages that take less time than this (in seconds) in both the baseline and
+# the current run are never counted as regressions, since their timings are
+# mostly noise.
+minRegressionTime = .05
+
+
+def run():
+    options = getOptions()
+    cases = [(size, seed) for size in options.sizes for seed in options.seeds]
+    results = []
+    # One map per worker process, so that each map's peak memory figure is
+    # its own.
+    pool = multiprocessing.Pool(1, maxtasksperchild = 1)
+    for result in pool.imap(runCase, cases):
+        print "Size %d seed %d: %.2fs, peak memory %s KB" % (result['size'],
+                result['seed'], result['totalTime'], result['peakMemory'])
+        results.append(result)
+    pool.close()
+    pool.join()
+
+    if options.savePath is not None:
+        fh = open(options.savePath, 'w')
+        json.dump({'results' : results}, fh, indent = 2)
+        fh.close()
+        print "Saved results to",options.savePath
+
+    if options.baselinePath is not None:
+        fh = open(options.baselinePath, 'r')
+        baseline = json.load(fh)['results']
+        fh.close()
+        regressions = compareResults(baseline, results, options.threshold)
+        if regressions:
+            print "%d regressions found" % len(regressions)
+            sys.exit(1)
+        print "No regressions found"
+
+
+def getOptions():
+    parser = optparse.OptionParser()
+    parser.add_option('--sizes', dest = 'sizes', default = None,
+                      help = "comma-separated universe sizes, in blocks " +
+                             "(default: %s)" %
+                             ','.join([str(size) for size in defaultSizes]),
+                      metavar = 'SIZES')
+    parser.add_option('--seeds', dest = 'seeds', default = None,
+                      help = "comma-separated seeds (default: %s)" %
+                             ','.join([str(seed) for seed in defaultSeeds]),
+                      metavar = 'SEEDS')
+    parser.add_option('-b', '--baseline', dest = 'baselinePath',
+                      default = None,
+                      help = "compare results against FILE", metavar = 'FILE')
+    parser.add_option('-s', '--save', dest = 'savePath', default = None,
+                      help = "save results to FILE, for use as a baseline",
+                      metavar = 'FILE')
+    parser.add_option('-t', '--threshold', dest = 'threshold',
+                      type = 'float', default = defaultThreshold,
+                      help = "count figures more than FRACTION above the " +
+                             "baseline as regressions (default: %.2f)" %
+                             defaultThreshold,
+                      metavar = 'FRACTION')
+    (options, args) = parser.parse_args()
+    options.sizes = parseList(options.sizes, defaultSizes)
+    options.seeds = parseList(options.seeds, defaultSeeds)
+    return options
+
+
+## Convert a comma-separated string of integers into a list, or return the
+# default if the string is None.
+def parseList(string, default):
+    if string is None:
+        return default
+    return [int(value) for value in string.split(',')]
+
+
+## Generate a single map, and return its statistics as a dict. Run in a
+# worker process.
+def runCase(case):
+    (size, seed) = case
+    import pyximport; pyximport.install()
+    import game
+    import logger
+    import mapgen.generator
+    import mapgen.profiler
+    logger.setLogLevel(logger.LOG_WARN)
+
+    mapgen.generator.minUniverseWidth = size * constants.blockSize
+    mapgen.generator.minUniverseHeight = size * constants.blockSize
+    mapgen.generator.universeDimensionVariance = 0
+    game.seed = seed
+    game.envEffectManager.reset()
+    game.sceneryManager.reset()
+    random.seed(str(seed))
+
+    # Saving the map is timed along with everything else, but the file isn't
+    # needed afterwards, so keep it out of the current directory.
+    saveDir = tempfile.mkdtemp()
+    try:
+        startTime = time.time()
+        game.map = mapgen.generator.Map()
+        game.map.createMap(os.path.join(saveDir, str(seed)))
+        totalTime = time.time() - startTime
+    finally:
+        shutil.rmtree(saveDir)
+
+    # Checksum the layout, so we can tell if we're not comparing like with
+    # like.
+    isEmpty = game.map.blocks == mapgen.generator.BLOCK_EMPTY
+    return {
+        'size' : size,
+        'seed' : seed,
+        'totalTime' : totalTime,
+        'peakMemory' : mapgen.profiler.getPeakMemory(),
+        'checksum' : hashlib.md5(isEmpty.tostring()).hexdigest(),
+        'stages' : game.map.profiler.stages,
+    }
+
+
+## Compare a run's results against the baseline, print a report, and return
+# a list of descriptions of any regressions.
+def compareResults(baseline, results, threshold):
+    keyToBaseline = dict()
+    for result in baseline:
+        keyToBaseline[(result['size'], result['seed'])] = result
+
+    regressions = []
+    for result in results:
+        key = (result['size'], result['seed'])
+        label = "Size %d seed %d" % key
+        if key not in keyToBaseline:
+            print label,"is not in the baseline"
+            continue
+        base = keyToBaseline[key]
+        if base['checksum'] != result['checksum']:
+            print label,"made a different map than the baseline did"
+
+        figures = [('total time', base['totalTime'], result['totalTime'])]
+        nameToBaseStage = dict([(stage['name'], stage)
+                                for stage in base['stages']])
+        for stage in result['stages']:
+            if stage['name'] in nameToBaseStage:
+                figures.append((stage['name'],
+                        nameToBaseStage[stage['name']]['wallTime'],
+                        stage['wallTime']))
+
+        for (name, oldTime, newTime) in figures:
+            change = getChange(oldTime, newTime)
+            print "%s: %-28s %9.3fs -> %9.3fs (%+.1f%%)" % (label, name,
+                    oldTime, newTime, change * 100)
+            if (change > threshold and
+                    max(oldTime, newTime) >= minRegressionTime):
+                regressions.append("%s: %s" % (label, name))
+
+        if (base['peakMemory'] is not None and
+                result['peakMemory'] is not None):
+            change = getChange(base['peakMemory'], result['peakMemory'])
+            print "%s: %-28s %8d KB -> %8d KB (%+.1f%%)" % (label,
+                    'peak memory', base['peakMemory'], result['peakMemory'],
+                    change * 100)
+            if change > threshold:
+                regressions.append("%s: peak memory" % label)
+
+    for regression in regressions:
+        print "REGRESSION:",regression
+    return regressions
+
+
+## Return the fractional change from the old value to the new one.
+def getChange(oldValue, newValue):
+    if oldValue <= 0:
+        return 0
+    return (newValue - oldValue) / float(oldValue)
+
+
+if __name__ == '__main__':
+    run()
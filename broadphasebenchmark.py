@@ -0,0 +1,190 @@
+#!/usr/local/bin/python2.5
+
+import constants
+# Loading the game module sets up its managers, which don't need a window
+# or mixer just to time the broadphases.
+constants.isHeadless = True
+
+import math
+import time
+import random
+import optparse
+
+import pygame
+
+## @package broadphasebenchmark This package compares the broadphases that the
+# gameobjectmanager module can hold dynamic objects in. For each object count,
+# it scatters that many creature-sized objects in crowds across a number of
+# rooms, and then runs a number of ticks in which some of the objects wander
+# around their rooms. Each tick, the moved objects are relocated in the
+# broadphase and all colliding pairs are found, as in
+# GameObjectManager.update(). It reports the time taken to build the
+# broadphase (adding every object and finding the pairs once) and the time per
+# tick spent on relocation and finding pairs, and checks that every
+# broadphase found the same pairs. Run
+# `broadphasebenchmark.py -h` for the full list of options.
+
+## Object counts to benchmark by default.
+defaultCounts = [100, 1000, 10000]
+## Default number of ticks to run for each count.
+defaultNumTicks = 20
+## Number of objects crowded into each room.
+objectsPerRoom = 50
+## Width and height of each room, in realspace.
+roomSize = 20 * constants.blockSize
+## Distance between the corners of adjacent rooms, in realspace.
+roomSpacing = 2 * roomSize
+## Fraction of objects that move each tick.
+movingFraction = .5
+## Largest distance an object moves in each direction per tick, in
+# realspace.
+maxStep = 20
+
+
+## Stand-in for a PhysicsObject: just a rect that wanders around a room.
+class BenchmarkObject:
+    def __init__(self, x, y, width, height, room):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        ## Rect that the object must stay inside.
+        self.room = room
+
+
+    ## Move by a random amount, staying inside our room.
+    def wander(self, rng):
+        self.x = min(max(self.x + rng.randint(-maxStep, maxStep),
+                         self.room.left), self.room.right - self.width)
+        self.y = min(max(self.y + rng.randint(-maxStep, maxStep),
+                         self.room.top), self.room.bottom - self.height)
+
+
+    def getBounds(self):
+        return pygame.rect.Rect(self.x, self.y, self.width, self.height)
+
+
+def run():
+    options = getOptions()
+    import pyximport; pyximport.install()
+    # The game module has to be loaded before any of the managers.
+    import game
+    import gameobjectmanager
+
+    for count in options.counts:
+        (bounds, objects) = makeObjects(count, options.seed)
+        print "%d objects in %d rooms:" % (count,
+                int(math.ceil(count / float(objectsPerRoom))))
+        nameToPairs = dict()
+        for name in sorted(gameobjectmanager.broadphases.keys()):
+            (stats, pairs) = runCase(gameobjectmanager.broadphases[name],
+                                     bounds, objects, options.numTicks,
+                                     options.seed)
+            nameToPairs[name] = pairs
+            print ("  %-13s build %8.2fms  relocate %8.2fms/tick  " +
+                   "pairs %8.2fms/tick  (%d pairs/tick)") % ((name,) + stats)
+        pairSets = nameToPairs.values()
+        for pairs in pairSets[1:]:
+            if pairs != pairSets[0]:
+                print "  MISMATCH: broadphases found different pairs"
+                break
+
+
+def getOptions():
+    parser = optparse.OptionParser()
+    parser.add_option('--counts', dest = 'counts', default = None,
+                      help = "comma-separated object counts (default: %s)" %
+                             ','.join([str(count) for count in defaultCounts]),
+                      metavar = 'COUNTS')
+    parser.add_option('--ticks', dest = 'numTicks', type = 'int',
+                      default = defaultNumTicks,
+                      help = "run TICKS ticks for each count (default: %d)" %
+                             defaultNumTicks,
+                      metavar = 'TICKS')
+    parser.add_option('-s', '--seed', dest = 'seed', type = 'int',
+                      default = 1,
+                      help = "use SEED to place and move objects",
+                      metavar = 'SEED')
+    (options, args) = parser.parse_args()
+    if options.counts is None:
+        options.counts = defaultCounts
+    else:
+        options.counts = [int(count) for count in options.counts.split(',')]
+    return options
+
+
+## Return the bounds of the world, and a list of the given number of
+# BenchmarkObjects spread across enough rooms to hold them.
+def makeObjects(count, seed):
+    rng = random.Random(seed)
+    numRooms = int(math.ceil(count / float(objectsPerRoom)))
+    roomsPerSide = int(math.ceil(math.sqrt(numRooms)))
+    worldSize = roomsPerSide * roomSpacing
+    bounds = pygame.rect.Rect(0, 0, worldSize, worldSize)
+    objects = []
+    for i in xrange(count):
+        roomIndex = i / objectsPerRoom
+        room = pygame.rect.Rect(
+                (roomIndex % roomsPerSide) * roomSpacing + roomSize / 2,
+                (roomIndex / roomsPerSide) * roomSpacing + roomSize / 2,
+                roomSize, roomSize)
+        width = rng.randint(30, 80)
+        height = rng.randint(60, 120)
+        objects.append(BenchmarkObject(
+                rng.randint(room.left, room.right - width),
+                rng.randint(room.top, room.bottom - height),
+                width, height, room))
+    return (bounds, objects)
+
+
+## Run the benchmark for one broadphase. Return a tuple of the time taken to
+# build the broadphase, the mean time per tick spent relocating objects and finding
+# pairs (all in milliseconds), and the mean number of pairs per tick, along
+# with the set of pairs (as pairs of indices into objects) found in each tick.
+def runCase(broadphaseClass, bounds, objects, numTicks, seed):
+    # Work on copies, so that each broadphase sees the same movements.
+    objects = [BenchmarkObject(object.x, object.y, object.width,
+                               object.height, object.room)
+               for object in objects]
+    idToIndex = dict([(id(object), i) for i, object in enumerate(objects)])
+    rng = random.Random(seed)
+
+    startTime = time.time()
+    broadphase = broadphaseClass(bounds)
+    for object in objects:
+        broadphase.addObject(object)
+    list(broadphase.getCollisionPairs())
+    buildTime = time.time() - startTime
+
+    relocateTime = 0
+    pairsTime = 0
+    numPairs = 0
+    allPairs = []
+    numMoving = int(len(objects) * movingFraction)
+    for tick in xrange(numTicks):
+        movers = rng.sample(objects, numMoving)
+        for object in movers:
+            object.wander(rng)
+
+        startTime = time.time()
+        for object in movers:
+            broadphase.relocateObject(object)
+        relocateTime += time.time() - startTime
+
+        startTime = time.time()
+        pairs = list(broadphase.getCollisionPairs())
+        pairsTime += time.time() - startTime
+
+        numPairs += len(pairs)
+        tickPairs = set()
+        for (first, second) in pairs:
+            tickPairs.add(tuple(sorted((idToIndex[id(first)],
+                                        idToIndex[id(second)]))))
+        allPairs.append(tickPairs)
+
+    return ((buildTime * 1000, relocateTime * 1000 / numTicks,
+             pairsTime * 1000 / numTicks, numPairs / numTicks), allPairs)
+
+
+if __name__ == '__main__':
+    run()
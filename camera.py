@@ -1,5 +1,8 @@
 import game
 import util
+import constants
+
+import pygame
 
 ## The maximum speed for the camera to move, to prevent jerky camera motion 
 # if the player teleports.
@@ -36,6 +39,21 @@ class Camera:
         return self.prevLoc.interpolate(self.curLoc, progress)
 
 
+    ## Return a Rect covering the part of the world, in realspace, that is 
+    # on the screen at the current zoom level. This matches the transform 
+    # that mainloop.draw() sets up: the world is scaled by game.zoom about
+    # the screen's bottom-left corner, so zooming out extends the view to the
+    # right and up from there.
+    def getViewRect(self, progress = None):
+        loc = self.getDrawLoc(progress)
+        width = constants.sw / game.zoom
+        height = constants.sh / game.zoom
+        # Round outwards, so that partly-visible pixels count.
+        left = int(loc.x - constants.sw / 2) - 1
+        top = int(loc.y + constants.sh / 2 - height) - 1
+        return pygame.rect.Rect(left, top, int(width) + 3, int(height) + 3)
+
+
     ## Just return our current location, un-interpolated.
     def getLoc(self):
         return self.curLoc
@@ -0,0 +1,208 @@
+#!/usr/local/bin/python2.5
+
+import constants
+# Only polygon collisions are timed, so there's nothing to display.
+constants.isHeadless = True
+
+import math
+import time
+import random
+import optparse
+
+## @package collisionbenchmark This package checks and times the collision
+# tests that Map.collidePolygon() runs against terrain blocks. Blocks with
+# axis-aligned box polygons are collided by comparing bounding boxes (see
+# Polygon.collideBox()), and the rest by full SAT. First, it collides a
+# variety of object polygons (the player's, and random convex polygons)
+# against every terrain polygon at random locations, and checks that the
+# box test gives exactly the same distances and ejection vectors as full SAT
+# does. Then it times both tests against the box and sloped terrain
+# polygons, and times whole batches of the blocks around an object, as
+# Map.collidePolygon() sees them. Run `collisionbenchmark.py -h` for the full
+# list of options.
+
+## Default number of random collisions to check the box test with.
+defaultNumChecks = 100000
+## Default number of collisions to time each test with.
+defaultNumTimings = 100000
+## Number of random convex polygons to collide, besides the player's.
+numRandomPolygons = 20
+## Largest number of points in the random convex polygons.
+maxRandomPoints = 8
+## Width and height, in blocks, of the neighbourhood of blocks that each
+# object is collided against when timing batches; about what
+# Map.collidePolygon() looks at for the player.
+neighbourhoodSize = (4, 6)
+## Fraction of blocks in each neighbourhood that are sloped.
+slopedFraction = .2
+
+
+def run():
+    options = getOptions()
+    import pyximport; pyximport.install()
+    # The game module has to be loaded before anything that uses Vector2D.
+    import game
+    from vector2d import Vector2D
+    from polygon import Polygon
+    from data.sprites.terrain import spriteConfig as terrainConfig
+    from data.sprites.maleplayer import spriteConfig as playerConfig
+
+    rng = random.Random(options.seed)
+    nameToTile = dict()
+    for name, data in terrainConfig.sprites.iteritems():
+        nameToTile[name] = Polygon([Vector2D(point)
+                                    for point in data['polygon']])
+    boxTiles = []
+    slopedTiles = []
+    for name in sorted(nameToTile.keys()):
+        if nameToTile[name].isAxisAlignedBox:
+            boxTiles.append(nameToTile[name])
+        else:
+            slopedTiles.append(nameToTile[name])
+    print "%d terrain polygons: %d boxes, %d sloped" % (len(nameToTile),
+            len(boxTiles), len(slopedTiles))
+
+    objects = [Polygon([Vector2D(point) for point in polygon])
+               for polygon in [playerConfig.standingPolygon,
+                               playerConfig.crawlingPolygon]]
+    for i in xrange(numRandomPolygons):
+        objects.append(makeRandomPolygon(rng, Polygon, Vector2D))
+
+    checkResults(rng, boxTiles + slopedTiles, objects, options.numChecks,
+                 Vector2D)
+    timeTests(rng, boxTiles, slopedTiles, objects, options.numTimings,
+              Vector2D)
+
+
+def getOptions():
+    parser = optparse.OptionParser()
+    parser.add_option('--checks', dest = 'numChecks', type = 'int',
+                      default = defaultNumChecks,
+                      help = "check CHECKS random collisions (default: %d)" %
+                             defaultNumChecks,
+                      metavar = 'CHECKS')
+    parser.add_option('--timings', dest = 'numTimings', type = 'int',
+                      default = defaultNumTimings,
+                      help = "time each test over TIMINGS collisions " +
+                             "(default: %d)" % defaultNumTimings,
+                      metavar = 'TIMINGS')
+    parser.add_option('-s', '--seed', dest = 'seed', type = 'int',
+                      default = 1,
+                      help = "use SEED to make and place polygons",
+                      metavar = 'SEED')
+    (options, args) = parser.parse_args()
+    return options
+
+
+## Return a random convex polygon about the size of a creature, made from
+# points on an ellipse.
+def makeRandomPolygon(rng, polygonClass, vectorClass):
+    numPoints = rng.randint(3, maxRandomPoints)
+    angles = sorted([rng.uniform(0, 2 * math.pi) for i in xrange(numPoints)])
+    width = rng.uniform(10, 80)
+    height = rng.uniform(10, 150)
+    return polygonClass([vectorClass(width * (1 + math.cos(angle)),
+                                     height * (1 + math.sin(angle)))
+                         for angle in angles])
+
+
+## Return a random location at which the given object polygon's bounding box
+# overlaps or nearly overlaps that of a tile at the origin. Locations are
+# mostly fractional, but sometimes whole numbers so that edges line up
+# exactly.
+def getNearbyLoc(rng, tile, object, vectorClass):
+    coords = []
+    for (tileMin, tileMax, objectMin, objectMax) in [
+            (tile.upperLeft.x, tile.lowerRight.x,
+             object.upperLeft.x, object.lowerRight.x),
+            (tile.upperLeft.y, tile.lowerRight.y,
+             object.upperLeft.y, object.lowerRight.y)]:
+        coord = rng.uniform(tileMin - objectMax - 5, tileMax - objectMin + 5)
+        if rng.random() < .2:
+            coord = round(coord)
+        coords.append(coord)
+    return vectorClass(coords[0], coords[1])
+
+
+## Collide random objects against random tiles, and check that runSAT()
+# (which uses the box test for boxes), runFullSAT(), and runSATBatch() all
+# agree exactly.
+def checkResults(rng, tiles, objects, numChecks, vectorClass):
+    numMismatches = 0
+    numHits = 0
+    for i in xrange(numChecks):
+        tile = rng.choice(tiles)
+        object = rng.choice(objects)
+        tileLoc = vectorClass(rng.randint(0, 100),
+                              rng.randint(0, 100)).multiply(constants.blockSize)
+        objectLoc = tileLoc.add(getNearbyLoc(rng, tile, object, vectorClass))
+        results = [tile.runSAT(tileLoc, object, objectLoc),
+                   tile.runFullSAT(tileLoc, object, objectLoc),
+                   object.runSATBatch(objectLoc, [tile], [tileLoc])[0]]
+        keys = [(distance, vector is None or vector.tuple())
+                for (distance, vector) in results]
+        if keys[0][1] is not True:
+            numHits += 1
+        if keys[1:] != keys[:-1]:
+            numMismatches += 1
+            if numMismatches <= 10:
+                print "  MISMATCH: %s at %s vs. %s at %s: %s" % (tile,
+                        tileLoc, object, objectLoc, keys)
+    print "Checked %d collisions (%d hits): %d mismatches" % (numChecks,
+            numHits, numMismatches)
+
+
+## Time the box test and full SAT against box and sloped tiles, and time
+# batches of neighbourhoods of blocks.
+def timeTests(rng, boxTiles, slopedTiles, objects, numTimings, vectorClass):
+    origin = vectorClass(0, 0)
+    for (label, tiles) in [('box', boxTiles), ('sloped', slopedTiles)]:
+        cases = []
+        for i in xrange(numTimings):
+            tile = rng.choice(tiles)
+            object = rng.choice(objects)
+            cases.append((tile, object,
+                          getNearbyLoc(rng, tile, object, vectorClass)))
+        startTime = time.time()
+        for (tile, object, objectLoc) in cases:
+            tile.runSAT(origin, object, objectLoc)
+        fastTime = time.time() - startTime
+        startTime = time.time()
+        for (tile, object, objectLoc) in cases:
+            tile.runFullSAT(origin, object, objectLoc)
+        fullTime = time.time() - startTime
+        print ("  %-6s tiles: runSAT %6.3fus  runFullSAT %6.3fus " +
+               "per collision") % (label, fastTime * 1e6 / numTimings,
+                                   fullTime * 1e6 / numTimings)
+
+    # Whole neighbourhoods, as passed to runSATBatch() by
+    # Map.collidePolygon().
+    (width, height) = neighbourhoodSize
+    numBatches = max(1, numTimings / (width * height))
+    batches = []
+    for i in xrange(numBatches):
+        object = rng.choice(objects)
+        tiles = []
+        tileLocs = []
+        for x in xrange(width):
+            for y in xrange(height):
+                if rng.random() < slopedFraction:
+                    tiles.append(rng.choice(slopedTiles))
+                else:
+                    tiles.append(rng.choice(boxTiles))
+                tileLocs.append(vectorClass(x, y).multiply(constants.blockSize))
+        objectLoc = vectorClass(rng.uniform(0, (width - 1) * constants.blockSize),
+                                rng.uniform(0, (height - 2) * constants.blockSize))
+        batches.append((object, objectLoc, tiles, tileLocs))
+    startTime = time.time()
+    for (object, objectLoc, tiles, tileLocs) in batches:
+        object.runSATBatch(objectLoc, tiles, tileLocs)
+    batchTime = time.time() - startTime
+    print ("  %dx%d neighbourhoods: runSATBatch %7.3fus per neighbourhood " +
+           "(%6.3fus per block)") % (width, height,
+            batchTime * 1e6 / numBatches,
+            batchTime * 1e6 / (numBatches * width * height))
+
+
+if __name__ == '__main__':
+    run()
@@ -18,6 +18,12 @@ sh = 650
 ## Default scaling factor
 DEFAULT_ZOOM = 1
 
+## If true, we are running without a display (e.g. generating maps on a 
+# machine with no screen). No window or OpenGL context is created, no 
+# textures are made, and the sound mixer and fonts are not initialized. This 
+# must be set before the game module is imported.
+isHeadless = False
+
 ## The size of a single block of terrain in the map
 blockSize = 50
 
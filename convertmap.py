@@ -0,0 +1,42 @@
+#!/usr/local/bin/python2.5
+
+import constants
+# We don't need a display to convert maps.
+constants.isHeadless = True
+
+import mapgen.mapfile
+
+import optparse
+
+## @package convertmap This package converts map files between the text and
+# binary formats (see the mapfile module). By default, each map is converted
+# to the format it isn't already in. Run `convertmap.py -h` for a list of
+# options.
+
+def run():
+    parser = optparse.OptionParser(
+            usage = "%prog [options] INPUT OUTPUT")
+    parser.add_option('-t', '--text', dest = 'format', action = 'store_const',
+                      const = 'text', default = None,
+                      help = "write the text map format")
+    parser.add_option('-b', '--binary', dest = 'format',
+                      action = 'store_const', const = 'binary',
+                      help = "write the binary map format")
+    (options, args) = parser.parse_args()
+    if len(args) != 2:
+        parser.error("Need an input and an output map file")
+    (inputFilename, outputFilename) = args
+
+    isBinary = options.format == 'binary'
+    if options.format is None:
+        fh = open(inputFilename, 'rb')
+        isBinary = fh.read(len(mapgen.mapfile.binaryMagic)) != mapgen.mapfile.binaryMagic
+        fh.close()
+    mapData = mapgen.mapfile.readMap(inputFilename)
+    mapgen.mapfile.writeMap(mapData, outputFilename, isBinary)
+    print "Wrote %s map with %d blocks to %s" % (
+            ['text', 'binary'][isBinary],
+            len(mapData.sections['blocks']), outputFilename)
+
+if __name__ == '__main__':
+    run()
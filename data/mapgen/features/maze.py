@@ -45,9 +45,10 @@ class Maze(straight.StraightTunnel):
         # to make the maze. Cells where both x and y are even are open; the rest
         # are closed.
         changedBlocks = set()
-        for loc in self.sector.spaces:
+        sectorSpaces = self.sector.getSpaces()
+        for loc in sectorSpaces:
             if loc.x % 2 or loc.y % 2:
-                self.map.blocks[loc.ix][loc.iy] = mapgen.generator.BLOCK_WALL
+                self.map.blocks[loc.ix, loc.iy] = mapgen.generator.BLOCK_WALL
                 changedBlocks.add(loc)
 
         # Run the growing tree algorithm
@@ -68,16 +69,16 @@ class Maze(straight.StraightTunnel):
                 # and end up with blocked-off corridors.
                 # \todo Find a better way to handle this.
                 if (offY >= self.map.numRows or 
-                        self.map.blocks[cell.ix][offY] != mapgen.generator.BLOCK_EMPTY or
-                        Vector2D(cell.x, offY) not in self.sector.spaces):
+                        self.map.blocks[cell.ix, offY] != mapgen.generator.BLOCK_EMPTY or
+                        not self.sector.getIsOurSpace(Vector2D(cell.x, offY))):
                     break
                 verticalClearance += 1
 
             for i in range(1, mazeMaximumColumnHeight):
                 offY = cell.iy - i
                 if (offY < 0 or 
-                        self.map.blocks[cell.ix][offY] != mapgen.generator.BLOCK_EMPTY or
-                        Vector2D(cell.x, offY) not in self.sector.spaces):
+                        self.map.blocks[cell.ix, offY] != mapgen.generator.BLOCK_EMPTY or
+                        not self.sector.getIsOurSpace(Vector2D(cell.x, offY))):
                     break
                 verticalClearance += 1
 
@@ -85,7 +86,7 @@ class Maze(straight.StraightTunnel):
             for offset in vector2d.NEWSPerimeterOrder:
                 adjacentBlock = cell.add(offset.multiply(2))
                 # Check to see if adjacent cells are already marked
-                if adjacentBlock in self.sector.spaces and adjacentBlock not in seenCells:
+                if self.sector.getIsOurSpace(adjacentBlock) and adjacentBlock not in seenCells:
                     # Neighbors above/below must pass a maximum vertical
                     # tunnel height check.
                     if offset.y == 0 or verticalClearance + 2 < mazeMaximumColumnHeight:
@@ -102,7 +103,7 @@ class Maze(straight.StraightTunnel):
             cellStack.append(neighbor)
             # Get the offset to reach the wall.
             wallLoc = cell.add(neighbor.sub(cell).divide(2))
-            self.map.blocks[wallLoc.ix][wallLoc.iy] = mapgen.generator.BLOCK_EMPTY
+            self.map.blocks[wallLoc.ix, wallLoc.iy] = mapgen.generator.BLOCK_EMPTY
             seenCells.add(wallLoc)
 
         # Step five: because of our limit on vertical expansion, it's possible 
@@ -110,7 +111,7 @@ class Maze(straight.StraightTunnel):
         # that should be; if we find any, revert the maze rather than have 
         # bits of it be blocked off.
         shouldRevert = False
-        for loc in self.sector.spaces:
+        for loc in sectorSpaces:
             if (self.map.getBlockAtGridLoc(loc) == mapgen.generator.BLOCK_EMPTY and 
                     loc not in seenCells):
                 logger.debug("Cell",loc,"not reachable")
@@ -120,7 +121,7 @@ class Maze(straight.StraightTunnel):
         if shouldRevert:
             logger.debug("Unable to make maze for",self.sector.id,"from",self.sector.start,"to",self.sector.end)
             for block in changedBlocks:
-                self.map.blocks[block.ix][block.iy] = mapgen.generator.BLOCK_EMPTY
+                self.map.blocks[block.ix, block.iy] = mapgen.generator.BLOCK_EMPTY
         else:
             # Step six: clear some space at the beginning and end of the maze.
             for loc in [startLoc, endLoc]:
@@ -132,8 +133,8 @@ class Maze(straight.StraightTunnel):
                                    int(loc.y + mazeEndpointOpenSpace)):
                         if y < 0 or y >= self.map.numRows:
                             continue
-                        if Vector2D(x, y) in self.sector.spaces:
-                            self.map.blocks[x][y] = mapgen.generator.BLOCK_EMPTY
+                        if self.sector.getIsOurSpace(Vector2D(x, y)):
+                            self.map.blocks[x, y] = mapgen.generator.BLOCK_EMPTY
                 self.map.addPlatform(loc, mazeEndpointOpenSpace)
             self.madeMaze = True
         
@@ -43,8 +43,8 @@ class Pit(straight.StraightTunnel):
 
         # Set up walls to contain the bottom of the pit.
         for y in range(surfaceY, bottomY + 1):
-            self.map.blocks[start.ix][y] = mapgen.generator.BLOCK_WALL
-            self.map.blocks[end.ix][y] = mapgen.generator.BLOCK_WALL
+            self.map.blocks[start.ix, y] = mapgen.generator.BLOCK_WALL
+            self.map.blocks[end.ix, y] = mapgen.generator.BLOCK_WALL
 
         # Now fill the pit with stuff.
         # \todo Make this more variable. For now, just add water.
@@ -59,5 +59,5 @@ class Pit(straight.StraightTunnel):
         for x in range(start.ix, end.ix + 1, mapgen.generator.minHorizDistToOtherPlatforms):
             top = int(random.uniform(surfaceY - 2, surfaceY + 1))
             for y in range(top, bottomY):
-                self.map.blocks[x][y] = mapgen.generator.BLOCK_WALL
+                self.map.blocks[x, y] = mapgen.generator.BLOCK_WALL
 
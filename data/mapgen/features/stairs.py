@@ -26,22 +26,28 @@ class StairsTunnel(straight.StraightTunnel):
         intercept = (self.sector.start.y - self.sector.start.x * slope) / constants.blockSize
 
 
-        touchedColumns = set()
-        for loc in self.sector.spaces:
-            if (loc.x not in touchedColumns and 
-                    self.map.blocks[loc.ix][loc.iy + 1] == mapgen.generator.BLOCK_WALL and 
-                    loc.y > loc.x * slope + intercept):
-                touchedColumns.add(loc.x)
-                distToCeiling = self.sector.getDistToCeiling(loc)
-                if distToCeiling < stairsMinimumClearance:
-                    continue
-                # Quantize the Y location
-                targetY = (int(loc.y / stairsHeight)) * stairsHeight
-
-                currentLoc = Vector2D(loc.x, targetY)
-                while currentLoc.y <= loc.y:
-                    if self.sector.getIsOurSpace(currentLoc):
-                        self.map.blocks[currentLoc.ix][currentLoc.iy] = mapgen.generator.BLOCK_WALL
-                    currentLoc = currentLoc.addY(1)
+        # Find the topmost floor space in each column that is below the line
+        # from our start to our end.
+        columnToFloor = dict()
+        for loc in self.sector.getSpaces():
+            if (self.map.blocks[loc.ix, loc.iy + 1] == mapgen.generator.BLOCK_WALL and
+                    loc.y > loc.x * slope + intercept and
+                    (loc.x not in columnToFloor or
+                     loc.y < columnToFloor[loc.x].y)):
+                columnToFloor[loc.x] = loc
+
+        for x in sorted(columnToFloor.keys()):
+            loc = columnToFloor[x]
+            distToCeiling = self.sector.getDistToCeiling(loc)
+            if distToCeiling < stairsMinimumClearance:
+                continue
+            # Quantize the Y location
+            targetY = (int(loc.y / stairsHeight)) * stairsHeight
+
+            currentLoc = Vector2D(loc.x, targetY)
+            while currentLoc.y <= loc.y:
+                if self.sector.getIsOurSpace(currentLoc):
+                    self.map.blocks[currentLoc.ix, currentLoc.iy] = mapgen.generator.BLOCK_WALL
+                currentLoc = currentLoc.addY(1)
 
 
@@ -7,7 +7,8 @@ import pygame
 import os
 import time
 import string
-import OpenGL.GL as GL
+if not constants.isHeadless:
+    import OpenGL.GL as GL
 
 ## Number of strings to keep cached.
 TEXT_CACHE_SIZE = 64
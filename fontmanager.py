@@ -12,6 +12,9 @@ class FontManager:
     def __init__(self):
         ## Maps (fontName, fontSize) to Font instances
         self.fontMap = dict()
+        if constants.isHeadless:
+            # Fonts need textures, which need an OpenGL context.
+            return
         configPath = os.path.join(constants.fontPath, constants.fontFilename)
         fontModule = game.dynamicClassManager.loadModuleItems(configPath, ['fonts'])
         for fontName, fontConfig in fontModule.fonts.iteritems():
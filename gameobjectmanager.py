@@ -1,34 +1,101 @@
 import game
 import quadtree
+import spatialhash
+import sweepandprune
 import constants
 import logger
 
 import os
 
+## @package gameobjectmanager This package handles the dynamic objects in the
+# game. The objects are held in a broadphase, which tracks where objects are
+# so that we can quickly find the ones that might be touching. Broadphases are
+# instantiated with the bounds of the map as a Rect, and provide the
+# following methods:
+# - addObject(object): add an object.
+# - removeObject(object): remove an object, returning False if it wasn't
+#   there.
+# - relocateObject(object): update the broadphase after an object may have
+#   moved or changed size.
+# - getObjects(): return a list of all objects, in an order that only depends
+#   on the order in which objects were added, moved, and removed.
+# - getNumObjects(): return the number of objects.
+# - getObjectsIntersectingRect(rect): return a list of all objects whose
+#   bounding rects intersect the given Rect.
+# - getCollisionPairs(): yield each pair of objects whose bounding rects
+#   overlap, once.
+
+## Maps names of broadphases to their classes.
+broadphases = {
+    'quadtree' : quadtree.LooseQuadTree,
+    'spatialhash' : spatialhash.SpatialHash,
+    'sweepandprune' : sweepandprune.SweepAndPrune,
+}
+## Name of the broadphase to use if none is chosen.
+defaultBroadphase = 'quadtree'
+
 ## This class handles all dynamic (i.e. not part of the map grid) objects during
 # gameplay.
 class GameObjectManager:
     ## Instantiate a manager
     def __init__(self):
-        ## QuadTree that holds all dynamic objects. Delay instantiating this
+        ## Name of the kind of broadphase to use; see setBroadphase().
+        self.broadphaseName = defaultBroadphase
+        ## Broadphase that holds all dynamic objects. Delay instantiating this
         # until the game map is ready.
-        self.objectTree = None
+        self.broadphase = None
+
+
+    ## Choose the kind of broadphase (one of the keys of broadphases) to
+    # hold objects in. Must be called before setup().
+    def setBroadphase(self, name):
+        if name not in broadphases:
+            logger.fatal("Unknown broadphase",name,"; options are",
+                         ', '.join(sorted(broadphases.keys())))
+        self.broadphaseName = name
+
 
-  
-    ## Set up our tree now that the map's done being made.
+    ## Set up our broadphase now that the map's done being made.
     def setup(self):
-        if self.objectTree is None:
-            self.objectTree = quadtree.QuadTree(game.map.getBounds())
+        if self.broadphase is None:
+            broadphaseClass = broadphases[self.broadphaseName]
+            self.broadphase = broadphaseClass(game.map.getBounds())
 
 
     ## Update all objects
     def update(self):
+        objects = self.broadphase.getObjects()
         if logger.getLogLevel() == logger.LOG_DEBUG:
-            logger.debug("Updating",len(self.objectTree.getObjects()),"objects")
-        self.objectTree.prepObjects()
-        self.objectTree.runObjectCollisionDetection()
-        self.objectTree.runTerrainCollisionDetection()
-        self.objectTree.cleanupObjects()
+            logger.debug("Updating",len(objects),"objects")
+        for object in objects:
+            object.AIUpdate()
+            object.preCollisionUpdate()
+            object.applyPhysics()
+            # Keep the broadphase current so collision detection sees the
+            # object where it is now.
+            self.broadphase.relocateObject(object)
+
+        for (firstObject, secondObject) in self.broadphase.getCollisionPairs():
+            if firstObject.shouldCollideAgainstFaction(secondObject.faction):
+                firstObject.hitObject(secondObject)
+            if secondObject.shouldCollideAgainstFaction(firstObject.faction):
+                secondObject.hitObject(firstObject)
+
+        for object in objects:
+            if object.shouldCollideAgainstFaction('solid'):
+                game.map.collideObject(object)
+            object.postCollisionUpdate()
+            # \todo Move this into the object itself. We shouldn't be updating
+            # its sprite for it.
+            object.sprite.update(object.loc)
+
+        for object in objects:
+            if object.getIsAlive():
+                self.broadphase.relocateObject(object)
+            else:
+                # Object is no longer alive; start death.
+                self.broadphase.removeObject(object)
+                object.die()
 
 
     ## Run an object against terrain collision detection.
@@ -36,25 +103,30 @@ class GameObjectManager:
         game.map.collideObject(object)
 
 
-    ## Draw all objects
-    def draw(self, progress):
-        self.objectTree.draw(progress)
+    ## Draw all objects that intersect the given realspace Rect (see
+    # Camera.getViewRect()), or all objects if it is None.
+    def draw(self, progress, viewRect = None):
+        if viewRect is None:
+            objects = self.broadphase.getObjects()
+        else:
+            objects = self.broadphase.getObjectsIntersectingRect(viewRect)
+        for object in objects:
+            object.draw(progress)
 
 
-    ## Add the given object to the tree.
+    ## Add the given object to the broadphase.
     def addObject(self, obj):
-        self.objectTree.addObject(obj)
+        self.broadphase.addObject(obj)
 
 
-    ## Instantiate a new object of the given name and add it to the tree
+    ## Instantiate a new object of the given name and add it to the broadphase.
     def addNewObject(self, objectName, *args):
         if logger.getLogLevel() >= logger.LOG_INFORM:
-            numObjects = len(self.objectTree.getObjects()) + 1
+            numObjects = self.broadphase.getNumObjects() + 1
             logger.inform("Adding",numObjects,"th object named",objectName,"with args",*args)
         objectPath = os.path.join(constants.objectsPath, objectName)
         objectPath = objectPath.replace(os.sep, '.')
         objectFunc = game.dynamicClassManager.loadDynamicClass(objectPath)
         newObject = objectFunc(*args)
-        self.objectTree.addObject(newObject)
+        self.broadphase.addObject(newObject)
         return newObject
-
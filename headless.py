@@ -0,0 +1,140 @@
+import game
+import logger
+import mapgen.generator
+import mapgen.profiler
+
+import json
+import time
+import random
+import itertools
+import traceback
+import multiprocessing
+import numpy
+
+## @package headless This package contains the logic for generating maps
+# without a display. It is used by `jetblade.py --justmapgen`, which sets
+# constants.isHeadless before any other modules are loaded, so that no
+# window, OpenGL context, sound mixer, or fonts are ever initialized. Each map
+# is written to a map file named after its seed, as in normal play, along
+# with a JSON stats file (see generateMap()), and if requested a preview image 
+# of the map is saved alongside them. Once all maps are done, the per-stage
+# statistics of the batch are logged and written to a batch stats file (see
+# writeBatchStats()).
+#
+# Since nothing is drawn, headless runs don't need PyOpenGL to be installed.
+# Modules that draw but are still loaded when running headless (like
+# imagemanager and mapgen.generator) only import OpenGL if
+# constants.isHeadless is false, which is why it must be set first.
+#
+# When making more than one map, the maps are farmed out to a pool of worker
+# processes (game.numProcesses of them). Map i of the batch uses seed
+# game.seed + i, so any map in the batch can be regenerated on its own by
+# passing its seed to `jetblade.py -s`.
+
+## Extension for the stats files written by generateMap().
+statsExtension = '.stats'
+
+
+## Generate game.numMaps maps, and report how long each stage of map 
+# generation took.
+def generateMaps():
+    if game.numMaps == 1:
+        seeds = [game.seed]
+    else:
+        seeds = [game.seed + i for i in xrange(game.numMaps)]
+    numProcesses = min(game.numProcesses, len(seeds))
+
+    pool = None
+    if numProcesses > 1:
+        logger.inform("Making",len(seeds),"maps with",numProcesses,"processes")
+        pool = multiprocessing.Pool(numProcesses)
+        results = pool.imap_unordered(generateMap, seeds)
+    else:
+        results = itertools.imap(generateMap, seeds)
+
+    startTime = time.time()
+    allStats = []
+    for i, stats in enumerate(results):
+        if stats['error'] is None:
+            logger.inform("Finished map %d of %d (seed %s) in %.2fs" %
+                    (i + 1, len(seeds), stats['seed'], stats['totalTime']))
+        else:
+            logger.error("Failed map %d of %d (seed %s): %s" %
+                    (i + 1, len(seeds), stats['seed'], stats['error']))
+        allStats.append(stats)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    totalTime = time.time() - startTime
+    logger.inform("Made %d maps in %.2fs" % (len(seeds), totalTime))
+    writeBatchStats(allStats, totalTime)
+
+
+## Generate the map for the given seed. This is run in the worker processes
+# when making maps in parallel, so it must not depend on any state set up by
+# previously-generated maps. Writes the stats for the map to a file named
+# after the seed, and returns them as a dict with the following keys:
+# - seed: the seed used.
+# - error: None, or a description of the error if map generation failed.
+# - totalTime: seconds taken to make the map.
+# - stages: per-stage statistics, from StageProfiler.stages.
+# - numCols, numRows: the size of the map, in blocks.
+# - occupancy: fraction of the map that is open space.
+def generateMap(seed):
+    game.seed = seed
+    game.envEffectManager.reset()
+    game.sceneryManager.reset()
+    logger.inform("Using seed",seed)
+    random.seed(str(seed))
+    stats = {'seed' : seed, 'error' : None, 'stages' : []}
+    startTime = time.time()
+    try:
+        game.map = mapgen.generator.Map()
+        game.map.init()
+        if game.shouldSaveImage:
+            game.map.drawPreview(str(seed) + '.png', shouldDrawRegions = True)
+    except (Exception, SystemExit), e:
+        # Don't let one bad map take down the whole batch (or, for
+        # SystemExit from logger.fatal(), a worker process).
+        stats['error'] = traceback.format_exc()
+        stats['totalTime'] = time.time() - startTime
+        return stats
+    stats['totalTime'] = time.time() - startTime
+    stats['stages'] = game.map.profiler.stages
+    (stats['numCols'], stats['numRows']) = (game.map.numCols,
+                                            game.map.numRows)
+    numOpenSpaces = int(numpy.sum(
+            game.map.blocks == mapgen.generator.BLOCK_EMPTY))
+    stats['occupancy'] = numOpenSpaces / float(game.map.numCols *
+                                               game.map.numRows)
+    fh = open(str(seed) + statsExtension, 'w')
+    json.dump(stats, fh, indent = 2)
+    fh.close()
+    return stats
+
+
+## Log the per-stage statistics for the provided stats (as returned by 
+# generateMap()), and write them to a JSON file named after the range of seeds
+# used. The file holds the number of maps made and how many failed, the total 
+# time taken, the seeds of the maps, and the per-stage statistics from
+# profiler.aggregateReports().
+def writeBatchStats(allStats, totalTime):
+    seeds = sorted([stats['seed'] for stats in allStats])
+    goodStats = [stats for stats in allStats if stats['error'] is None]
+    summaries = mapgen.profiler.aggregateReports(goodStats)
+    mapgen.profiler.logAggregate(summaries)
+    if len(seeds) == 1:
+        # The map's own stats file says it all.
+        return
+    batchStats = {
+        'numMaps' : len(seeds),
+        'numFailed' : len(allStats) - len(goodStats),
+        'totalTime' : totalTime,
+        'seeds' : seeds,
+        'stages' : summaries,
+    }
+    filename = 'batch-%s-%s%s' % (seeds[0], seeds[-1], statsExtension)
+    fh = open(filename, 'w')
+    json.dump(batchStats, fh, indent = 2)
+    fh.close()
@@ -1,20 +1,37 @@
 import constants
 import util
 import logger
+import spritebatch
 from vector2d import Vector2D
 
 import os
 import pygame
-import OpenGL.GL as GL
-import OpenGL.GLU as GLU
+import numpy
+if not constants.isHeadless:
+    import OpenGL.GL as GL
+    import OpenGL.GLU as GLU
+
+## Largest width or height, in pixels, of the textures that 
+# ImageManager.loadAnimationSet() packs frames into. Frames that won't fit 
+# get textures of their own.
+maxAtlasSize = 2048
+## Pixels of padding around each frame in an atlas. The padding repeats the
+# frame's edge pixels, so that filtering and mipmapping don't pull in pixels
+# from neighboring frames.
+atlasPadding = 2
 
 ## This is a simple container class for holding metadata on image frames.
 class Frame:
-    def __init__(self, surface, textureId, name):
-        self.width = surface.get_width()
-        self.height = surface.get_height()
+    ## \param size (width, height) of the frame, in pixels.
+    # \param textureId OpenGL texture for the frame, or None if we are 
+    # running headless.
+    # \param texCoords (left, top, right, bottom) texture coordinates of the 
+    # frame within its texture, for frames packed into an atlas.
+    def __init__(self, size, textureId, name, texCoords = (0, 0, 1, 1)):
+        (self.width, self.height) = size
         self.textureId = textureId
         self.name = name
+        self.texCoords = texCoords
 
     def __str__(self):
         return "[Frame %s with dimensions %dx%d]" % (self.name, self.width, self.height)
@@ -32,30 +49,46 @@ class ImageManager:
         self.animations = dict()
         ## Maps surface names to Frame instances
         self.frames = dict()
+        ## Collects sprites drawn with drawGameObjectAt() until the next call
+        # to flushSprites().
+        self.spriteBatch = spritebatch.SpriteBatch()
 
 
     ## Load the named animation set, either from our cache or by loading each
-    # individual animation in the set.
+    # individual animation in the set. The frames of all of the animations
+    # are packed into as few textures as possible (see packAtlases()), so 
+    # that drawing different frames from the same set doesn't require 
+    # switching textures.
     def loadAnimationSet(self, name):
         if name in self.animationSets:
             return self.animationSets[name]
         result = dict()
+        surfaces = []
         for entry in os.listdir(os.path.join(constants.spritePath, name)):
-            if entry.find(constants.spriteFilename) == -1:
-                result[entry] = self.loadAnimation(os.path.join(name, entry))
+            if entry.find(constants.spriteFilename) != -1:
+                continue
+            if not os.path.isdir(os.path.join(constants.spritePath, name, entry)):
+                continue
+            result[entry] = self.loadAnimation(os.path.join(name, entry), 
+                                               surfaces)
+        self.packAtlases(surfaces)
         self.animationSets[name] = result
         return result
 
 
     ## Load all of the surfaces in a given named animation. 
-    def loadAnimation(self, name):
+    # \param pendingSurfaces If provided, then newly-loaded frames aren't
+    # given textures; instead, (frame, surface) pairs for them are appended
+    # to this list, for the caller to pass to packAtlases().
+    def loadAnimation(self, name, pendingSurfaces = None):
         if name in self.animations:
             return self.animations[name]
         result = []
         files = os.listdir(os.path.join(constants.spritePath, name))
         for file in files:
             filename, extension = file.split('.')
-            result.append(self.loadSurface(os.path.join(name, filename)))
+            result.append(self.loadSurface(os.path.join(name, filename), 
+                                           pendingSurfaces = pendingSurfaces))
         self.animations[name] = result
         return result
 
@@ -63,31 +96,121 @@ class ImageManager:
     ## Load a single surface, process it into a texture for OpenGL, and
     # store it in a Frame instance.
     # \todo This assumes all image names end in ".png". Pretty brittle.
-    def loadSurface(self, name, has_alpha = True):
+    # \param pendingSurfaces As for loadAnimation().
+    def loadSurface(self, name, has_alpha = True, pendingSurfaces = None):
         if name in self.frames:
             return self.frames[name]
         path = os.path.join(constants.spritePath, name + '.png')
         surface = pygame.image.load(path)
+        if constants.isHeadless:
+            # Only the frame's dimensions matter; we can't convert the surface
+            # to the display format or make a texture without a display.
+            self.frames[name] = Frame(surface.get_size(), None, name)
+            return self.frames[name]
         if has_alpha:
             surface = surface.convert_alpha()
 
+        if pendingSurfaces is not None and has_alpha:
+            self.frames[name] = Frame(surface.get_size(), None, name)
+            pendingSurfaces.append((self.frames[name], surface))
+            return self.frames[name]
         texture = self.createTextureFromSurface(surface, has_alpha)
-        self.frames[name] = Frame(surface, texture, name)
+        self.frames[name] = Frame(surface.get_size(), texture, name)
         return self.frames[name]
 
 
+    ## Pack the provided (frame, surface) pairs into atlas textures, and
+    # point each frame at its spot in its atlas. Frames are sorted by height
+    # and laid out in rows ("shelves"); when an atlas fills up, we start 
+    # another one.
+    def packAtlases(self, pendingSurfaces):
+        if not pendingSurfaces:
+            return
+        pendingSurfaces = sorted(pendingSurfaces, 
+                key = lambda (frame, surface): (-frame.height, frame.name))
+        # Make the atlases roughly square, but no wider than they need to be.
+        totalArea = 0
+        maxWidth = 0
+        for frame, surface in pendingSurfaces:
+            paddedWidth = frame.width + 2 * atlasPadding
+            paddedHeight = frame.height + 2 * atlasPadding
+            totalArea += paddedWidth * paddedHeight
+            maxWidth = max(maxWidth, paddedWidth)
+        atlasWidth = util.getNextPowerOfTwo(
+                max(maxWidth, int(totalArea ** .5)))
+        atlasWidth = min(atlasWidth, maxAtlasSize)
+
+        placements = []
+        (x, y, shelfHeight) = (0, 0, 0)
+        for frame, surface in pendingSurfaces:
+            paddedWidth = frame.width + 2 * atlasPadding
+            paddedHeight = frame.height + 2 * atlasPadding
+            if paddedWidth > atlasWidth or paddedHeight > maxAtlasSize:
+                # Too big to share a texture.
+                frame.textureId = self.createTextureFromSurface(surface)
+                continue
+            if x + paddedWidth > atlasWidth:
+                # Start a new shelf.
+                (x, y, shelfHeight) = (0, y + shelfHeight, 0)
+            if y + paddedHeight > maxAtlasSize:
+                # Start a new atlas.
+                self.createAtlas(atlasWidth, y, placements)
+                (x, y, shelfHeight, placements) = (0, 0, 0, [])
+            placements.append((frame, surface, x, y))
+            x += paddedWidth
+            shelfHeight = max(shelfHeight, paddedHeight)
+        if placements:
+            self.createAtlas(atlasWidth, y + shelfHeight, placements)
+
+
+    ## Make a single atlas texture holding the provided (frame, surface, x, y)
+    # placements, where (x, y) is the top-left corner of the frame's padded
+    # area in the atlas.
+    def createAtlas(self, width, usedHeight, placements):
+        height = util.getNextPowerOfTwo(usedHeight)
+        # Pixels indexed by [y, x], so that the array's bytes are in the row
+        # order that OpenGL expects.
+        pixels = numpy.zeros((height, width, 4), numpy.uint8)
+        for frame, surface, x, y in placements:
+            framePixels = numpy.empty((frame.height, frame.width, 4), 
+                                      numpy.uint8)
+            framePixels[:, :, :3] = pygame.surfarray.array3d(surface).swapaxes(0, 1)
+            framePixels[:, :, 3] = pygame.surfarray.array_alpha(surface).swapaxes(0, 1)
+            framePixels = numpy.pad(framePixels, 
+                    ((atlasPadding, atlasPadding), 
+                     (atlasPadding, atlasPadding), (0, 0)), mode = 'edge')
+            pixels[y : y + framePixels.shape[0], 
+                   x : x + framePixels.shape[1]] = framePixels
+        texture = self.createTexture(width, height, pixels.tostring())
+        for frame, surface, x, y in placements:
+            left = x + atlasPadding
+            top = y + atlasPadding
+            frame.textureId = texture
+            frame.texCoords = (left / float(width), top / float(height),
+                               (left + frame.width) / float(width),
+                               (top + frame.height) / float(height))
+        logger.debug("Packed",len(placements),"frames into a",width,"by",
+                     height,"atlas")
+
+
     def createTextureFromSurface(self, surface, has_alpha = True):
+        modeString = "RGB"
+        if has_alpha:
+            modeString = "RGBA"
+        return self.createTexture(surface.get_width(), surface.get_height(),
+                pygame.image.tostring(surface, modeString), has_alpha)
+
+
+    ## Make a mipmapped texture from the provided string of pixel data, with
+    # rows ordered from top to bottom.
+    def createTexture(self, width, height, data, has_alpha = True):
         texture = GL.glGenTextures(1)
         modeFlag = GL.GL_RGB
-        modeString = "RGB"
         if has_alpha:
             modeFlag = GL.GL_RGBA
-            modeString = "RGBA"
         GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
-        GLU.gluBuild2DMipmaps(GL.GL_TEXTURE_2D, modeFlag, 
-                surface.get_width(), surface.get_height(), 
-                modeFlag, GL.GL_UNSIGNED_BYTE, 
-                pygame.image.tostring(surface, modeString))
+        GLU.gluBuild2DMipmaps(GL.GL_TEXTURE_2D, modeFlag, width, height, 
+                modeFlag, GL.GL_UNSIGNED_BYTE, data)
         GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, 
                 GL.GL_NEAREST_MIPMAP_NEAREST)
         GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, 
@@ -100,39 +223,69 @@ class ImageManager:
         GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
 
 
-    ## Draw an object relative to the camera. 
-    # \todo This function is obsolete, just a passthrough now. Remove it.
+    ## Queue an object for drawing in the game world. Nothing is actually 
+    # drawn until the next call to flushSprites(), so callers that need 
+    # something drawn over the queued objects must flush first.
     def drawGameObjectAt(self, frame, loc):
-        self.drawObjectAt(frame, loc)
+        self.spriteBatch.addQuad(frame, loc)
+
+
+    ## Draw all objects queued by drawGameObjectAt().
+    def flushSprites(self):
+        self.spriteBatch.flush()
 
 
     ## Draw an object at a specific location on the screen (e.g. for HUD 
     # elements). Apply any scaling or alpha blending needing. 
     def drawObjectAt(self, frame, loc):
-        bottomRight = loc.add(Vector2D(frame.width, frame.height))
         GL.glBindTexture(GL.GL_TEXTURE_2D, frame.textureId)
         GL.glBegin(GL.GL_QUADS)
-        GL.glTexCoord2f(0, 0)
+        self.drawQuad(frame, loc)
+        GL.glEnd()
+
+
+    ## Emit the vertices for a single frame at the given location. Must be
+    # called between GL.glBegin(GL.GL_QUADS) and GL.glEnd(), with the 
+    # frame's texture bound.
+    def drawQuad(self, frame, loc):
+        (left, top, right, bottom) = frame.texCoords
+        bottomRight = loc.add(Vector2D(frame.width, frame.height))
+        GL.glTexCoord2f(left, top)
         GL.glVertex3f(loc.x, -loc.y, 0)
-        GL.glTexCoord2f(1, 0)
+        GL.glTexCoord2f(right, top)
         GL.glVertex3f(bottomRight.x, -loc.y, 0)
-        GL.glTexCoord2f(1, 1)
+        GL.glTexCoord2f(right, bottom)
         GL.glVertex3f(bottomRight.x, -bottomRight.y, 0)
-        GL.glTexCoord2f(0, 1)
+        GL.glTexCoord2f(left, bottom)
         GL.glVertex3f(loc.x, -bottomRight.y, 0)
-        GL.glEnd()
 
 
-    ## Create a display list of the provided set of loc-frame pairs.
+    ## Create a display list of the provided set of loc-frame pairs. 
+    # Consecutive frames that share a texture (e.g. frames from the same 
+    # atlas) are drawn with a single texture bind.
     def createDisplayList(self, objects):
         list = GL.glGenLists(1)
         GL.glNewList(list, GL.GL_COMPILE)
+        curTexture = None
         for frame, loc in objects:
-            self.drawObjectAt(frame, loc)
+            if frame.textureId != curTexture:
+                if curTexture is not None:
+                    GL.glEnd()
+                curTexture = frame.textureId
+                GL.glBindTexture(GL.GL_TEXTURE_2D, curTexture)
+                GL.glBegin(GL.GL_QUADS)
+            self.drawQuad(frame, loc)
+        if curTexture is not None:
+            GL.glEnd()
         GL.glEndList()
         return list
 
 
+    ## Free the provided list.
+    def deleteDisplayList(self, list):
+        GL.glDeleteLists(list, 1)
+
+
     ## Draw the provided list
     def drawList(self, list):
         GL.glCallList(list)
@@ -1,12 +1,13 @@
 #!/usr/local/bin/python2.5
 
-import splashscreen
+import constants
 
 import sys
 import time
 import pygame
 import cProfile
 import optparse
+import multiprocessing
 
 ## @package jetblade This package contains the logic for setting up and running
 # the program. It initializes PyGame, instantiates necessary global singletons,
@@ -14,12 +15,19 @@ import optparse
 # By default, when started, Jetblade will generate a map, save the map 
 # definition file to disk (using the map seed as the filename), and then 
 # switch to gameplay mode. Run `jetblade.py -h` or `jetblade.py --help` to
-# get a list of commandline options.
+# get a list of commandline options. With --justmapgen, Jetblade runs 
+# headless: no window is opened and no OpenGL, sound, or font setup is done, 
+# so maps can be generated on machines without a display.
 
 ## Wrapper around the introductory logic; this is where we set our cProfile 
 # hooks.
 def run():
     options = getOptions()
+    constants.isHeadless = options.shouldExitAfterMapgen
+
+    # Importing the splash screen initializes PyGame and opens the window, 
+    # unless we're running headless.
+    import splashscreen
 
     # Compile any Cython modules
     splashscreen.updateMessage("Compiling Cython modules")
@@ -34,6 +42,11 @@ def run():
     game.screen = splashscreen.getScreen()
     init(game, options)
 
+    if constants.isHeadless:
+        import headless
+        headless.generateMaps()
+        return
+
     # Start gameplay
     import mainloop
     mainloop.startGame()
@@ -56,18 +69,32 @@ def getOptions():
     parser.add_option('-i', '--saveimage', action = 'store_true',
                       default = False,
                       dest = 'shouldSaveImage',
-                      help = "save a PNG of the map after generating")
+                      help = "save a PNG of the map after generating " +
+                             "(a schematic preview with --justmapgen)")
     parser.add_option('-j', '--justmapgen', action = 'store_true', 
                       default = False,
                       dest = 'shouldExitAfterMapgen',
                       help = "exit after generating maps (do not play the game)")
     parser.add_option('-n', '--num', default = 1, dest = 'numMaps',
                       type = 'int',
-                      help = "Generate NUM maps", 
+                      help = "Generate NUM maps, using seeds SEED, SEED + 1, " +
+                             "etc.", 
                       metavar = 'NUM')
+    parser.add_option('-p', '--processes', dest = 'numProcesses',
+                      default = multiprocessing.cpu_count(),
+                      type = 'int',
+                      help = "Use up to PROCS worker processes to generate " +
+                             "maps with --justmapgen (default: one per CPU)",
+                      metavar = 'PROCS')
     parser.add_option('-r', '--record', default = False, action = 'store_true',
                       dest = 'isRecording',
                       help = "Record every frame of gameplay to a PNG file")
+    parser.add_option('-b', '--broadphase', default = None,
+                      dest = 'broadphase',
+                      help = "Use BROADPHASE (quadtree, spatialhash, or " +
+                             "sweepandprune) to find collisions between " +
+                             "dynamic objects",
+                      metavar = 'BROADPHASE')
     parser.add_option('-l', '--loglevel', default = None,
                       type = 'int',
                       dest = 'logLevel',
@@ -77,11 +104,18 @@ def getOptions():
     if options.numMaps > 1 and options.mapFilename is not None:
         print "Cannot use multiple-map generation with a sourced map file."
         sys.exit()
-    elif options.numMaps > 1 and options.seed is not None:
-        print "Cannot use multiple-map generation with a fixed random seed."
-        sys.exit()
     elif options.seed is None:
         options.seed = int(time.time())
+    elif options.numMaps > 1:
+        try:
+            options.seed = int(options.seed)
+        except ValueError:
+            print "Multiple-map generation requires an integer seed."
+            sys.exit()
+
+    if options.numProcesses < 1:
+        print "Must use at least one process."
+        sys.exit()
     
     if options.shouldExitAfterMapgen and options.mapFilename is not None:
         print "-justmapgen and -mapfile are incompatible"
@@ -94,14 +128,18 @@ def init(game, options):
     game.mapFilename = options.mapFilename
     game.shouldSaveImage = options.shouldSaveImage
     game.numMaps = options.numMaps
+    game.numProcesses = options.numProcesses
     game.shouldExitAfterMapgen = options.shouldExitAfterMapgen
     game.isRecording = options.isRecording
     if options.logLevel is not None:
         import logger
         logger.setLogLevel(options.logLevel)
+    if options.broadphase is not None:
+        game.gameObjectManager.setBroadphase(options.broadphase)
 
     game.shouldDisplayFPS = 1
-    pygame.display.set_caption('Jetblade')
+    if not constants.isHeadless:
+        pygame.display.set_caption('Jetblade')
 
 if __name__ == '__main__':
 #    run()
@@ -17,7 +17,6 @@ import random
 import pygame
 import OpenGL.GL as GL
 import cProfile
-import time
 import optparse
 from pygame.locals import *
 
@@ -71,24 +70,21 @@ def startGame():
         game.map = mapgen.generator.Map(game.mapFilename)
         game.map.init()
         if game.shouldSaveImage:
-            game.log.warn("Drawing the entire map was broken as part " + 
-                          "of the OpenGL transition. Sorry; I'll fix " + 
-                          "it when I can.")
-            game.map.drawAll('%d.png' % game.seed)
+            game.map.drawAll(str(game.seed) + '.png')
         if game.shouldExitAfterMapgen:
             sys.exit()
     else:
+        baseSeed = game.seed
         for i in xrange(0, game.numMaps):
             game.envEffectManager.reset()
             game.sceneryManager.reset()
             logger.inform("Making map %d of %d" % (i + 1, game.numMaps))
-            if game.numMaps == 1:
-                logger.inform("Using seed",game.seed)
-                random.seed(str(game.seed))
-            else:
-                game.seed = int(time.time())
-                logger.inform("Using seed",game.seed)
-                random.seed(str(game.seed))
+            if game.numMaps != 1:
+                # Give each map its own seed, so that every map in the batch
+                # can be reproduced on its own.
+                game.seed = baseSeed + i
+            logger.inform("Using seed",game.seed)
+            random.seed(str(game.seed))
             game.map = mapgen.generator.Map()
             game.map.init()
             if game.shouldSaveImage:
@@ -216,15 +212,19 @@ def draw():
 
     cameraLoc = game.camera.getDrawLoc()
     GL.glTranslatef(-cameraLoc.x + constants.sw / 2, cameraLoc.y + constants.sh / 2, 0)
-    game.map.drawBackground(game.camera.progress)
-    game.gameObjectManager.draw(game.camera.progress)
-    game.map.drawMidground(game.camera.progress)
+    # Everything in the world is culled against the same view.
+    viewRect = game.camera.getViewRect()
+    game.map.drawBackground(game.camera.progress, viewRect)
+    game.gameObjectManager.draw(game.camera.progress, viewRect)
+    game.imageManager.flushSprites()
+    game.map.drawMidground(game.camera.progress, viewRect)
     if game.shouldDisplayFPS:
         game.fontManager.drawText('MODENINE', 18, 
             ["FPS: " + str(game.curFPS),
              'Frame: ' + str(game.frameNum)], fpsDisplayLoc, 
             align = font.TEXT_ALIGN_RIGHT)
     game.mapEditor.draw(game.camera.progress)
+    game.imageManager.flushSprites()
     game.console.draw()
     GL.glPopMatrix()
     pygame.display.flip()
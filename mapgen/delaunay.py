@@ -85,8 +85,11 @@ class Triangulator:
         self.minDistanceEdgeToNode = minDistanceEdgeToNode
         ## Number of times we've drawn, for saving output
         self.drawCount = 0
-        ## A font for output; strictly for debugging purposes.
-        self.font = pygame.font.Font(os.path.join(constants.fontPath, 'MODENINE.TTF'), 14)
+        ## A font for output; strictly for debugging purposes. Fonts aren't
+        # initialized when running headless, so there's no font then.
+        self.font = None
+        if not constants.isHeadless:
+            self.font = pygame.font.Font(os.path.join(constants.fontPath, 'MODENINE.TTF'), 14)
 
 
     ## Generate a triangulation of our nodes
@@ -645,7 +648,7 @@ class Triangulator:
             drawX = int(node.ix * 800 / self.max.x)
             drawY = int(node.iy * 800 / self.max.y)
             pygame.draw.circle(outputImage, color, (drawX, drawY), 2)
-            if shouldLabelNodes:
+            if shouldLabelNodes and self.font is not None:
                 label = self.font.render("%d,%d" % (node.ix, node.iy), True, (255, 255, 255))
                 rect = label.get_rect()
                 rect.left = drawX + 5
@@ -1,7 +1,6 @@
 import game
 import constants
 import generator
-import seed
 import util
 import logger
 from vector2d import Vector2D
@@ -11,6 +10,7 @@ import math
 import random
 import pygame
 import os
+import numpy
 
 
 ## How often to try placing platforms.
@@ -74,10 +74,6 @@ class MapEdge:
         ## End of the edge.
         self.end = end
 
-        ## Individual open (non-wall) spaces in the map that belong to this 
-        # edge.
-        self.spaces = set()
-
         ## Information about the terrain we are in.
         # Map our location to the region map to get our terrain info.
         self.terrain = game.map.getTerrainInfoAtGridLoc(
@@ -127,16 +123,12 @@ class MapEdge:
     ## Calculate the bounds of the open space occupied by our sector. This is
     # useful for some tunnel features to constrain the area they try to mutate.
     def getSectorBounds(self):
-        minX = constants.BIGNUM
-        minY = constants.BIGNUM
-        maxX = -constants.BIGNUM
-        maxY = -constants.BIGNUM
-        for loc in self.spaces:
-            minX = min(minX, loc.x)
-            minY = min(minY, loc.y)
-            maxX = max(maxX, loc.x)
-            maxY = max(maxY, loc.y)
-        return (minX, minY, maxX, maxY)
+        (xVals, yVals) = numpy.nonzero(self.getSpaceMask())
+        if not len(xVals):
+            return (constants.BIGNUM, constants.BIGNUM, 
+                    -constants.BIGNUM, -constants.BIGNUM)
+        return (int(xVals.min()), int(yVals.min()), 
+                int(xVals.max()), int(yVals.max()))
 
 
     ## Get the points closest to our start and end that are still in our
@@ -213,16 +205,16 @@ class MapEdge:
             for y in xrange(max(center.iy - radius, 1),
                             min(center.iy + radius, game.map.numRows - 1)):
                 point = Vector2D(x, y)
-                if point in game.map.deadSeeds:
-                    if self.start.isEdgeRelated(game.map.deadSeeds[point].owner):
-                        claimedPoints.add(point)
+                owner = game.map.getSectorAtGridLoc(point)
+                if owner is not None and self.start.isEdgeRelated(owner):
+                    claimedPoints.add(point)
 
         # Convert each claimed point into open space. Then check its neighbors,
         # and fill them with walls if they aren't related to us.
         for point in claimedPoints:
             game.map.assignSpace(point, self)
-            if game.map.blocks[point.ix][point.iy] != generator.BLOCK_EMPTY:
-                game.map.blocks[point.ix][point.iy] = generator.BLOCK_EMPTY
+            if game.map.blocks[point.ix, point.iy] != generator.BLOCK_EMPTY:
+                game.map.blocks[point.ix, point.iy] = generator.BLOCK_EMPTY
                 # Patch walls around the deleted space
                 for nearPoint in point.perimeter():
                     if not game.map.getIsInBounds(nearPoint):
@@ -230,15 +222,13 @@ class MapEdge:
                     # If we hit a space that's not a wall or open space, or
                     # if we hit a space that's owned by a node of the graph
                     # that we aren't connected to, put a wall in.
-                    altEdge = None
-                    if nearPoint in game.map.deadSeeds:
-                        altEdge = game.map.deadSeeds[nearPoint].owner
-                    if (game.map.blocks[nearPoint.ix][nearPoint.iy] == generator.BLOCK_UNALLOCATED or
+                    altEdge = game.map.getSectorAtGridLoc(nearPoint)
+                    if (game.map.blocks[nearPoint.ix, nearPoint.iy] == generator.BLOCK_UNALLOCATED or
                             (altEdge is not None and
                              not self.start.isEdgeRelated(altEdge))
                        ):
-                        game.map.blocks[nearPoint.ix][nearPoint.iy] = generator.BLOCK_WALL
-                        game.map.deadSeeds[nearPoint] = seed.Seed(self, 0, constants.BIGNUM)
+                        game.map.blocks[nearPoint.ix, nearPoint.iy] = generator.BLOCK_WALL
+                        game.map.assignSpace(nearPoint, self)
 
 
     ## Walk the walls of our space, trying to add Furniture instances where
@@ -401,7 +391,7 @@ class MapEdge:
                 # wrong in map generation.
                 marks = [self.start.average(self.end).toGridspace()]
                 game.map.markLoc = currentSpace
-                game.map.drawStatus(deadSeeds = game.map.deadSeeds, marks = marks)
+                game.map.drawStatus(sectorGrid = game.map.sectorGrid, marks = marks)
                 logger.fatal("Hit maximum steps for node",self.id)
             # Get the space adjacent to our own that continues the walk, 
             # by using the Marching Squares algorithm
@@ -420,20 +410,24 @@ class MapEdge:
             currentSpace = currentSpace.add(marchingSquares[marchIndex])
 
 
-    ## Mark the given gridspace location as being part of our sector.
-    def assignSpace(self, loc):
-        self.spaces.add(loc)
+    ## Return a boolean grid that is true for the spaces in the map that 
+    # belong to this edge. Ownership is stored in game.map.sectorGrid; use 
+    # Map.assignSpace() to change it.
+    def getSpaceMask(self):
+        return game.map.getSectorMask(self)
 
 
-    ## Remove a space from our sector.
-    def unassignSpace(self, loc):
-        self.spaces.discard(loc)
+    ## Return a list of the spaces in the map that belong to this edge, in
+    # Map.getIterBlocks() order.
+    def getSpaces(self):
+        (xVals, yVals) = numpy.nonzero(self.getSpaceMask())
+        return [Vector2D(x, y) for x, y in zip(xVals.tolist(), yVals.tolist())]
 
 
     ## Return true if the passed-in location is one of the open spaces owned
     # by this node.
     def getIsOurSpace(self, loc):
-        return loc.toInt() in self.spaces
+        return game.map.getSectorAtGridLoc(loc) is self
 
 
     ## Return our terrain info.
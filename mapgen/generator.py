@@ -13,17 +13,25 @@ import quadtree
 import seed
 import floatingplatform
 import terraininfo
+import raster
+import wavefront
+import mapfile
+import overview
+import preview
+import profiler
+import pngwriter
 import collisiondata
 from vector2d import Vector2D
 
 import sys
 import math
-import copy
+import collections
 import random
+import numpy
 import pygame
-
-import OpenGL.GL as GL
-import OpenGL.GL.framebufferobjects as FBO
+if not constants.isHeadless:
+    import OpenGL.GL as GL
+    import OpenGL.GL.framebufferobjects as FBO
 
 ## Minimum width of the game world
 minUniverseWidth = constants.blockSize * 500
@@ -37,6 +45,11 @@ universeDimensionVariance = constants.blockSize * 00
 ## Amount to thicken walls by in Map.expandWalls
 wallThickness = 2
 
+## If true, Map.expandSeeds() uses the raster-based engine in the wavefront
+# module instead of the original dict-of-Seeds implementation. Both produce 
+# the same results; the latter is retained for reference.
+shouldUseWavefrontSeedExpansion = True
+
 ## Minimum size of a tree sector. Sectors smaller than this are absorbed into
 # neighboring sectors.
 minimumSectorSize = 20
@@ -52,11 +65,22 @@ regionOverlayNumSeedingRetries = 10
 
 ## Amount to scale the map by when calling Map.drawStatus()
 drawStatusScaleFactor = .1
-## Amount to scale the map by when calling Map.DrawAll()
-# Note that PyGame can't create surfaces bigger than about 16k pixels to a side,
-# and that OpenGL can't make textures bigger than 4096 pixels on a side (on
-# my dev computer anyway).
+## Default amount to scale the map by when calling Map.drawAll(). Any scale
+# works, since the image is drawn in tiles and streamed to disk.
 drawAllScaleFactor = .15
+## Width and height, in pixels, of the tiles that Map.drawAll() renders the
+# map in. This must be no bigger than the biggest texture OpenGL can make 
+# (4096 pixels on a side on my dev computer), and sets how much memory the
+# export takes: one row of tiles across the whole image.
+drawAllTileSize = 1024
+## Default number of pixels per block in the images made by 
+# Map.drawPreview()
+previewPixelsPerBlock = 2
+
+## Width and height, in blocks, of the chunks that the map's terrain tiles are
+# split into for drawing. Each chunk gets its own display list; see 
+# Map.drawBlockChunks().
+blockChunkSize = 16
 
 # Platform placement parameters
 ## Distance from the wall/ceiling to build platforms.
@@ -139,6 +163,26 @@ adjacencyKernelToBlockTypeMap = {
 ## Block type enums: empty space, unallocated space, and wall.
 (BLOCK_EMPTY, BLOCK_UNALLOCATED, BLOCK_WALL) = range(3)
 
+## Sector ID for spaces that no sector owns. This is the same as the ID that
+# wavefront.expandSeeds() uses for spaces without dead seeds.
+NO_SECTOR = wavefront.NO_OWNER
+
+## Create a compact grid of BLOCK_* values, indexed by [x, y], for use during
+# map construction.
+def makeBlockGrid(numCols, numRows, value = BLOCK_EMPTY):
+    grid = numpy.empty((numCols, numRows), numpy.uint8)
+    grid.fill(value)
+    return grid
+
+
+## Create a grid of arbitrary Python objects (e.g. Block instances), indexed
+# by [x, y], with every cell set to the provided value.
+def makeObjectGrid(numCols, numRows, value = None):
+    grid = numpy.empty((numCols, numRows), object)
+    grid.fill(value)
+    return grid
+
+
 ## Maximum attempts to disentangle an object from a wall before we give up 
 # and start zipping it.
 maxCollisionRetries = 15
@@ -162,15 +206,18 @@ class Map:
         self.statusIter = 0
         self.mapName = mapName
          
-        ## 2D array of blocks (or None to indicate empty space)
-        # During map construction, we use BLOCK_* values instead
+        ## 2D array of blocks (or BLOCK_EMPTY to indicate empty space), 
+        # indexed by [x, y]. During map construction, this is instead a 
+        # compact uint8 array of BLOCK_* values; instantiateBlocks() converts
+        # it into Block instances at the end of mapgen.
         self.blocks = None
        
         ## Holds Furniture instances
         self.furnitureQuadTree = None
        
         ## Marks spaces as belonging to different environments. Built to same
-        # scale as blocks.
+        # scale as blocks. Each cell is either None or a list of EnvEffect 
+        # instances.
         self.envGrid = None
 
         ## Holds background scenery.
@@ -182,19 +229,51 @@ class Map:
         ## Holds configuration information for the different zones
         self.zoneData = None
 
-        ## This will be a dict that maps locations to zones.
-        self.regions = None
+        ## int32 grid of indices into self.regionTerrains, giving the region
+        # each space in the low-rez region overlay belongs to; see 
+        # makeRegions().
+        self.regionGrid = None
+
+        ## TerrainInfo instances for the regions in self.regionGrid.
+        self.regionTerrains = []
 
         ## Maps locations to objects (either TreeNode instances or regions)
         self.seeds = dict()
 
-        ## Seeds that are no longer expanding. We use these to mark ownership
-        # of areas.
-        self.deadSeeds = dict()
+        ## int32 grid, indexed by [x, y], of the IDs of the sectors (MapEdge
+        # instances) that own each space, or NO_SECTOR for unowned spaces. 
+        # This is built from the seeds that are left once expandSeeds() is 
+        # done.
+        self.sectorGrid = None
+
+        ## Maps sector IDs in sectorGrid to the MapEdges they stand for.
+        self.sectors = []
+
+        ## Maps MapEdges to their sector IDs.
+        self.sectorIds = dict()
+
+        ## Maps (column, row) chunk coordinates (see blockChunkSize) to 
+        # display lists of the blocks in that chunk, or None for chunks with 
+        # no blocks in them. Chunks are compiled when first drawn.
+        self.blockChunks = dict()
+
+        ## Set of chunk coordinates whose display lists are out of date.
+        self.dirtyBlockChunks = set()
+
+        ## MapOverview used for drawing when zoomed far out, or None if we
+        # have no display.
+        self.overview = None
+
+        ## Quadtree of platforms made while creating the map; see createMap().
+        self.platformsQuadTree = None
 
         ## If this is not None, then drawStatus() will focus on this area.
         self.markLoc = None
 
+        ## Records time, memory, and size statistics for each stage of 
+        # createMap().
+        self.profiler = profiler.StageProfiler(self.getStageCounts)
+
         ## Maps block adjacency signatures (see adjacencyKernelToBlockTypeMap)
         # to block orientations.
         self.adjacenciesMap = dict()
@@ -203,8 +282,25 @@ class Map:
             keys = util.adjacencyArrayToSignatures(kernel)
             for key in keys:
                 self.adjacenciesMap[key] = type
+
+        ## Lookup table mapping every possible adjacency signature (0 through
+        # 511) to a block orientation, so that we can look up the orientation
+        # for a raster.adjacencySignatures() grid without checking the dict.
+        self.signatureToBlockType = []
+        for signature in xrange(512):
+            self.signatureToBlockType.append(
+                    self.adjacenciesMap.get(signature, 'center'))
         
 
+    ## Allocate the block grid, filled with the provided BLOCK_* value, and an
+    # empty environmental effect grid. 
+    # \param gridFunc Function used to create the block grid; use 
+    # makeObjectGrid when the grid will hold Block instances directly.
+    def initGrids(self, value, gridFunc = makeBlockGrid):
+        self.blocks = gridFunc(self.numCols, self.numRows, value)
+        self.envGrid = makeObjectGrid(self.numCols, self.numRows, None)
+
+
     ## Either create or load a map.
     def init(self):
         if self.mapName is not None:
@@ -215,17 +311,12 @@ class Map:
                 self.loadMap()
         else:
             self.createMap()
-        # \todo This is slow for big maps. Either chunk it up into multiple
-        # smaller display lists and only draw relevant ones, or only draw
-        # tiles if they're in view (which is slow when we zoom out, but would
-        # allow for tiles to cycle display frames more readily).
-        frameLocs = []
-        for i, j in self.getIterBlocks():
-            if self.blocks[i][j]:
-                frameLocs.append((self.blocks[i][j].getFrame(), 
-                                  self.blocks[i][j].loc)) 
-
-        self.blockDisplayList = game.imageManager.createDisplayList(frameLocs)
+        if constants.isHeadless:
+            # Nothing to draw with.
+            return
+        # Tiles are drawn in chunks, which are compiled on demand.
+        self.resetBlockChunks()
+        self.overview = overview.MapOverview(self)
 
 
     ## Create a map, by the following steps:
@@ -245,7 +336,9 @@ class Map:
     #   the space is in and the space's neighbors, then instantiate the Block 
     #   objects.
     # - Find the starting point for the player.
-    def createMap(self):
+    # - Save the map, to savePath plus the .map extension if it's provided, or
+    #   else to a file in the current directory named after the seed.
+    def createMap(self, savePath = None):
         self.width = int(minUniverseWidth + random.uniform(0, universeDimensionVariance))
         self.height = int(minUniverseHeight + random.uniform(0, universeDimensionVariance))
         self.furnitureQuadTree = quadtree.QuadTree(self.getBounds())
@@ -265,103 +358,129 @@ class Map:
 
         # First we need to figure out which parts of the map belong to which
         # regions. Make a low-rez overlay for the map that marks out regions.
-        logger.inform("Marking regions at",pygame.time.get_ticks())
-        self.regions = self.makeRegions()
+        self.startStage("Marking regions")
+        (self.regionGrid, self.regionTerrains) = self.makeRegions()
 #        self.drawRegions()
 
         # Create the array for the actual blocks.
-        logger.inform("Laying out grid at",pygame.time.get_ticks())
-        self.blocks = []
-        self.envGrid = []
-        for i in xrange(0, self.numCols):
-            self.blocks.append([])
-            self.envGrid.append([])
-            for j in xrange(0, self.numRows):
-                self.blocks[i].append(BLOCK_UNALLOCATED)
-                self.envGrid[i].append([])
+        self.startStage("Laying out grid")
+        self.initGrids(BLOCK_UNALLOCATED)
 
         # Generate the tree that will be used to mark out tunnels.
-        logger.inform("Generating graph of map at",pygame.time.get_ticks())
+        self.startStage("Generating graph of map")
         self.tunnelEdges = graph.makeGraph()
          
         # Lay the seeds for those tunnels.
-        logger.inform("Planting seeds at",pygame.time.get_ticks())
+        self.startStage("Planting seeds")
         [edge.carveTunnel() for edge in self.tunnelEdges]
 
         # Expand the seeds and carve out those tunnels. 
-        logger.inform("Expanding seeds at",pygame.time.get_ticks())
-        (self.blocks, self.deadSeeds) = self.expandSeeds(self.seeds, self.blocks)
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+        self.startStage("Expanding seeds")
+        (self.blocks, self.sectorGrid, self.sectors) = self.expandSeeds(self.seeds, self.blocks)
+        self.sectorIds = dict((sector, id) for id, sector in enumerate(self.sectors))
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Clean up the points where tunnels meet.
-        logger.inform("Creating junctions at",pygame.time.get_ticks())
+        self.startStage("Creating junctions")
         [edge.createJunction() for edge in self.tunnelEdges]
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Remove isolated chunks of land.
-        logger.inform("Removing islands at",pygame.time.get_ticks())
+        self.startStage("Removing islands")
         self.removeIslands()
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Make the walls a bit thicker.
-        logger.inform("Expanding walls at",pygame.time.get_ticks())
+        self.startStage("Expanding walls")
         self.expandWalls()
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Tell the tree nodes which spaces belong to them.
-        logger.inform("Assigning squares at",pygame.time.get_ticks())
+        self.startStage("Assigning squares")
         self.assignSquares()
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Fill in tunnels with interesting terrain.
-        logger.inform("Creating tunnel features at",pygame.time.get_ticks())
+        self.startStage("Creating tunnel features")
         [edge.createFeatures() for edge in self.tunnelEdges]
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Reassign any seeds that got isolated in the last step to prevent
         # loops in the next step.
-        logger.inform("Fixing seed ownership at",pygame.time.get_ticks())
-        (self.blocks, self.deadSeeds) = self.fixSeedOwnership(self.blocks, self.deadSeeds)
-#        self.drawStatus(deadSeeds = self.deadSeeds)
+        self.startStage("Fixing seed ownership")
+        (self.blocks, self.sectorGrid) = self.fixSeedOwnership(self.blocks, self.sectorGrid)
+#        self.drawStatus(sectorGrid = self.sectorGrid)
 
         # Walk the walls and put down furniture objects
-        logger.inform("Placing furniture at",pygame.time.get_ticks())
+        self.startStage("Placing furniture")
         [edge.placeFurniture() for edge in self.tunnelEdges]
 
         # Place platforms down to make inaccessible areas accessible.
-        logger.inform("Fixing accessibility at",pygame.time.get_ticks())
+        self.startStage("Fixing accessibility")
         [edge.fixAccessibility() for edge in self.tunnelEdges]
 
         # Mark those platforms on the map.
-        logger.inform("Building platforms at",pygame.time.get_ticks())
+        self.startStage("Building platforms")
         self.buildPlatforms()
 
         # Turn those block types into instances of the Block class.
-        logger.inform("Instantiating blocks at",pygame.time.get_ticks())
+        self.startStage("Instantiating blocks")
         self.instantiateBlocks()
 
-        logger.inform("Drawing status at",pygame.time.get_ticks())
+        self.startStage("Drawing status")
         self.markLoc = None
 #        self.drawStatus(self.blocks, None, None, shouldDrawRegions = True)
 
         # \todo Pick a better starting point for the player.
         self.startLoc = self.tunnelEdges[0].start.toGridspace()
-        while self.blocks[self.startLoc.ix][self.startLoc.iy] != BLOCK_EMPTY:
+        while self.blocks[self.startLoc.ix, self.startLoc.iy] != BLOCK_EMPTY:
             self.startLoc = self.startLoc.addY(-1)
 
-        logger.inform("Saving map file at",pygame.time.get_ticks())
-        self.writeMap(str(game.seed))
+        self.startStage("Saving map file")
+        if savePath is None:
+            savePath = str(game.seed)
+        self.writeMap(savePath)
 
+        self.finishStage()
         logger.inform("Done making map at",pygame.time.get_ticks())
-        numUsedSpaces = 0
-        for i, j in self.getIterBlocks():
-            if not self.blocks[i][j]:
-                numUsedSpaces += 1
+        numUsedSpaces = int(numpy.sum(self.blocks == BLOCK_EMPTY))
         totalSpaces = self.numCols * self.numRows
         percent = numUsedSpaces / float(totalSpaces) * 100
         logger.inform(numUsedSpaces,"of",totalSpaces,"spaces are occupied for a %.2f%% occupancy rate" % percent)
 
 
+    ## Log the start of a new stage of map generation, and finish profiling 
+    # the previous stage, if any.
+    def startStage(self, name):
+        logger.inform(name,"at",pygame.time.get_ticks())
+        self.profiler.startStage(name)
+
+
+    ## Finish profiling the current stage of map generation, if any.
+    def finishStage(self):
+        self.profiler.finishStage()
+
+
+    ## Return a dict describing the size of the map, for the profiler.
+    def getStageCounts(self):
+        counts = {
+            'seeds' : len(self.seeds),
+            'edges' : len(self.tunnelEdges),
+            'sectors' : len(self.sectors),
+        }
+        if self.blocks is not None and self.blocks.dtype != object:
+            # Once blocks are instantiated, counting them takes too long to
+            # be worth it.
+            counts['cells'] = self.blocks.size
+            counts['emptyCells'] = int(numpy.sum(self.blocks == BLOCK_EMPTY))
+            counts['wallCells'] = int(numpy.sum(self.blocks == BLOCK_WALL))
+        if self.furnitureQuadTree is not None:
+            counts['furniture'] = len(self.furnitureQuadTree.getObjects())
+        if self.backgroundQuadTree is not None:
+            counts['scenery'] = len(self.backgroundQuadTree.getObjects())
+        return counts
+
+
     ## Create a low-rez overlay of the map that determines where different
     # regions are. Each region is a subset of some overarching zone (for
     # example, a "furnace" region in the "magma caverns" zone). Regions
@@ -369,6 +488,9 @@ class Map:
     # of different map features and the selection of terrain tiles.
     # We use the same spacefilling automaton we use to carve tunnels, to
     # make the region map.
+    # Returns a tuple of an int32 grid, indexed by [x, y], with one cell per
+    # space in the overlay, and the list of TerrainInfo instances that the 
+    # values in the grid index into.
     def makeRegions(self):
         # First step: place zones down and map each space in our low-rez map
         # to a zone. Each zone has certain preferences for size and elevation.
@@ -378,32 +500,11 @@ class Map:
         rows = int(self.numRows * regionOverlayResolutionMultiplier) + 1
         
         # Make three things: a fake set of "blocks" for expandSeeds to play in,
-        # a mapping of zones to lists of "blocks" in the zones, and a reverse
-        # mapping of "blocks" to the zones that own them.
-        blocks = []
-        zoneToBlocksMap = dict()
-        blockToZoneMap = dict()
-        for i in xrange(0, cols):
-            blocks.append([])
-            for j in xrange(0, rows):
-                blocks[i].append(BLOCK_UNALLOCATED)
-                # Map (i, j) to the ranges ([0, 1], [0, 1]) and find the zone
-                # point that is closest to that location. Mark (i, j) as 
-                # belonging to that zone.
-                loc = Vector2D(i / float(cols), j / float(rows))
-                closestZone = None
-                closestDist = constants.BIGNUM
-                for zoneName, zoneLoc in zonePoints.iteritems():
-                    dist = loc.distance(zoneLoc)
-                    if dist < closestDist:
-                        closestZone = zoneName
-                        closestDist = dist
-                
-                if closestZone not in zoneToBlocksMap:
-                    zoneToBlocksMap[closestZone] = []
-                space = Vector2D(i, j)
-                zoneToBlocksMap[closestZone].append(space)
-                blockToZoneMap[space] = closestZone
+        # a grid mapping each of those "blocks" to the zone that owns it, and
+        # lists of the "blocks" in each zone (as flat indices into the grid).
+        blocks = makeBlockGrid(cols, rows, BLOCK_UNALLOCATED)
+        (zoneNames, zoneGrid, zoneToBlocksMap) = zone.assignZones(zonePoints,
+                                                                 cols, rows)
 
         # Create a set of seeds for the different zones. Place them randomly
         # within each zone, and give them life proportionate to their desired
@@ -419,40 +520,40 @@ class Map:
             for regionName, weight in zoneInfo['regionWeights'].iteritems():
                 terrain = terraininfo.TerrainInfo(zoneName, regionName)
                 terrainInfoCache[(zoneName, regionName)] = terrain
-                loc = random.choice(zoneLocs)
+                index = random.choice(zoneLocs)
+                loc = Vector2D(index // rows, index % rows)
                 numTries = 0
                 while loc in seeds and numTries < regionOverlayNumSeedingRetries:
                     numTries += 1
-                    loc = random.choice(zoneLocs)
+                    index = random.choice(zoneLocs)
+                    loc = Vector2D(index // rows, index % rows)
                 life = int(zoneSize * math.sqrt(weight / float(totalWeight)))
                 seeds[loc] = seed.Seed(terrain, life, 0)
 
         # And expand those seeds into regions
-        (blocks, seeds) = self.expandSeeds(seeds, blocks)
+        (blocks, ownerGrid, owners) = self.expandSeeds(seeds, blocks)
+        ownerIds = dict((owner, id) for id, owner in enumerate(owners))
         
         # There's no guarantee that we reached every space, so 
         # convert the ones that weren't touched into a default for that region,
         # while we turn everything into "open space" for fixSeedOwnership, which
         # will eliminate islands (very small regions) for us.
-        for i in xrange(0, cols):
-            for j in xrange(0, rows):
-                space = Vector2D(i, j)
-                if space not in seeds:
-                    zoneName = blockToZoneMap[space]
-                    regionName = self.zoneData[zoneName]['biggestRegion']
-                    if (zoneName, regionName) not in terrainInfoCache:
-                        terrainInfoCache[zoneName][regionName] = terraininfo.TerrainInfo(zoneName, regionName)
-                    seeds[space] = seed.Seed(terrainInfoCache[(zoneName, regionName)], 
-                                             0, constants.BIGNUM)
-                blocks[i][j] = BLOCK_EMPTY
-
-        (blocks, seeds) = self.fixSeedOwnership(blocks, seeds, False)
-
-        result = dict()
-        for loc, resultSeed in seeds.iteritems():
-            result[loc] = resultSeed.owner
+        (unownedCols, unownedRows) = numpy.nonzero(ownerGrid == NO_SECTOR)
+        for i, j in zip(unownedCols.tolist(), unownedRows.tolist()):
+            zoneName = zoneNames[zoneGrid[i, j]]
+            regionName = self.zoneData[zoneName]['biggestRegion']
+            if (zoneName, regionName) not in terrainInfoCache:
+                terrainInfoCache[(zoneName, regionName)] = terraininfo.TerrainInfo(zoneName, regionName)
+            owner = terrainInfoCache[(zoneName, regionName)]
+            if owner not in ownerIds:
+                ownerIds[owner] = len(owners)
+                owners.append(owner)
+            ownerGrid[i, j] = ownerIds[owner]
+        blocks.fill(BLOCK_EMPTY)
 
-        return result
+        (blocks, ownerGrid) = self.fixSeedOwnership(blocks, ownerGrid)
+
+        return (ownerGrid, owners)
 
 
     ## Widen every wall by adding walls on either side.
@@ -460,45 +561,52 @@ class Map:
         # If we only go in one direction, we get walls from one sector
         # adjacent to open spaces owned by a different sector, which creates
         # terrain mismatches.
+        # Only walls at least amount spaces from the edge of the map are 
+        # thickened, so that the expanded wall stays within the map.
         amount = wallThickness / 2
-        newBlocks = copy.deepcopy(self.blocks)
-        for i in xrange(amount, self.numCols - amount):
-            for j in xrange(amount, self.numRows - amount):
-                if self.blocks[i][j] == BLOCK_WALL:
-                    for ii in xrange(-amount, amount + 1):
-                        for jj in xrange(-amount, amount + 1):
-                            newBlocks[i-ii][j-jj] = BLOCK_WALL
-        self.blocks = newBlocks
-
-
-    ## Replace the values in self.blocks with block type info. At this point
-    # self.blocks consists of the following:
-    # - 0: empty space
-    # - 1: filled space surrounded by other filled space
-    # - 2: filled space next to empty space
-    # - Tuple of block typestring (e.g. 'upleft') and adjacency signature
+        walls = numpy.zeros(self.blocks.shape, bool)
+        interior = (slice(amount, self.numCols - amount), 
+                    slice(amount, self.numRows - amount))
+        walls[interior] = self.blocks[interior] == BLOCK_WALL
+        self.blocks[raster.dilate(walls, amount)] = BLOCK_WALL
+
+
+    ## Replace the BLOCK_* grid in self.blocks with a grid of Block instances.
+    # At this point self.blocks consists of the following:
+    # - BLOCK_EMPTY: empty space
+    # - BLOCK_UNALLOCATED: filled space surrounded by other filled space
+    # - BLOCK_WALL: filled space next to empty space
+    # Empty spaces remain BLOCK_EMPTY in the new grid.
     def instantiateBlocks(self):
-        for i, j in self.getIterBlocks():
+        blocks = makeObjectGrid(self.numCols, self.numRows, BLOCK_EMPTY)
+        signatures = raster.adjacencySignatures(self.blocks != BLOCK_EMPTY)
+        # numpy.nonzero returns locations in the same order as 
+        # getIterBlocks(), which keeps the random number stream (and thus the
+        # map for a given seed) the same.
+        (cols, rows) = numpy.nonzero(self.blocks != BLOCK_EMPTY)
+        for i, j in zip(cols.tolist(), rows.tolist()):
             gridLoc = Vector2D(i, j)
             terrain = self.getTerrainInfoAtGridLoc(gridLoc)
             sector = self.getSectorAtGridLoc(gridLoc)
             if sector is not None:
                 terrain = sector.getTerrainInfo()
-            if self.blocks[i][j] == BLOCK_UNALLOCATED:
-                self.blocks[i][j] = block.Block(gridLoc, terrain, 'center')
-            elif self.blocks[i][j] == BLOCK_WALL:
-                (type, signature) = self.getBlockType(i, j)
-                self.blocks[i][j] = block.Block(gridLoc, terrain, type)
+            if self.blocks[i, j] == BLOCK_UNALLOCATED:
+                blocks[i, j] = block.Block(gridLoc, terrain, 'center')
+            else:
+                signature = int(signatures[i, j])
+                type = self.signatureToBlockType[signature]
+                blocks[i, j] = block.Block(gridLoc, terrain, type)
                 # Choose a scenery item to attach to the block.
                 newItem = game.sceneryManager.selectScenery(gridLoc, terrain, signature)
                 if newItem is not None:
                     self.addBackgroundObject(newItem)
-            # else self.blocks[i][j] == BLOCK_EMPTY, do nothing
+        self.blocks = blocks
 
 
     ## Return the type of block that should be drawn at the given grid loc.
     # Determine this by the locations of neighbors of the block -- its 
-    # "adjacency signature". 
+    # "adjacency signature". When handling many blocks at once, use 
+    # raster.adjacencySignatures() and self.signatureToBlockType instead.
     def getBlockType(self, x, y):
         # Get the set of adjacencies for this block. 
         # 0 = empty.
@@ -513,10 +621,7 @@ class Map:
         # We should always get 1 result back because all values in the 
         # adjacencies array are 0 or 1 (see that function for more information).
         signature = util.adjacencyArrayToSignatures(adjacencies)[0]
-
-        if signature in self.adjacenciesMap:
-            return (self.adjacenciesMap[signature], signature)
-        return ('center', signature)
+        return (self.signatureToBlockType[signature], signature)
 
 
     ## Do a connectivity check on the map. Remove all areas whose size is 
@@ -525,34 +630,13 @@ class Map:
     # space) instead of seeds and 
     # removes islands entirely instead of merging them with neighbors.
     def removeIslands(self):
-        chunks = []
-        seenSpaces = set()
-        
-        for i, j in self.getIterBlocks():
-            startLoc = Vector2D(i, j)
-            if (self.blocks[i][j] == BLOCK_WALL and 
-                    startLoc not in seenSpaces):
-                # Start a new chunk of contiguous land. Floodfill out from
-                # this point, grabbing all adjacent occupied spaces and
-                # adding them to the chunk.
-                newChunk = []
-                fillStack = [startLoc]
-                seenSpaces.add(startLoc)
-                while fillStack:
-                    loc = fillStack.pop(0)
-                    newChunk.append(loc)
-                    for neighbor in loc.NEWSPerimeter():
-                        if (self.getIsInBounds(neighbor) and 
-                                self.blocks[neighbor.ix][neighbor.iy] != BLOCK_EMPTY and
-                                neighbor not in seenSpaces):
-                            fillStack.append(neighbor)
-                            seenSpaces.add(neighbor)
-                chunks.append(newChunk)
-
-        for chunk in chunks:
-            if len(chunk) < minimumIslandSize:
-                for loc in chunk:
-                    self.blocks[loc.ix][loc.iy] = BLOCK_EMPTY
+        isFilled = self.blocks != BLOCK_EMPTY
+        (labels, sizes) = raster.labelComponents(isFilled)
+        # Only chunks that contain walls count as islands.
+        hasWalls = numpy.bincount(labels[self.blocks == BLOCK_WALL], 
+                                  minlength = len(sizes)) > 0
+        isIsland = hasWalls & (sizes < minimumIslandSize)
+        self.blocks[isFilled & isIsland[labels]] = BLOCK_EMPTY
 
 
     ## Plant a seed for hollowing out part of the map at the desired
@@ -573,10 +657,14 @@ class Map:
     # When two expanding seeds collide, they merge if they are for the same
     # sector (as determined by their 'owner' property), or form a wall between
     # them if they are not. 
+    # Returns a tuple of the modified grid, an int32 grid of owner IDs for the
+    # dead seeds (NO_SECTOR for spaces without one), and a list mapping owner
+    # IDs to owners.
     def expandSeeds(self, seeds, blocks):
+        if shouldUseWavefrontSeedExpansion:
+            return wavefront.expandSeeds(seeds, blocks)
         deadSeeds = dict()
-        numCols = len(blocks)
-        numRows = len(blocks[0])
+        (numCols, numRows) = blocks.shape
         logger.debug("Expanding seeds for a",numCols,"by",numRows,"grid")
         while len(seeds):
             # Uncomment this if you want to see images be drawn at each step,
@@ -590,12 +678,12 @@ class Map:
                 # If the counter expires while the seed is not in open space,
                 # replace it with a wall.
                 if (not self.getIsInBounds(loc, numCols, numRows) or 
-                        (curSeed.life <= 0 and blocks[loc.ix][loc.iy] != BLOCK_EMPTY)):
+                        (curSeed.life <= 0 and blocks[loc.ix, loc.iy] != BLOCK_EMPTY)):
                     deadSeeds[loc] = curSeed
-                    blocks[loc.ix][loc.iy] = BLOCK_WALL
+                    blocks[loc.ix, loc.iy] = BLOCK_WALL
                     continue
 
-                if (blocks[loc.ix][loc.iy] == BLOCK_WALL):
+                if (blocks[loc.ix, loc.iy] == BLOCK_WALL):
                     # A wall sprung up under us. Check if there's a dead
                     # seed there; if so, try to merge with it.
                     if loc in deadSeeds:
@@ -603,12 +691,12 @@ class Map:
                         if newSeed is not None:
                             newSeeds[loc] = newSeed
                             del deadSeeds[loc]
-                            blocks[loc.ix][loc.iy] = BLOCK_UNALLOCATED
+                            blocks[loc.ix, loc.iy] = BLOCK_UNALLOCATED
                     else:
                         # No seeds on walls.
                         continue
                     
-                if blocks[loc.ix][loc.iy] == BLOCK_EMPTY:
+                if blocks[loc.ix, loc.iy] == BLOCK_EMPTY:
                     # No seeds on empty space
                     deadSeeds[loc] = curSeed
                     continue
@@ -637,12 +725,12 @@ class Map:
                             altSeed.age = constants.BIGNUM
                             curSeed.life = 0
                             curSeed.age = constants.BIGNUM
-                            blocks[loc.ix][loc.iy] = BLOCK_WALL
-                            blocks[adjLoc.ix][adjLoc.iy] = BLOCK_WALL
-                    elif blocks[loc.ix][loc.iy] == BLOCK_UNALLOCATED:
+                            blocks[loc.ix, loc.iy] = BLOCK_WALL
+                            blocks[adjLoc.ix, adjLoc.iy] = BLOCK_WALL
+                    elif blocks[loc.ix, loc.iy] == BLOCK_UNALLOCATED:
                         # No seed there; plant one.
                         newSeeds[adjLoc] = seed.Seed(curSeed.owner, curSeed.life - 1, curSeed.age + 1)
-                    elif (blocks[adjLoc.ix][adjLoc.iy] != BLOCK_EMPTY and
+                    elif (blocks[adjLoc.ix, adjLoc.iy] != BLOCK_EMPTY and
                             deadSeeds.has_key(adjLoc)):
                         # Hit a wall containing a dead seed; try to merge
                         # with it.
@@ -650,15 +738,25 @@ class Map:
                         if newSeed is not None:
                             newSeeds[adjLoc] = newSeed
                             del deadSeeds[adjLoc]
-                            blocks[adjLoc.ix][adjLoc.iy] = BLOCK_UNALLOCATED
+                            blocks[adjLoc.ix, adjLoc.iy] = BLOCK_UNALLOCATED
    
                 # Done expanding; zero our location if we didn't wall it 
                 # earlier.
-                if blocks[loc.ix][loc.iy] != BLOCK_WALL:
-                    blocks[loc.ix][loc.iy] = BLOCK_EMPTY
+                if blocks[loc.ix, loc.iy] != BLOCK_WALL:
+                    blocks[loc.ix, loc.iy] = BLOCK_EMPTY
                 deadSeeds[loc] = curSeed
             seeds = newSeeds
-        return (blocks, deadSeeds)
+
+        ownerGrid = numpy.empty((numCols, numRows), numpy.int32)
+        ownerGrid.fill(NO_SECTOR)
+        owners = []
+        ownerIds = dict()
+        for loc, deadSeed in deadSeeds.iteritems():
+            if deadSeed.owner not in ownerIds:
+                ownerIds[deadSeed.owner] = len(owners)
+                owners.append(deadSeed.owner)
+            ownerGrid[loc.ix, loc.iy] = ownerIds[deadSeed.owner]
+        return (blocks, ownerGrid, owners)
 
 
     ## Try to merge the given seed with the dead seed at loc. We can merge
@@ -684,28 +782,30 @@ class Map:
 
     ## Ensure that all open spaces are owned, and that no walls are owned.
     def assignSquares(self):
-        for (i, j) in self.getIterBlocks():
-            loc = Vector2D(i, j)
-            if loc in self.deadSeeds:
-                if self.blocks[loc.ix][loc.iy] == BLOCK_EMPTY:
-                    self.deadSeeds[loc].owner.assignSpace(loc)
-                else:
-                    self.deadSeeds[loc].owner.unassignSpace(loc)
-                    self.deadSeeds.pop(loc)
-            elif self.blocks[i][j] == BLOCK_EMPTY:
-                # Unowned open space. Either find a neighbor to assign it to,
-                # or if there are no valid neighbors, turn it into a wall.
-                didAssign = False
-                for neighbor in loc.NEWSPerimeter():
-                    if neighbor in self.deadSeeds:
-                        base = self.deadSeeds[neighbor]
-                        self.deadSeeds[loc] = seed.Seed(base.owner, base.life, 
-                                constants.BIGNUM)
-                        base.owner.assignSpace(loc)
-                        didAssign = True
-                        break
-                if not didAssign:
-                    self.blocks[i][j] = BLOCK_WALL
+        isOwned = self.sectorGrid != NO_SECTOR
+        isEmpty = self.blocks == BLOCK_EMPTY
+        # Unowned open space. Either find a neighbor to assign it to, or if 
+        # there are no valid neighbors, turn it into a wall. Spaces are 
+        # handled in getIterBlocks() order; by the time we reach a space, 
+        # owned walls before it (the neighbors above and to the left) have 
+        # already been unassigned, but those after it have not.
+        (orphanCols, orphanRows) = numpy.nonzero(~isOwned & isEmpty)
+        for i, j in zip(orphanCols.tolist(), orphanRows.tolist()):
+            didAssign = False
+            for (di, dj) in ((0, -1), (1, 0), (-1, 0), (0, 1)):
+                (x, y) = (i + di, j + dj)
+                if not (0 <= x < self.numCols and 0 <= y < self.numRows):
+                    continue
+                sectorId = self.sectorGrid[x, y]
+                if (di, dj) in ((0, -1), (-1, 0)) and self.blocks[x, y] != BLOCK_EMPTY:
+                    sectorId = NO_SECTOR
+                if sectorId != NO_SECTOR:
+                    self.sectorGrid[i, j] = sectorId
+                    didAssign = True
+                    break
+            if not didAssign:
+                self.blocks[i, j] = BLOCK_WALL
+        self.sectorGrid[isOwned & ~isEmpty] = NO_SECTOR
 
 
     ## Finds islands of dead seeds and reassigns their ownership.
@@ -714,75 +814,134 @@ class Map:
     # different sector). This breaks our wallwalking algorithm in 
     # treenode.fixAccessibility(), so find these islands and fix them.
     # "Islands" are regions of seeds that are below a minimum cutoff size.
-    def fixSeedOwnership(self, blocks, seeds, shouldReassignSpaces = True):
-        chunks = []
-        spaceToChunkMap = dict()
-
-        numCols = len(blocks)
-        numRows = len(blocks[0])
-
-        # \todo This level of indentation is faintly ridiculous; we can 
-        # probably clean this up by splitting the island-finding logic
-        # into its own thing.
-        for i, j in self.getIterBlocks():
-            key = Vector2D(i, j)
-            if key not in spaceToChunkMap and key in seeds:
-                type = seeds[key].owner # Local sector type.
-                newChunk = []
-                fillStack = [key]
-                spaceToChunkMap[key] = newChunk
-                while fillStack:
-                    loc = fillStack.pop(0)
-                    newChunk.append(loc)
-                    for neighbor in loc.NEWSPerimeter():
-                        if (not self.getIsInBounds(neighbor, numCols, numRows) or
-                                blocks[neighbor.ix][neighbor.iy] != BLOCK_EMPTY):
-                            continue
-                        if (neighbor not in spaceToChunkMap and 
-                                neighbor in seeds and 
-                                seeds[neighbor].owner == type):
-                            fillStack.append(neighbor)
-                            spaceToChunkMap[neighbor] = newChunk
-                chunks.append(newChunk)
-
-        chunkStack = []
-        chunkStack.extend(chunks)
+    # \param blocks Grid of BLOCK_* values.
+    # \param ownerGrid Grid of owner IDs for the dead seeds (NO_SECTOR for 
+    # spaces without one), as returned by expandSeeds(). Modified in place.
+    def fixSeedOwnership(self, blocks, ownerGrid):
+        (numCols, numRows) = blocks.shape
+
+        isSeeded = ownerGrid != NO_SECTOR
+        isOpen = isSeeded & (blocks == BLOCK_EMPTY)
+        (labelGrid, sizes) = raster.labelComponents(isOpen, ownerGrid)
+        labels = labelGrid.ravel().tolist()
+        ownerIds = ownerGrid.ravel().tolist()
+
+        # Divide the seeded spaces into chunks. Each open area with a 
+        # single owner forms its own chunk, unless a seed on a filled space 
+        # that comes before it in getIterBlocks() order is adjacent to it and
+        # has the same owner, in which case that seed's chunk absorbs it. 
+        # We only need the exact order of the spaces in chunks that are too
+        # small, since those are the only ones we search for neighbors.
+        labelToChunk = [None] * len(sizes)
+        chunkCells = []
+        chunkSizes = []
+        openCells = numpy.flatnonzero(labelGrid.ravel() != -1)
+        (ignored, firstIndices) = numpy.unique(labelGrid.ravel()[openCells], 
+                                               return_index = True)
+        componentStarts = openCells[firstIndices].tolist()
+        filledStarts = numpy.flatnonzero(isSeeded & ~isOpen).tolist()
+        for p in sorted(componentStarts + filledStarts):
+            if labels[p] != -1:
+                if labelToChunk[labels[p]] is not None:
+                    continue
+                chunkLabels = [labels[p]]
+            else:
+                chunkLabels = []
+                for q in self.getNEWSNeighborIndices(p, numCols, numRows):
+                    if (labels[q] != -1 and labelToChunk[labels[q]] is None and
+                            ownerIds[q] == ownerIds[p] and
+                            labels[q] not in chunkLabels):
+                        chunkLabels.append(labels[q])
+            chunk = len(chunkCells)
+            size = int(sum(sizes[label] for label in chunkLabels))
+            if labels[p] == -1:
+                size += 1
+            for label in chunkLabels:
+                labelToChunk[label] = chunk
+            if size < minimumSectorSize:
+                cells = self.getFloodFillOrder(p, chunkLabels, labels, 
+                                               numCols, numRows)
+            else:
+                cells = [p]
+            chunkCells.append(cells)
+            chunkSizes.append(size)
+
+        # Map each seeded space to the index of its chunk.
+        chunkOf = numpy.empty(len(labels), numpy.int32)
+        chunkOf.fill(-1)
+        if len(labelToChunk):
+            labelToChunk = numpy.array(labelToChunk, numpy.int32)
+            chunkOf[openCells] = labelToChunk[labelGrid.ravel()[openCells]]
+        chunkOf = chunkOf.tolist()
+        for chunk, cells in enumerate(chunkCells):
+            if labels[cells[0]] == -1:
+                chunkOf[cells[0]] = chunk
+
+        # Merge chunks that are too small into their neighbors.
+        chunkStack = collections.deque(xrange(len(chunkCells)))
         while chunkStack:
-            chunk = chunkStack.pop(0)
-            if len(chunk) < minimumSectorSize:
+            chunk = chunkStack.popleft()
+            if chunkSizes[chunk] < minimumSectorSize:
                 # Find an adjacent chunk to merge with
                 altChunk = None
-                for loc in chunk:
-                    for neighbor in loc.NEWSPerimeter():
-                        if not self.getIsInBounds(neighbor, numCols, numRows):
-                            continue
-                        if (neighbor in spaceToChunkMap and 
-                                spaceToChunkMap[neighbor] != chunk):
+                for p in chunkCells[chunk]:
+                    for q in self.getNEWSNeighborIndices(p, numCols, numRows):
+                        if chunkOf[q] != -1 and chunkOf[q] != chunk:
                             # Found a different chunk to try merging with.
-                            altChunk = spaceToChunkMap[neighbor]
+                            altChunk = chunkOf[q]
                             break
                     if altChunk is not None:
                         break
                 if altChunk is not None:
-                    newType = seeds[altChunk[0]].owner
-                    for loc in chunk:
-                        seed = seeds[loc]
-                        if shouldReassignSpaces:
-                            seed.owner.unassignSpace(loc)
-                            newType.assignSpace(loc)
-                        seeds[loc].owner = newType
-                        spaceToChunkMap[loc] = altChunk
-                    altChunk.extend(chunk)
+                    newType = ownerIds[chunkCells[altChunk][0]]
+                    for p in chunkCells[chunk]:
+                        ownerIds[p] = newType
+                        chunkOf[p] = altChunk
+                    chunkCells[altChunk].extend(chunkCells[chunk])
+                    chunkSizes[altChunk] += chunkSizes[chunk]
                     chunkStack.append(altChunk)
                 else:
                     # Couldn't find a valid neighbor for this seed; it must be
                     # isolated by walls. Turn it into one.
-                    for loc in chunk:
-                        blocks[loc.ix][loc.iy] = BLOCK_WALL
-                        self.deadSeeds[loc].owner.unassignSpace(loc)
-                        del self.deadSeeds[loc]
-                        
-        return (blocks, seeds)
+                    for p in chunkCells[chunk]:
+                        ownerIds[p] = NO_SECTOR
+                    blocks.flat[chunkCells[chunk]] = BLOCK_WALL
+
+        ownerGrid.flat[:] = ownerIds
+        return (blocks, ownerGrid)
+
+
+    ## Return the flat (x * numRows + y) indices of the in-bounds neighbors
+    # of the given flat index, in Vector2D.NEWSPerimeter() order.
+    def getNEWSNeighborIndices(self, p, numCols, numRows):
+        (x, y) = (p // numRows, p % numRows)
+        result = []
+        if y > 0:
+            result.append(p - 1)
+        if x < numCols - 1:
+            result.append(p + numRows)
+        if x > 0:
+            result.append(p - numRows)
+        if y < numRows - 1:
+            result.append(p + 1)
+        return result
+
+
+    ## Return the flat indices of the spaces reached by a breadth-first 
+    # floodfill from the given flat index into the components with the 
+    # provided labels, in the order they are reached.
+    def getFloodFillOrder(self, start, chunkLabels, labels, numCols, numRows):
+        result = [start]
+        seenCells = set(result)
+        index = 0
+        while index < len(result):
+            for q in self.getNEWSNeighborIndices(result[index], 
+                                                 numCols, numRows):
+                if q not in seenCells and labels[q] in chunkLabels:
+                    seenCells.add(q)
+                    result.append(q)
+            index += 1
+        return result
 
 
     ## Find the nearest wall to the given starting block along the 
@@ -799,10 +958,10 @@ class Map:
         # about the sector, move currentSpace out along direction and
         # recalculate distance.
         while (self.getIsInBounds(currentSpace) and
-                (self.blocks[intCurrent.ix][intCurrent.iy] == BLOCK_EMPTY or
+                (self.blocks[intCurrent.ix, intCurrent.iy] == BLOCK_EMPTY or
                      distance < 2) and
-                (edge is None or intCurrent in self.deadSeeds and
-                    self.deadSeeds[intCurrent].owner == edge)):
+                (edge is None or 
+                    self.getSectorAtGridLoc(intCurrent) == edge)):
             currentSpace = currentSpace.add(direction)
             intCurrent = currentSpace.toInt()
             distance = currentSpace.distance(start)
@@ -838,22 +997,22 @@ class Map:
             last = int(loc.x + width / 2.0)
             for x in xrange(first, last):
                 if (x < 0 or x >= self.numCols or 
-                        self.blocks[x][loc.iy] == BLOCK_UNALLOCATED):
+                        self.blocks[x, loc.iy] == BLOCK_UNALLOCATED):
                     continue
-                self.blocks[x][loc.iy] = BLOCK_WALL
+                self.blocks[x, loc.iy] = BLOCK_WALL
 
 
     ## Draw an intermediary status image and saves it to disk. These are often 
     # very helpful for debugging purposes.
     # \param blocks The current blocks for the grid. Uses self.blocks if None.
     # \param seeds Active seeds used during map.expandSeeds().
-    # \param deadSeeds Inactive seeds, used to mark sectors on the map.
+    # \param sectorGrid Grid of sector IDs, used to mark sectors on the map.
     # \param marks List of other locations that should be specially marked.
     # \param shouldZoom If true and self.markLoc is set, zoom in on that
     # location.
     # In addition to the above, if map.markLoc is defined, then the map will
     # be focused on that location.
-    def drawStatus(self, blocks = None, seeds = None, deadSeeds = None, 
+    def drawStatus(self, blocks = None, seeds = None, sectorGrid = None, 
                    marks = None, shouldZoom = True, shouldDrawRegions = False):
         if blocks is None:
             blocks = self.blocks
@@ -868,22 +1027,22 @@ class Map:
             self.drawRegions(screen)
 
         if blocks is not None:
-            numCols = len(blocks)
-            numRows = len(blocks[0])
+            (numCols, numRows) = blocks.shape
             for i in xrange(numCols):
                 for j in xrange(numRows):
                     rect = pygame.rect.Rect((i * size, j * size), (size, size))
-                    if blocks[i][j] in (BLOCK_UNALLOCATED, None):
+                    if blocks[i, j] in (BLOCK_UNALLOCATED, None):
                         pygame.draw.rect(screen, (0, 0, 0), rect)
-                    elif blocks[i][j] != BLOCK_EMPTY:
+                    elif blocks[i, j] != BLOCK_EMPTY:
                         pygame.draw.rect(screen, (255, 255, 255), rect)
 
         seedRadius = int(constants.blockSize / 2.0 * scale)
-        if (deadSeeds is not None and len(deadSeeds) and 
-                hasattr(deadSeeds[deadSeeds.keys()[0]].owner, 'color')):
-            for loc, seed in deadSeeds.iteritems():
-                drawLoc = loc.multiply(size).addScalar(seedRadius)
-                pygame.draw.circle(screen, seed.owner.color, 
+        if sectorGrid is not None:
+            (ownedCols, ownedRows) = numpy.nonzero(sectorGrid != NO_SECTOR)
+            for i, j in zip(ownedCols.tolist(), ownedRows.tolist()):
+                owner = self.sectors[sectorGrid[i, j]]
+                drawLoc = Vector2D(i, j).multiply(size).addScalar(seedRadius)
+                pygame.draw.circle(screen, owner.color, 
                         (drawLoc.ix, drawLoc.iy), seedRadius)
 
         if seeds is not None:
@@ -930,9 +1089,10 @@ class Map:
         size = constants.blockSize * scale
 
         regionBlock = size / regionOverlayResolutionMultiplier
-        for loc, terrain in self.regions.iteritems():
-            overlayRect = pygame.rect.Rect((loc.x * regionBlock,
-                                            loc.y * regionBlock),
+        for i, j in self.getIterBlocks(*self.regionGrid.shape):
+            terrain = self.regionTerrains[self.regionGrid[i, j]]
+            overlayRect = pygame.rect.Rect((i * regionBlock,
+                                            j * regionBlock),
                                            (regionBlock, regionBlock))
             color = self.zoneData[terrain.zone]['regions'][terrain.region]['color']
             color = (color[0], color[1], color[2], 255)
@@ -942,127 +1102,258 @@ class Map:
             pygame.image.save(screen, 'premap-%03d' % self.statusIter + '.png')
 
 
+    ## Draw a schematic view of the map, with walls in their regions' colors
+    # and water and platforms marked, and save it to disk under the provided
+    # filename as a PNG. Unlike drawAll(), this doesn't need OpenGL, so it 
+    # can be used when running headless. See the preview module.
+    # \param scale Pixels in the image per block.
+    # \param shouldDrawRegions If true, tint open space by region.
+    # \param shouldDrawSectors If true, tint open space by owning sector.
+    def drawPreview(self, filename, scale = previewPixelsPerBlock, 
+                    shouldDrawRegions = False, shouldDrawSectors = False):
+        pixels = preview.renderPreview(self, scale, shouldDrawRegions, 
+                                       shouldDrawSectors)
+        (width, height) = pixels.shape[:2]
+        rows = numpy.empty((height, width, 4), numpy.uint8)
+        rows[:, :, :3] = pixels.swapaxes(0, 1)
+        rows[:, :, 3] = 255
+        writer = pngwriter.PNGWriter(filename, width, height)
+        writer.writeRows(rows)
+        writer.close()
+
+
     ## Draw a complete view of the map for purposes of looking pretty. Saves 
-    # the result to disk under the provided filename.
-    def drawAll(self, filename):
-        width = 2
-        height = 2
-        # Calculate height of the output image, as a power of 2
-        while width < self.width * drawAllScaleFactor:
-            width *= 2
-        while height < self.height * drawAllScaleFactor:
-            height *= 2
+    # the result to disk under the provided filename, as a PNG. The map is
+    # rendered one drawAllTileSize-square tile at a time into an offscreen 
+    # framebuffer, and each row of tiles is written out as soon as it is 
+    # done, so that the image can be any size.
+    # \param scale Number of pixels in the image per pixel of realspace.
+    def drawAll(self, filename, scale = drawAllScaleFactor):
+        width = int(math.ceil(self.width * scale))
+        height = int(math.ceil(self.height * scale))
+        logger.inform("Drawing the map to",filename,"at",width,"by",height)
 
         texture = GL.glGenTextures(1)
         GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, 
-                GL.GL_LINEAR_MIPMAP_LINEAR)
+                GL.GL_NEAREST)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, 
                 GL.GL_NEAREST)
-        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, width, 
-                height, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, drawAllTileSize, 
+                drawAllTileSize, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
 
         framebuffer = FBO.glGenFramebuffers(1)
         FBO.glBindFramebuffer(FBO.GL_FRAMEBUFFER, framebuffer)
         FBO.glFramebufferTexture2D(FBO.GL_FRAMEBUFFER,
                 FBO.GL_COLOR_ATTACHMENT0, GL.GL_TEXTURE_2D, texture, 0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
 
-        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
-        GL.glLoadIdentity()
-        GL.glPushMatrix()
-        GL.glLoadIdentity()
-        GL.glViewport(0, 0, width, height)
+        writer = pngwriter.PNGWriter(filename, width, height)
+        for top in xrange(0, height, drawAllTileSize):
+            rowHeight = min(drawAllTileSize, height - top)
+            rows = numpy.empty((rowHeight, width, 4), numpy.uint8)
+            for left in xrange(0, width, drawAllTileSize):
+                tileWidth = min(drawAllTileSize, width - left)
+                self.drawRegion(left / scale, top / scale, scale, 
+                                drawAllTileSize)
+                # The top of the tile is at the top of the framebuffer.
+                pixels = GL.glReadPixels(0, drawAllTileSize - rowHeight, 
+                        tileWidth, rowHeight, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
+                pixels = numpy.frombuffer(pixels, numpy.uint8).reshape(
+                        rowHeight, tileWidth, 4)
+                # OpenGL's rows go from the bottom up.
+                rows[:, left : left + tileWidth] = pixels[::-1]
+            writer.writeRows(rows)
+        writer.close()
+
+        FBO.glBindFramebuffer(FBO.GL_FRAMEBUFFER, 0)
+        FBO.glDeleteFramebuffers([framebuffer])
+        GL.glDeleteTextures([texture])
+
+
+    ## Draw the map, in full detail and scaled by the given factor, into a 
+    # size-pixel square in the bottom-left corner of the current framebuffer.
+    # The top-left corner of the square shows the given realspace location.
+    # The framebuffer is cleared first, and all GL state we change is 
+    # restored afterwards.
+    def drawRegion(self, left, top, scale, size):
+        span = size / float(scale)
+        GL.glPushAttrib(GL.GL_VIEWPORT_BIT | GL.GL_COLOR_BUFFER_BIT | 
+                GL.GL_ENABLE_BIT)
+        GL.glViewport(0, 0, size, size)
+        GL.glClearColor(0, 0, 0, 0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        GL.glEnable(GL.GL_TEXTURE_2D)
         GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glPushMatrix()
         GL.glLoadIdentity()
-        GL.glOrtho(0, width, 0, height, 1, -1)
+        GL.glOrtho(0, size, 0, size, 1, -1)
         GL.glMatrixMode(GL.GL_MODELVIEW)
+        GL.glPushMatrix()
         GL.glLoadIdentity()
-        GL.glTranslatef(0, height, 0)
-        GL.glScalef(width / float(self.width), height / float(self.height), 1)
-        
-        GL.glEnable(GL.GL_TEXTURE_2D)
-        
-        self.backgroundQuadTree.draw(0, shouldPrune = False)
-        self.furnitureQuadTree.draw(0, shouldPrune = False)
+        GL.glScalef(scale, scale, 1)
+        # Objects are drawn with their Y coordinates negated, so this puts
+        # the top of the region at the top of the framebuffer.
+        GL.glTranslatef(-left, top + span, 0)
 
-        for i, j in self.getIterBlocks():
-            for effect in self.envGrid[i][j]:
-                effect.draw(Vector2D(i, j).toRealspace(), 0)
+        rect = pygame.rect.Rect(int(math.floor(left)), int(math.floor(top)),
+                                int(math.ceil(span)) + 1, 
+                                int(math.ceil(span)) + 1)
+        self.drawScenery(0, rect)
+        self.drawTerrain(0, rect)
 
-        game.imageManager.drawList(self.blockDisplayList)
-
-        FBO.glBindFramebuffer(FBO.GL_DRAW_FRAMEBUFFER, 0)
-
-        # Now draw our texture of the map to the screen.
-        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
-        GL.glLoadIdentity()
-        GL.glPushMatrix()
-        GL.glLoadIdentity()
-        GL.glViewport(0, 0, constants.sw, constants.sh)
+        GL.glPopMatrix()
         GL.glMatrixMode(GL.GL_PROJECTION)
-        GL.glLoadIdentity()
-        GL.glOrtho(0, constants.sw, 0, constants.sh, 1, -1)
-        GL.glMatrixMode(GL.GL_MODELVIEW)
-        GL.glLoadIdentity()
-
-        loc = Vector2D(0, 0)
-        bottomRight = Vector2D(constants.sw, constants.sh)
-        GL.glEnable(GL.GL_TEXTURE_2D)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
-        GL.glBegin(GL.GL_QUADS)
-        GL.glTexCoord2f(0, 0)
-        GL.glVertex3f(0, 0, 0)
-        GL.glTexCoord2f(1, 0)
-        GL.glVertex3f(constants.sw, 0, 0)
-        GL.glTexCoord2f(1, 1)
-        GL.glVertex3f(constants.sw, constants.sh, 0)
-        GL.glTexCoord2f(0, 1)
-        GL.glVertex3f(0, constants.sh, 0)
-        GL.glEnd()
-   
         GL.glPopMatrix()
-        
-        image = GL.glGetTexImage(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
-        surface = pygame.image.fromstring(image, (width, height), 
-                "RGBA", True)
-        pygame.image.save(surface, filename)
-
-
-    ## Draw the background scenery and any environmental effects at the given
-    # location.
-    def drawBackground(self, progress):
-        self.backgroundQuadTree.draw(progress)
-        # \todo This culls which environmental effects to draw based on the 
-        # camera position, but doesn't take into account zoom, so when we 
-        # zoom out, effects will not be drawn when they should be. 
-        rect = pygame.rect.Rect(0, 0, constants.sw, constants.sh)
-        rect.center = game.camera.getDrawLoc().tuple()
-        min = Vector2D(rect.topleft).toGridspace().sub(Vector2D(1, 1))
-        max = Vector2D(rect.bottomright).toGridspace().add(Vector2D(2, 2))
-        for x in xrange(min.ix, max.ix):
-            if x < 0 or x >= self.numCols:
-                continue
-            for y in xrange(min.iy, max.iy):
-                if y < 0 or y >= self.numRows:
-                    continue
-                for effect in self.envGrid[x][y]:
-                    effect.draw(Vector2D(x, y).toRealspace(), progress)
-
-
-    ## Draw the furniture and terrain tiles.
-    def drawMidground(self, progress):
-        self.furnitureQuadTree.draw(progress)
-        game.imageManager.drawList(self.blockDisplayList)
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+        GL.glPopAttrib()
+
+
+    ## Draw the background scenery and any environmental effects that 
+    # intersect the given realspace Rect (see Camera.getViewRect()), or 
+    # everything if it is None. When zoomed far enough out, we draw the 
+    # overview instead, which covers the midground as well.
+    def drawBackground(self, progress, viewRect = None):
+        level = self.getOverviewLevel(viewRect)
+        if level is not None:
+            self.overview.draw(level, viewRect)
+            return
+        self.drawScenery(progress, viewRect)
+
+
+    ## Draw the furniture and terrain tiles that intersect the given realspace
+    # Rect, or everything if it is None.
+    def drawMidground(self, progress, viewRect = None):
+        if self.getOverviewLevel(viewRect) is not None:
+            # drawBackground() already drew the overview.
+            return
+        self.drawTerrain(progress, viewRect)
+
+
+    ## Return the level of the overview to draw the given view with (see 
+    # MapOverview.getLevel()), or None to draw the map in full detail.
+    def getOverviewLevel(self, viewRect):
+        if viewRect is None or self.overview is None:
+            return None
+        return self.overview.getLevel(game.zoom)
+
+
+    ## Draw the background scenery and environmental effects in full detail;
+    # see drawBackground().
+    def drawScenery(self, progress, viewRect = None):
+        self.backgroundQuadTree.draw(progress, viewRect)
+        game.imageManager.flushSprites()
+        (minX, minY, maxX, maxY) = (0, 0, self.numCols, self.numRows)
+        if viewRect is not None:
+            # Effects may extend past their spaces, so pad the view a bit.
+            topLeft = Vector2D(viewRect.topleft).toGridspace().sub(Vector2D(1, 1))
+            bottomRight = Vector2D(viewRect.bottomright).toGridspace().add(Vector2D(2, 2))
+            (minX, minY) = (max(minX, topLeft.ix), max(minY, topLeft.iy))
+            (maxX, maxY) = (min(maxX, bottomRight.ix), min(maxY, bottomRight.iy))
+        for x in xrange(minX, maxX):
+            for y in xrange(minY, maxY):
+                if self.envGrid[x, y]:
+                    for effect in self.envGrid[x, y]:
+                        effect.draw(Vector2D(x, y).toRealspace(), progress)
+        game.imageManager.flushSprites()
+
+
+    ## Draw the furniture and terrain tiles in full detail; see 
+    # drawMidground().
+    def drawTerrain(self, progress, viewRect = None):
+        self.furnitureQuadTree.draw(progress, viewRect)
+        game.imageManager.flushSprites()
+        self.drawBlockChunks(viewRect)
+
+
+    ## Draw the terrain tiles in every chunk that intersects the given 
+    # realspace Rect, or in every chunk if it is None. Chunks whose tiles 
+    # have changed since they were last drawn are recompiled first.
+    def drawBlockChunks(self, rect = None):
+        numChunkCols = (self.numCols + blockChunkSize - 1) / blockChunkSize
+        numChunkRows = (self.numRows + blockChunkSize - 1) / blockChunkSize
+        (minX, minY, maxX, maxY) = (0, 0, numChunkCols, numChunkRows)
+        if rect is not None:
+            # Tiles may stick out of their grid spaces a bit, so pad by a 
+            # block on each side.
+            chunkWidth = float(blockChunkSize * constants.blockSize)
+            minX = max(minX, int(math.floor(
+                    (rect.left - constants.blockSize) / chunkWidth)))
+            minY = max(minY, int(math.floor(
+                    (rect.top - constants.blockSize) / chunkWidth)))
+            maxX = min(maxX, int(math.floor(
+                    (rect.right + constants.blockSize) / chunkWidth)) + 1)
+            maxY = min(maxY, int(math.floor(
+                    (rect.bottom + constants.blockSize) / chunkWidth)) + 1)
+        for chunkX in xrange(minX, maxX):
+            for chunkY in xrange(minY, maxY):
+                chunk = (chunkX, chunkY)
+                if chunk in self.dirtyBlockChunks:
+                    self.compileBlockChunk(chunk)
+                if self.blockChunks[chunk] is not None:
+                    game.imageManager.drawList(self.blockChunks[chunk])
+
+
+    ## Build the display list for the given chunk, replacing the old one.
+    def compileBlockChunk(self, chunk):
+        if self.blockChunks.get(chunk) is not None:
+            game.imageManager.deleteDisplayList(self.blockChunks[chunk])
+        (chunkX, chunkY) = chunk
+        minX = chunkX * blockChunkSize
+        minY = chunkY * blockChunkSize
+        frameLocs = []
+        for i in xrange(minX, min(minX + blockChunkSize, self.numCols)):
+            for j in xrange(minY, min(minY + blockChunkSize, self.numRows)):
+                if self.blocks[i, j]:
+                    frameLocs.append((self.blocks[i, j].getFrame(),
+                                      self.blocks[i, j].loc))
+        self.blockChunks[chunk] = None
+        if frameLocs:
+            self.blockChunks[chunk] = game.imageManager.createDisplayList(
+                    frameLocs)
+        self.dirtyBlockChunks.discard(chunk)
+
+
+    ## Throw out all compiled chunks, and mark every chunk as needing to be
+    # compiled.
+    def resetBlockChunks(self):
+        for displayList in self.blockChunks.itervalues():
+            if displayList is not None:
+                game.imageManager.deleteDisplayList(displayList)
+        self.blockChunks = dict()
+        self.dirtyBlockChunks = set()
+        for chunkX in xrange(0, self.numCols, blockChunkSize):
+            for chunkY in xrange(0, self.numRows, blockChunkSize):
+                self.dirtyBlockChunks.add((chunkX / blockChunkSize, 
+                                           chunkY / blockChunkSize))
+
+
+    ## Mark the chunk holding the given gridspace location as needing to be 
+    # recompiled, along with any overview tiles covering it.
+    def markBlockChunkDirty(self, gridLoc):
+        self.dirtyBlockChunks.add((gridLoc.ix / blockChunkSize, 
+                                   gridLoc.iy / blockChunkSize))
+        if self.overview is not None:
+            # Pad by a block, as for drawBlockChunks().
+            loc = gridLoc.toRealspace()
+            self.overview.markDirty(pygame.rect.Rect(
+                    loc.x - constants.blockSize, loc.y - constants.blockSize,
+                    constants.blockSize * 3, constants.blockSize * 3))
 
 
     ## Assign the given space to the given node, and unassign it from whoever
     # owned it before.
     def assignSpace(self, space, node):
-        if space in self.deadSeeds:
-            self.deadSeeds[space].owner.unassignSpace(space)
-        node.assignSpace(space)
-        self.deadSeeds[space] = seed.Seed(node, 0, constants.BIGNUM)
+        self.sectorGrid[space.ix, space.iy] = self.getSectorId(node)
+
+
+    ## Return the ID used for the given node in self.sectorGrid, allocating
+    # a new one if necessary.
+    def getSectorId(self, node):
+        if node not in self.sectorIds:
+            self.sectorIds[node] = len(self.sectors)
+            self.sectors.append(node)
+        return self.sectorIds[node]
 
 
     ## Mark a space as containing a platform. Don't do tile assignation until
@@ -1078,6 +1369,8 @@ class Map:
     ## Add a background object (a Scenery instance) to the map.
     def addBackgroundObject(self, obj):
         self.backgroundQuadTree.addObject(obj)
+        if self.overview is not None:
+            self.overview.markDirty(obj.getBounds())
 
 
     ## Remove all background objects found that are attached to the 
@@ -1087,6 +1380,8 @@ class Map:
         for object in self.backgroundQuadTree.getObjects():
             if object.gridLoc == gridLoc:
                 self.backgroundQuadTree.removeObject(object)
+                if self.overview is not None:
+                    self.overview.markDirty(object.getBounds())
                 didDelete = True
         return didDelete
 
@@ -1095,7 +1390,9 @@ class Map:
     def addEnvEffect(self, loc, effect):
         loc = loc.toInt()
         if self.getIsInBounds(loc):
-            self.envGrid[loc.ix][loc.iy].append(effect)
+            if self.envGrid[loc.ix, loc.iy] is None:
+                self.envGrid[loc.ix, loc.iy] = []
+            self.envGrid[loc.ix, loc.iy].append(effect)
 
 
     def getStartLoc(self):
@@ -1138,33 +1435,41 @@ class Map:
                 result.vector = vector
                 result.altObject = item
                 return result
-        excludedColumns = dict()
-        excludedRows = dict()
         upperLeft = poly.upperLeft.add(loc).toGridspace().add(Vector2D(-1, -1))
         lowerRight = poly.lowerRight.add(loc).toGridspace().add(Vector2D(2, 2))
 
+        # Collide against all nearby blocks in one go, then go through the
+        # results in order. Box blocks get a quick bounding-box test and the
+        # rest get full SAT (see Polygon.collide()).
+        candidates = []
         for x in xrange(max(0, upperLeft.ix), min(self.numCols, lowerRight.ix)):
-            if x in excludedColumns:
-                continue
             for y in xrange(max(0, upperLeft.iy), min(self.numRows, lowerRight.iy)):
-                if y in excludedRows:
-                    continue
-                if (self.blocks[x][y] != BLOCK_EMPTY and
-                        self.blocks[x][y].getBounds().colliderect(polyRect)):
-                    (overlap, vector) = self.blocks[x][y].collidePolygon(poly, loc)
-                    if vector is not None:
-                        if overlap > result.distance:
-                            result.distance = overlap
-                            result.vector = vector
-                            result.altObject = self.blocks[x][y]
-                        # Prune out some blocks that we needn't care about. If
-                        # a creature runs horizontally into one block, then
-                        # all blocks immediately above/below that block are
-                        # uninteresting, for example.
-                        if abs(vector.y) < constants.EPSILON:
-                            excludedColumns[x] = True
-                        elif abs(vector.x) < constants.EPSILON:
-                            excludedRows[y] = True
+                cell = self.blocks[x, y]
+                if (cell != BLOCK_EMPTY and
+                        cell.getBounds().colliderect(polyRect)):
+                    candidates.append((x, y, cell))
+        if not candidates:
+            return None
+        collisions = poly.runSATBatch(loc, 
+                [cell.getPolygon() for (x, y, cell) in candidates],
+                [cell.loc for (x, y, cell) in candidates])
+
+        excludedColumns = dict()
+        excludedRows = dict()
+        for (x, y, cell), (overlap, vector) in zip(candidates, collisions):
+            if x in excludedColumns or y in excludedRows or vector is None:
+                continue
+            if overlap > result.distance:
+                result.distance = overlap
+                result.vector = vector
+                result.altObject = cell
+            # Prune out some blocks that we needn't care about. If a creature
+            # runs horizontally into one block, then all blocks immediately 
+            # above/below that block are uninteresting, for example.
+            if abs(vector.y) < constants.EPSILON:
+                excludedColumns[x] = True
+            elif abs(vector.x) < constants.EPSILON:
+                excludedRows[y] = True
         if result.vector is not None:
             result.vector = self.fixEjectionVector(result.vector, result.altObject)
             return result
@@ -1194,171 +1499,128 @@ class Map:
 
 
     ## Load map information from disk. The filename is equal to the name of the
-    # map.
-    # \todo This parser is very brittle, and while the map file format is not
-    # meant to be directly user-editable, there's no reason we couldn't be 
-    # more flexible here.
+    # map. The file may be in either the binary or the text format; see the
+    # mapfile module.
     def loadMap(self):
-        fh = open(self.mapName, 'r')
-        lineNum = 0
+        logger.inform("Reading map file at",pygame.time.get_ticks())
+        mapData = mapfile.readMap(self.mapName)
+        self.numCols = mapData.numCols
+        self.width = self.numCols * constants.blockSize
+        self.numRows = mapData.numRows
+        self.height = self.numRows * constants.blockSize
+        logger.inform("Loading a",self.numCols,"by",self.numRows,"map")
+        self.initGrids(BLOCK_EMPTY, makeObjectGrid)
+        self.furnitureQuadTree = quadtree.QuadTree(self.getBounds())
+        self.backgroundQuadTree = quadtree.QuadTree(self.getBounds())
+        self.startLoc = Vector2D(mapData.startLoc[0], mapData.startLoc[1])
+
+        # Strings in the map data are indices into this table.
+        strings = mapData.strings
         terrainInfoCache = dict()
+        def getTerrain(zoneId, regionId):
+            if (zoneId, regionId) not in terrainInfoCache:
+                terrainInfoCache[(zoneId, regionId)] = terraininfo.TerrainInfo(
+                        strings[zoneId], strings[regionId])
+            return terrainInfoCache[(zoneId, regionId)]
+
+        logger.inform("Loading block information at",pygame.time.get_ticks())
+        for (x, y, zoneId, regionId, orientationId, subType) in mapData.sections['blocks'].tolist():
+            self.blocks[x, y] = block.Block(Vector2D(x, y),
+                                            getTerrain(zoneId, regionId),
+                                            strings[orientationId], subType)
+
+        logger.inform("Loading furniture at",pygame.time.get_ticks())
+        for (x, y, zoneId, regionId, groupId, subGroupId) in mapData.sections['furniture'].tolist():
+            newFurniture = furniture.Furniture(Vector2D(x, y), 
+                    getTerrain(zoneId, regionId), 
+                    strings[groupId], strings[subGroupId])
+            self.furnitureQuadTree.addObject(newFurniture)
+
+        logger.inform("Loading environmental effects at",pygame.time.get_ticks())
         envEffectCache = dict()
-        mode = 'dimensions'
-        for line in fh:
-            line = line.rstrip()
-            lineNum += 1
-            if mode == 'dimensions':
-                # Read map dimensions
-                (cols, rows) = line.split(',')
-                self.numCols = int(cols)
-                self.width = self.numCols * constants.blockSize
-                self.numRows = int(rows)
-                self.height = self.numRows * constants.blockSize
-                logger.inform("Loading a",self.numCols,"by",self.numRows,"map")
-                self.blocks = []
-                self.envGrid = []
-                for i in xrange(0, self.numCols):
-                    self.blocks.append([])
-                    self.envGrid.append([])
-                    for j in xrange(0, self.numRows):
-                        self.blocks[i].append(BLOCK_EMPTY)
-                        self.envGrid[i].append([])
-
-                self.furnitureQuadTree = quadtree.QuadTree(self.getBounds())
-                self.backgroundQuadTree = quadtree.QuadTree(self.getBounds())
-                
-                mode = 'start'
-            elif mode == 'start':
-                if line == 'blocks:':
-                    logger.inform("Loading block information at",pygame.time.get_ticks())
-                    mode = 'blocks'
-                    continue
-                # Read starting location
-                (x, y) = line.split(',')
-                self.startLoc = Vector2D(int(x), int(y))
-            elif mode == 'blocks':
-                if line == 'furniture:':
-                    logger.inform("Loading furniture at",pygame.time.get_ticks())
-                    mode = 'furniture'
-                    continue
-                (x, y, zone, region, orientation, subType) = line.split(',')
-                x = int(x)
-                y = int(y)
-                subType = int(subType)
-                region = region.rstrip()
-                if (zone, region) not in terrainInfoCache:
-                    terrainInfoCache[(zone, region)] = terraininfo.TerrainInfo(zone, region)
-                self.blocks[x][y] = block.Block(Vector2D(x, y),
-                                            terrainInfoCache[(zone, region)], 
-                                            orientation, subType)
-            elif mode == 'furniture':
-                if line == 'enveffects:':
-                    logger.inform("Loading environmental effects at",pygame.time.get_ticks())
-                    mode = 'enveffects'
-                    continue
-                (x, y, zone, region, group, subGroup) = line.split(',')
-                x = int(x)
-                y = int(y)
-                if (zone, region) not in terrainInfoCache:
-                    terrainInfoCache[(zone, region)] = terraininfo.TerrainInfo(zone, region)
-                newFurniture = furniture.Furniture(Vector2D(x, y), 
-                        terrainInfoCache[(zone, region)], group, subGroup)
-                self.furnitureQuadTree.addObject(newFurniture)
-            elif mode == 'enveffects':
-                if line == 'scenery:':
-                    logger.inform("Loading scenery at",pygame.time.get_ticks())
-                    mode = 'scenery'
-                    continue
-                (location, effects) = line.split(':')
-                (x, y) = location.split(',')
-                x = int(x)
-                y = int(y)
-                effects = effects.split(',')
-                for name in effects:
-                    if name not in envEffectCache:
-                        envEffectCache[name] = enveffect.EnvEffect(name)
-                    envEffectCache[name].addSpace(Vector2D(x, y), self)
-
-            elif mode == 'scenery':
-                (x, y, zone, region, group, item) = line.split(',')
-                x = int(x)
-                y = int(y)
-                if (zone, region) not in terrainInfoCache:
-                    terrainInfoCache[(zone, region)] = terraininfo.TerrainInfo(zone, region)
-                self.addBackgroundObject(
-                        scenery.Scenery(Vector2D(x, y), 
-                                  terrainInfoCache[(zone, region)], 
-                                  group, item))
+        for (x, y, nameId) in mapData.sections['enveffects'].tolist():
+            if nameId not in envEffectCache:
+                envEffectCache[nameId] = enveffect.EnvEffect(strings[nameId])
+            envEffectCache[nameId].addSpace(Vector2D(x, y), self)
+
+        logger.inform("Loading scenery at",pygame.time.get_ticks())
+        for (x, y, zoneId, regionId, groupId, itemId) in mapData.sections['scenery'].tolist():
+            self.addBackgroundObject(
+                    scenery.Scenery(Vector2D(x, y), 
+                              getTerrain(zoneId, regionId), 
+                              strings[groupId], strings[itemId]))
         logger.inform("Done loading map at",pygame.time.get_ticks())
 
     
     ## Load an image file as if it were a map. Each pixel is one tile; 
-    # black pixels are filled, others are not.
+    # opaque pixels are filled, transparent ones are not. The terrain for
+    # each filled tile is that of the region (across all zones) whose color
+    # is closest to the pixel's color.
     # Uses a dummy start location of (0, 0), since this isn't meant to be 
     # used for actual gameplay; just for converting images to normal maps.
-    # \todo Base the terrain used on the color of the pixel.
     def loadImageAsMap(self, image):
         self.startLoc = Vector2D(0, 0)
         (self.numCols, self.numRows) = image.get_size()
         self.width = self.numCols * constants.blockSize
         self.height = self.numRows * constants.blockSize
         logger.inform("Loading a",self.numCols,"by",self.numRows,"map from an image")
-        self.blocks = []
-        self.envGrid = []
-        for i in xrange(0, self.numCols):
-            self.blocks.append([])
-            self.envGrid.append([])
-            for j in xrange(0, self.numRows):
-                self.blocks[i].append(BLOCK_EMPTY)
-                self.envGrid[i].append([])
+        self.initGrids(BLOCK_EMPTY)
 
         self.furnitureQuadTree = quadtree.QuadTree(self.getBounds())
         self.backgroundQuadTree = quadtree.QuadTree(self.getBounds())
                 
         self.zoneData = zone.loadZoneData()
-        colorToTerrainMap = {}
-
-        for i in xrange(self.numCols):
-            if i % 10 == 0:
-                logger.inform("Creating column", i)
-            for j in xrange(self.numRows):
-                color = image.get_at((i, j))
-                (r, g, b, a) = color
-                if a != 0: # Nonzero opacity
-                    self.blocks[i][j] = BLOCK_WALL
-                else:
-                    self.blocks[i][j] = BLOCK_EMPTY
-                if color not in colorToTerrainMap:
-                    # Find the color of an existing terrain that best-matches
-                    # the color in the image, and use that terrain.
-                    bestDistance = None
-                    bestZone = None
-                    bestRegion = None
-                    for zoneName, zoneInfo in self.zoneData.iteritems():
-                        for regionName, regionData in zoneInfo['regions'].iteritems():
-                            (ra, rg, rb) = regionData['color']
-                            distance = math.sqrt((r - ra) ** 2 + 
-                                                 (g - rg) ** 2 + 
-                                                 (b - rb) ** 2)
-                            if bestDistance is None or distance < bestDistance:
-                                bestDistance = distance
-                                bestZone = zoneName
-                                bestRegion = regionName
-                    colorToTerrainMap[color] = terraininfo.TerrainInfo(
-                            bestZone, bestRegion
-                    )
-
-        # We could do this in the original pass if we modified getBlockType,
-        # but this way keeps the image manipulation work to one place and 
-        # shouldn't have too bad a hit to our performance.
+
+        # Both arrays are indexed by [x, y], like our grids. Surfaces without
+        # per-pixel alpha come back fully opaque.
+        pixels = pygame.surfarray.array3d(image).astype(numpy.int32)
+        isWall = pygame.surfarray.array_alpha(image) != 0
+        self.blocks[isWall] = BLOCK_WALL
+
+        # Find the distinct colors of the filled pixels, and match each one 
+        # to the region whose color is nearest, all in one go. Ties go to 
+        # the first region we see, as zoneData iteration order goes.
+        (wallCols, wallRows) = numpy.nonzero(isWall)
+        wallPixels = pixels[wallCols, wallRows]
+        packedColors = ((wallPixels[:, 0] << 16) | (wallPixels[:, 1] << 8) |
+                        wallPixels[:, 2])
+        (uniqueColors, colorIndices) = numpy.unique(packedColors,
+                                                    return_inverse = True)
+        regionNames = []
+        regionColors = []
+        for zoneName, zoneInfo in self.zoneData.iteritems():
+            for regionName, regionData in zoneInfo['regions'].iteritems():
+                regionNames.append((zoneName, regionName))
+                regionColors.append(regionData['color'][:3])
+        regionColors = numpy.array(regionColors, numpy.int32)
+        uniqueColors = numpy.column_stack((uniqueColors >> 16,
+                                           (uniqueColors >> 8) & 0xff,
+                                           uniqueColors & 0xff))
+        # Squared distances are exact for integer colors and order the same
+        # way as true distances.
+        offsets = uniqueColors[:, numpy.newaxis, :] - regionColors[numpy.newaxis, :, :]
+        colorToRegion = numpy.argmin(numpy.sum(offsets ** 2, axis = 2), 
+                                     axis = 1)
+        logger.inform("Found",len(uniqueColors),"distinct colors")
+
+        terrainInfoCache = dict()
+        colorTerrains = []
+        for regionIndex in colorToRegion.tolist():
+            key = regionNames[regionIndex]
+            if key not in terrainInfoCache:
+                terrainInfoCache[key] = terraininfo.TerrainInfo(*key)
+            colorTerrains.append(terrainInfoCache[key])
+
         logger.inform("Instantiating blocks")
-        for i, j in self.getIterBlocks():
-            if self.blocks[i][j] == BLOCK_WALL:
-                blockLoc = Vector2D(i, j)
-                terrain = colorToTerrainMap[image.get_at((i, j))]
-                (type, signature) = self.getBlockType(i, j)
-                self.blocks[i][j] = block.Block(blockLoc, terrain, type)
-            # else self.blocks[i][j] == BLOCK_EMPTY, do nothing
+        blocks = makeObjectGrid(self.numCols, self.numRows, BLOCK_EMPTY)
+        signatures = raster.adjacencySignatures(self.blocks != BLOCK_EMPTY)
+        wallTypes = signatures[wallCols, wallRows].tolist()
+        for i, j, colorIndex, signature in zip(wallCols.tolist(), 
+                wallRows.tolist(), colorIndices.tolist(), wallTypes):
+            blocks[i, j] = block.Block(Vector2D(i, j), 
+                                       colorTerrains[colorIndex],
+                                       self.signatureToBlockType[signature])
+        self.blocks = blocks
 
         logger.inform("Map load complete")
 
@@ -1368,7 +1630,8 @@ class Map:
     # boundaries.
     def addBlock(self, newBlock):
         if self.getIsInBounds(newBlock.gridLoc):
-            self.blocks[newBlock.gridLoc.ix][newBlock.gridLoc.iy] = newBlock
+            self.blocks[newBlock.gridLoc.ix, newBlock.gridLoc.iy] = newBlock
+            self.markBlockChunkDirty(newBlock.gridLoc)
         else:
             logger.warn("Block location", newBlock.gridLoc, "is out of bounds")
 
@@ -1376,7 +1639,8 @@ class Map:
     ## Remove a block from the map
     def deleteBlock(self, blockLoc):
         if self.getIsInBounds(blockLoc):
-            self.blocks[blockLoc.ix][blockLoc.iy] = BLOCK_EMPTY
+            self.blocks[blockLoc.ix, blockLoc.iy] = BLOCK_EMPTY
+            self.markBlockChunkDirty(blockLoc)
         else:
             logger.warn("Tried to delete block at", blockLoc, 
                         "which is out of bounds")
@@ -1390,45 +1654,43 @@ class Map:
         logger.debug("Placing furniture",furniture,"with bounds from",topLeft,"to",bottomRight)
         for x in xrange(max(0, topLeft.ix), min(self.numCols, bottomRight.ix)):
             for y in xrange(max(0, topLeft.iy), min(self.numRows, bottomRight.iy)):
-                if self.blocks[x][y] != BLOCK_EMPTY:
+                if self.blocks[x, y] != BLOCK_EMPTY:
                     logger.debug("Removed block at",(x,y))
-                self.blocks[x][y] = BLOCK_EMPTY
+                self.blocks[x, y] = BLOCK_EMPTY
         self.furnitureQuadTree.addObject(furniture)
 
 
     ## Write our map to disk so it can be read by loadMap().
+    # \param isBinary If true, use the binary map format; otherwise use the 
+    # text format. See the mapfile module.
     # \todo Make saveable objects handle their own read/write logic. This is
     # getting pretty ugly.
-    def writeMap(self, name = None):
+    def writeMap(self, name = None, isBinary = True):
         if name is None:
             name = self.mapName.replace('.map', '') + '-tmp'
-        fh = open(name + '.map', 'w')
-        fh.write("%d,%d\n" % (self.numCols, self.numRows))
-        fh.write("%d,%d\n" % (self.startLoc.x, self.startLoc.y))
-        fh.write("blocks:\n")
-        for i, j in self.getIterBlocks():
-            if self.blocks[i][j] not in (BLOCK_EMPTY, None):
-                block = self.blocks[i][j]
-                fh.write("%d,%d,%s,%s,%s,%d\n" % (i, j, 
-                    block.terrain.zone, block.terrain.region,
-                    block.orientation, block.subType))
-        fh.write("furniture:\n")
-        for item in self.furnitureQuadTree.getObjects():
-            fh.write("%d,%d,%s,%s,%s,%s\n" % (item.loc.x, item.loc.y,
-                                            item.terrain.zone, 
-                                            item.terrain.region,
-                                            item.group, item.subGroup))
-        fh.write("enveffects:\n")
+        mapData = mapfile.MapData(self.numCols, self.numRows, 
+                                  (int(self.startLoc.x), int(self.startLoc.y)))
+        blocks = []
+        envEffects = []
         for i, j in self.getIterBlocks():
-            if self.envGrid[i][j]:
-                string = ",".join(effect.name for effect in self.envGrid[i][j])
-                fh.write("%d,%d:%s\n" % (i, j, string))
-        
-        fh.write("scenery:\n")
-        for item in self.backgroundQuadTree.getObjects():
-            fh.write("%d,%d,%s,%s,%s,%s\n" % 
-                     (item.loc.x, item.loc.y, item.terrain.zone, 
-                      item.terrain.region, item.group, item.item))
+            if self.blocks[i, j] not in (BLOCK_EMPTY, None):
+                block = self.blocks[i, j]
+                blocks.append((i, j, block.terrain.zone, block.terrain.region,
+                               block.orientation, block.subType))
+            if self.envGrid[i, j]:
+                for effect in self.envGrid[i, j]:
+                    envEffects.append((i, j, effect.name))
+        mapData.setSection('blocks', blocks)
+        mapData.setSection('furniture', 
+                [(int(item.loc.x), int(item.loc.y), item.terrain.zone, 
+                  item.terrain.region, item.group, item.subGroup)
+                 for item in self.furnitureQuadTree.getObjects()])
+        mapData.setSection('enveffects', envEffects)
+        mapData.setSection('scenery', 
+                [(int(item.loc.x), int(item.loc.y), item.terrain.zone, 
+                  item.terrain.region, item.group, item.item)
+                 for item in self.backgroundQuadTree.getObjects()])
+        mapfile.writeMap(mapData, name + '.map', isBinary)
 
 
     ## Simple boundary check for the blocks grid.
@@ -1444,24 +1706,41 @@ class Map:
     ## Returns the region information at the given location. See makeRegions()
     # for more information on regions.
     def getTerrainInfoAtGridLoc(self, loc):
-        regionLoc = loc.multiply(regionOverlayResolutionMultiplier).toInt()
-        if regionLoc in self.regions:
-            return self.regions[regionLoc]
-        return None
+        if self.regionGrid is None:
+            return None
+        regionLoc = loc.multiply(regionOverlayResolutionMultiplier)
+        (x, y) = (regionLoc.ix, regionLoc.iy)
+        (cols, rows) = self.regionGrid.shape
+        if x < 0 or x >= cols or y < 0 or y >= rows:
+            return None
+        return self.regionTerrains[self.regionGrid[x, y]]
 
 
     def getBlockAtGridLoc(self, loc):
         if not self.getIsInBounds(loc):
             return None
         loc = loc.toInt()
-        return self.blocks[loc.ix][loc.iy]
+        return self.blocks[loc.ix, loc.iy]
 
 
-    ## Get the TreeNode that owns the given space, if any.
+    ## Get the MapEdge that owns the given space, if any.
     def getSectorAtGridLoc(self, loc):
-        if loc not in self.deadSeeds:
+        (x, y) = (loc.ix, loc.iy)
+        if (self.sectorGrid is None or x < 0 or x >= self.numCols or
+                y < 0 or y >= self.numRows):
+            return None
+        sectorId = self.sectorGrid[x, y]
+        if sectorId == NO_SECTOR:
             return None
-        return self.deadSeeds[loc].owner
+        return self.sectors[sectorId]
+
+
+    ## Return a boolean grid that is true for the spaces owned by the given
+    # MapEdge.
+    def getSectorMask(self, node):
+        if node not in self.sectorIds:
+            return numpy.zeros((self.numCols, self.numRows), bool)
+        return self.sectorGrid == self.sectorIds[node]
 
 
     ## Return the data in the specified field for the given terrain type.
@@ -1478,8 +1757,13 @@ class Map:
         return pygame.rect.Rect((0, 0), (self.width, self.height))
 
 
-    ## Utility function for when we need to iterate over the entire map.
-    def getIterBlocks(self):
-        for i in xrange(self.numCols):
-            for j in xrange(self.numRows):
+    ## Utility function for when we need to iterate over the entire map (or
+    # over some other grid of the given dimensions).
+    def getIterBlocks(self, numCols = None, numRows = None):
+        if numCols is None:
+            numCols = self.numCols
+        if numRows is None:
+            numRows = self.numRows
+        for i in xrange(numCols):
+            for j in xrange(numRows):
                 yield (i, j)
@@ -0,0 +1,281 @@
+import logger
+
+import mmap
+import struct
+import numpy
+
+## @package mapfile
+# Reading and writing of map files. A map file holds everything needed to
+# recreate a generated map without rerunning map generation: its dimensions,
+# the player's starting location, and the blocks, furniture, environmental
+# effects, and scenery in it. There are two formats:
+# - The text format, with one line per object, grouped into sections. This
+#   is the original format, and is easy to read and edit by hand, but slow to
+#   parse for big maps.
+# - The binary format. This holds a table of all of the strings (zone, region,
+#   orientation, group, etc. names) used in the map, followed by one packed
+#   array per section in which strings are referred to by their index in the
+#   table. The arrays can be used straight out of a memory-mapped file, so
+#   loading doesn't involve any per-line parsing.
+#
+# Both are read into, and written from, MapData instances. readMap()
+# determines the format of the file on its own.
+#
+# The binary format is laid out as follows; all values are little-endian.
+# - Header: the binaryMagic string, then the format version, the number of
+#   columns and rows, and the starting location, as uint32, uint32, uint32,
+#   int32, int32.
+# - String table: a uint32 count, followed by that many strings, each stored
+#   as a uint16 length followed by the bytes of the string.
+# - One section for each entry in sectionNames, in order: a uint32 count,
+#   padding to the next multiple of 8 bytes, and then that many records of
+#   the section's dtype (see sectionDtypes).
+
+## Magic string at the start of binary map files.
+binaryMagic = 'JBMAPBIN'
+## Current version of the binary format. Bump this whenever the layout
+# changes, and keep readBinaryMap() able to read older versions.
+binaryVersion = 1
+## Format of the header of binary map files, after the magic string.
+binaryHeaderFormat = '<IIIii'
+
+## Names of the sections of a map file, in the order in which they appear.
+sectionNames = ['blocks', 'furniture', 'enveffects', 'scenery']
+
+## Record types for each section. Fields ending in "Id" are indices into the
+# string table. Environmental effects get one record per effect per space.
+sectionDtypes = {
+    'blocks' : numpy.dtype([('x', '<i4'), ('y', '<i4'),
+                            ('zoneId', '<u4'), ('regionId', '<u4'),
+                            ('orientationId', '<u4'), ('subType', '<i4')]),
+    'furniture' : numpy.dtype([('x', '<i4'), ('y', '<i4'),
+                               ('zoneId', '<u4'), ('regionId', '<u4'),
+                               ('groupId', '<u4'), ('subGroupId', '<u4')]),
+    'enveffects' : numpy.dtype([('x', '<i4'), ('y', '<i4'),
+                                ('nameId', '<u4')]),
+    'scenery' : numpy.dtype([('x', '<i4'), ('y', '<i4'),
+                             ('zoneId', '<u4'), ('regionId', '<u4'),
+                             ('groupId', '<u4'), ('itemId', '<u4')]),
+}
+
+## Fields in each section that are indices into the string table, in the
+# order in which the text format stores them (after the location).
+sectionStringFields = {
+    'blocks' : ['zoneId', 'regionId', 'orientationId'],
+    'furniture' : ['zoneId', 'regionId', 'groupId', 'subGroupId'],
+    'enveffects' : ['nameId'],
+    'scenery' : ['zoneId', 'regionId', 'groupId', 'itemId'],
+}
+
+
+## The contents of a map file. Each section is a numpy record array with the
+# dtype in sectionDtypes; strings are stored in a table and referred to by
+# index.
+class MapData:
+    def __init__(self, numCols, numRows, startLoc):
+        self.numCols = numCols
+        self.numRows = numRows
+        ## (x, y) tuple of the player's starting location, in gridspace.
+        self.startLoc = startLoc
+        ## List of strings referred to by the sections.
+        self.strings = []
+        ## Maps strings to their indices in self.strings.
+        self.stringIds = dict()
+        ## Maps section names to record arrays.
+        self.sections = dict()
+        for name in sectionNames:
+            self.sections[name] = numpy.zeros(0, sectionDtypes[name])
+
+
+    ## Return the index of the given string in self.strings, adding it if
+    # necessary.
+    def getStringId(self, string):
+        if string not in self.stringIds:
+            self.stringIds[string] = len(self.strings)
+            self.strings.append(string)
+        return self.stringIds[string]
+
+
+    ## Set the contents of the named section from a list of tuples. Each
+    # tuple holds the location of the object followed by the strings and
+    # numbers described by the section's dtype, with strings as actual
+    # strings rather than IDs.
+    def setSection(self, name, rows):
+        dtype = sectionDtypes[name]
+        stringFields = sectionStringFields[name]
+        records = []
+        for row in rows:
+            record = list(row)
+            for index, field in enumerate(dtype.names):
+                if field in stringFields:
+                    record[index] = self.getStringId(record[index])
+            records.append(tuple(record))
+        self.sections[name] = numpy.array(records, dtype)
+
+
+    ## Return the contents of the named section as a list of tuples, in the
+    # format accepted by setSection().
+    def getSection(self, name):
+        dtype = sectionDtypes[name]
+        stringFields = sectionStringFields[name]
+        columns = []
+        for field in dtype.names:
+            values = self.sections[name][field].tolist()
+            if field in stringFields:
+                values = [self.strings[id] for id in values]
+            columns.append(values)
+        return zip(*columns)
+
+
+## Read a map file, in either format.
+def readMap(filename):
+    fh = open(filename, 'rb')
+    magic = fh.read(len(binaryMagic))
+    fh.close()
+    if magic == binaryMagic:
+        return readBinaryMap(filename)
+    return readTextMap(filename)
+
+
+## Write a map file in the specified format.
+def writeMap(mapData, filename, isBinary = True):
+    if isBinary:
+        writeBinaryMap(mapData, filename)
+    else:
+        writeTextMap(mapData, filename)
+
+
+## Read a map file in the text format.
+# \todo This parser is very brittle, and while the map file format is not
+# meant to be directly user-editable, there's no reason we couldn't be 
+# more flexible here.
+def readTextMap(filename):
+    fh = open(filename, 'r')
+    rows = dict([(name, []) for name in sectionNames])
+    mode = 'dimensions'
+    for line in fh:
+        line = line.rstrip()
+        if mode == 'dimensions':
+            (numCols, numRows) = [int(value) for value in line.split(',')]
+            mode = 'start'
+        elif mode == 'start':
+            if line == 'blocks:':
+                mode = 'blocks'
+                continue
+            (x, y) = line.split(',')
+            startLoc = (int(x), int(y))
+        elif line.endswith(':') and line[:-1] in sectionNames:
+            mode = line[:-1]
+        elif mode == 'blocks':
+            (x, y, zone, region, orientation, subType) = line.split(',')
+            rows[mode].append((int(x), int(y), zone, region.rstrip(),
+                               orientation, int(subType)))
+        elif mode == 'enveffects':
+            (location, effects) = line.split(':')
+            (x, y) = location.split(',')
+            for name in effects.split(','):
+                rows[mode].append((int(x), int(y), name))
+        else:
+            # Furniture and scenery
+            (x, y, zone, region, group, item) = line.split(',')
+            rows[mode].append((int(x), int(y), zone, region, group, item))
+    fh.close()
+
+    mapData = MapData(numCols, numRows, startLoc)
+    for name in sectionNames:
+        mapData.setSection(name, rows[name])
+    return mapData
+
+
+## Write a map file in the text format.
+def writeTextMap(mapData, filename):
+    fh = open(filename, 'w')
+    fh.write("%d,%d\n" % (mapData.numCols, mapData.numRows))
+    fh.write("%d,%d\n" % mapData.startLoc)
+    fh.write("blocks:\n")
+    for row in mapData.getSection('blocks'):
+        fh.write("%d,%d,%s,%s,%s,%d\n" % row)
+    fh.write("furniture:\n")
+    for row in mapData.getSection('furniture'):
+        fh.write("%d,%d,%s,%s,%s,%s\n" % row)
+    fh.write("enveffects:\n")
+    # Effects for the same space go on the same line.
+    prevLoc = None
+    for (x, y, name) in mapData.getSection('enveffects'):
+        if (x, y) == prevLoc:
+            fh.write(",%s" % name)
+        else:
+            if prevLoc is not None:
+                fh.write("\n")
+            fh.write("%d,%d:%s" % (x, y, name))
+            prevLoc = (x, y)
+    if prevLoc is not None:
+        fh.write("\n")
+    fh.write("scenery:\n")
+    for row in mapData.getSection('scenery'):
+        fh.write("%d,%d,%s,%s,%s,%s\n" % row)
+    fh.close()
+
+
+## Read a map file in the binary format. The file is memory-mapped, and the
+# sections are copied out of it in one go each.
+def readBinaryMap(filename):
+    fh = open(filename, 'rb')
+    buffer = mmap.mmap(fh.fileno(), 0, access = mmap.ACCESS_READ)
+    try:
+        offset = len(binaryMagic)
+        if buffer[:offset] != binaryMagic:
+            logger.fatal("Map file",filename,"is not a binary map file")
+        (version, numCols, numRows, startX, startY) = struct.unpack_from(
+                binaryHeaderFormat, buffer, offset)
+        offset += struct.calcsize(binaryHeaderFormat)
+        if version > binaryVersion:
+            logger.fatal("Map file",filename,"has format version",version,
+                         "but we only understand up to version",binaryVersion)
+        mapData = MapData(numCols, numRows, (startX, startY))
+
+        (numStrings,) = struct.unpack_from('<I', buffer, offset)
+        offset += 4
+        for i in xrange(numStrings):
+            (length,) = struct.unpack_from('<H', buffer, offset)
+            offset += 2
+            mapData.getStringId(buffer[offset : offset + length])
+            offset += length
+
+        for name in sectionNames:
+            (count,) = struct.unpack_from('<I', buffer, offset)
+            offset = getPaddedOffset(offset + 4)
+            dtype = sectionDtypes[name]
+            mapData.sections[name] = numpy.frombuffer(buffer, dtype, count,
+                                                      offset).copy()
+            offset += count * dtype.itemsize
+    finally:
+        buffer.close()
+        fh.close()
+    return mapData
+
+
+## Write a map file in the binary format.
+def writeBinaryMap(mapData, filename):
+    fh = open(filename, 'wb')
+    fh.write(binaryMagic)
+    fh.write(struct.pack(binaryHeaderFormat, binaryVersion,
+                         mapData.numCols, mapData.numRows,
+                         mapData.startLoc[0], mapData.startLoc[1]))
+    fh.write(struct.pack('<I', len(mapData.strings)))
+    for string in mapData.strings:
+        fh.write(struct.pack('<H', len(string)))
+        fh.write(string)
+    for name in sectionNames:
+        records = mapData.sections[name].astype(sectionDtypes[name])
+        fh.write(struct.pack('<I', len(records)))
+        offset = fh.tell()
+        fh.write('\0' * (getPaddedOffset(offset) - offset))
+        fh.write(records.tostring())
+    fh.close()
+
+
+## Round the given offset up to the next multiple of 8, so that the arrays
+# in binary map files are aligned.
+def getPaddedOffset(offset):
+    return (offset + 7) & ~7
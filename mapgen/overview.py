@@ -0,0 +1,142 @@
+import game
+import constants
+import imagemanager
+from vector2d import Vector2D
+
+import collections
+import math
+if not constants.isHeadless:
+    import OpenGL.GL as GL
+    import OpenGL.GL.framebufferobjects as FBO
+
+## @package overview
+# A level-of-detail pyramid for drawing the map when zoomed far out. At such
+# zoom levels, drawing every tile, piece of scenery, and environmental effect
+# individually is slow and pointless, since each one covers only a few 
+# pixels. Instead, the map is divided into square tiles at each of several
+# scales, and each tile is rendered once (with all of the map's static 
+# contents) into a small texture, which is drawn in place of the contents.
+# Tiles are rendered as they come into view, and re-rendered after anything
+# in them changes (see MapOverview.markDirty()).
+
+## Scales (texture pixels per realspace pixel) of the levels of the pyramid,
+# from finest to coarsest. The overview is used at any zoom factor at or 
+# below the first scale.
+overviewScales = [.25, .0625, .015625]
+## Width and height, in pixels, of the texture for each overview tile.
+overviewTileSize = 256
+## Maximum number of overview tiles to keep textures for. The tiles that 
+# were drawn least recently are thrown out first.
+maxOverviewTiles = 512
+
+
+## Holds and draws the overview tiles for a single map.
+class MapOverview:
+    def __init__(self, map):
+        ## The Map we are an overview of.
+        self.map = map
+        ## Maps (level, column, row) tuples to Frames holding the rendered 
+        # tiles, ordered from least to most recently drawn.
+        self.tiles = collections.OrderedDict()
+        ## Framebuffer object used to render tiles; created when first needed.
+        self.framebuffer = None
+
+
+    ## Return the index in overviewScales of the level to use for the given
+    # zoom factor, or None if the map should be drawn in full detail. We use
+    # the coarsest level whose tiles don't need to be magnified.
+    def getLevel(self, zoom):
+        for level in xrange(len(overviewScales) - 1, -1, -1):
+            if overviewScales[level] >= zoom:
+                return level
+        return None
+
+
+    ## Return the width and height, in realspace, of a tile at the given 
+    # level.
+    def getTileSpan(self, level):
+        return overviewTileSize / overviewScales[level]
+
+
+    ## Return the range of tiles at the given level that intersect the given
+    # realspace Rect, as (minColumn, minRow, maxColumn, maxRow), with the
+    # maximums exclusive.
+    def getTileRange(self, level, rect):
+        span = self.getTileSpan(level)
+        numCols = int(math.ceil(self.map.width / span))
+        numRows = int(math.ceil(self.map.height / span))
+        return (max(0, int(math.floor(rect.left / span))),
+                max(0, int(math.floor(rect.top / span))),
+                min(numCols, int(math.floor(rect.right / span)) + 1),
+                min(numRows, int(math.floor(rect.bottom / span)) + 1))
+
+
+    ## Draw the tiles at the given level that intersect the given realspace 
+    # Rect, rendering any that we don't already have.
+    def draw(self, level, viewRect):
+        game.imageManager.flushSprites()
+        span = self.getTileSpan(level)
+        (minX, minY, maxX, maxY) = self.getTileRange(level, viewRect)
+        for x in xrange(minX, maxX):
+            for y in xrange(minY, maxY):
+                key = (level, x, y)
+                if key in self.tiles:
+                    # Move it to the end of the line for eviction.
+                    frame = self.tiles.pop(key)
+                else:
+                    frame = self.renderTile(level, x, y)
+                self.tiles[key] = frame
+                game.imageManager.drawGameObjectAt(frame, 
+                        Vector2D(x * span, y * span))
+        game.imageManager.flushSprites()
+        while len(self.tiles) > maxOverviewTiles:
+            (key, frame) = self.tiles.popitem(last = False)
+            self.deleteTile(frame)
+
+
+    ## Throw out any tiles that intersect the given realspace Rect, so that 
+    # they will be rendered anew the next time they are drawn. Call this
+    # whenever the contents of the map change.
+    def markDirty(self, rect):
+        for level in xrange(len(overviewScales)):
+            (minX, minY, maxX, maxY) = self.getTileRange(level, rect)
+            for x in xrange(minX, maxX):
+                for y in xrange(minY, maxY):
+                    if (level, x, y) in self.tiles:
+                        self.deleteTile(self.tiles.pop((level, x, y)))
+
+
+    ## Render the given tile into a new texture, and return a Frame for it
+    # whose size is the realspace size of the tile.
+    def renderTile(self, level, tileX, tileY):
+        span = self.getTileSpan(level)
+        scale = overviewScales[level]
+        texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, 
+                GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, 
+                GL.GL_LINEAR)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, overviewTileSize,
+                overviewTileSize, 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, None)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        if self.framebuffer is None:
+            self.framebuffer = FBO.glGenFramebuffers(1)
+        FBO.glBindFramebuffer(FBO.GL_FRAMEBUFFER, self.framebuffer)
+        FBO.glFramebufferTexture2D(FBO.GL_FRAMEBUFFER,
+                FBO.GL_COLOR_ATTACHMENT0, GL.GL_TEXTURE_2D, texture, 0)
+
+        self.map.drawRegion(tileX * span, tileY * span, scale, 
+                            overviewTileSize)
+        FBO.glBindFramebuffer(FBO.GL_FRAMEBUFFER, 0)
+
+        # The bottom row of the texture is the bottom of the tile, so flip 
+        # the texture coordinates vertically.
+        return imagemanager.Frame((span, span), texture, 
+                'overview-%d-%d-%d' % (level, tileX, tileY), (0, 1, 1, 0))
+
+
+    ## Free the texture for the given tile.
+    def deleteTile(self, frame):
+        GL.glDeleteTextures([frame.textureId])
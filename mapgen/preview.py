@@ -0,0 +1,122 @@
+import block
+import generator
+
+import numpy
+
+## @package preview
+# Schematic images of maps, drawn entirely on the CPU so that they can be 
+# made without a display (e.g. when generating maps headlessly). Rather than
+# drawing each block on its own, each layer of the preview (the region 
+# overlay, sector ownership, environmental effects, walls, and platforms) is
+# built as a whole-map raster with numpy and composited in one go. See 
+# renderPreview().
+
+## Color of space that nothing else is drawn over.
+backgroundColor = (0, 0, 0)
+## Color of walls when the blocks are still a grid of BLOCK_* values, so 
+# there's no terrain to take a color from.
+wallColor = (255, 255, 255)
+## Color of platforms made by Map.buildPlatforms().
+platformColor = (255, 255, 0)
+## Colors for environmental effects, by effect name. Effects not listed here
+# aren't drawn.
+envEffectColors = {
+    'water' : (40, 90, 255),
+}
+## Brightness, as a fraction of full, of the region overlay and sector 
+# ownership layers, so that walls stand out against them.
+overlayBrightness = .35
+
+
+## Return an RGB image of the given map, as a uint8 array indexed by 
+# [x, y, channel] (the layout pygame.surfarray uses).
+# \param scale Pixels in the image per block of the map. Need not be an 
+# integer; blocks are sampled with nearest-neighbor filtering.
+# \param shouldDrawRegions If true, color open space by the region of the 
+# low-rez region overlay (see Map.makeRegions()) that it belongs to.
+# \param shouldDrawSectors If true, color open space by the sector that owns
+# it, using the MapEdges' debugging colors. Drawn over the regions.
+def renderPreview(map, scale, shouldDrawRegions = False, 
+                  shouldDrawSectors = False):
+    (numCols, numRows) = (map.numCols, map.numRows)
+    pixels = numpy.empty((numCols, numRows, 3), numpy.uint8)
+    pixels[:] = backgroundColor
+
+    if shouldDrawRegions and map.regionGrid is not None:
+        # Same lookup as Map.getTerrainInfoAtGridLoc().
+        regionColors = numpy.array([getTerrainColor(map, terrain) 
+                                    for terrain in map.regionTerrains])
+        regionCols = (numpy.arange(numCols) * 
+                      generator.regionOverlayResolutionMultiplier).astype(int)
+        regionRows = (numpy.arange(numRows) * 
+                      generator.regionOverlayResolutionMultiplier).astype(int)
+        regions = map.regionGrid[regionCols[:, numpy.newaxis], 
+                                 regionRows[numpy.newaxis, :]]
+        pixels[:] = regionColors[regions] * overlayBrightness
+
+    if shouldDrawSectors and map.sectorGrid is not None:
+        sectorColors = numpy.array([sector.color for sector in map.sectors])
+        isOwned = map.sectorGrid != generator.NO_SECTOR
+        pixels[isOwned] = (sectorColors[map.sectorGrid[isOwned]] * 
+                           overlayBrightness)
+
+    for name, color in envEffectColors.iteritems():
+        pixels[getEnvEffectMask(map, name)] = color
+
+    if map.blocks.dtype == object:
+        # Block instances; color each by its terrain. Comparing Blocks 
+        # against BLOCK_EMPTY one at a time is slow, so pick them out by 
+        # type instead. Cells come out in the same order as numpy.nonzero()
+        # returns them.
+        cells = map.blocks.ravel().tolist()
+        isWall = numpy.array([isinstance(cell, block.Block) for cell in cells],
+                             bool).reshape(map.blocks.shape)
+        terrains = [cell.terrain for cell in cells 
+                    if isinstance(cell, block.Block)]
+        # Blocks with the same terrain usually share a TerrainInfo, so group
+        # them by identity, which is much quicker than hashing each one.
+        terrainIdToIndex = dict()
+        terrainColors = []
+        for terrain in terrains:
+            if id(terrain) not in terrainIdToIndex:
+                terrainIdToIndex[id(terrain)] = len(terrainColors)
+                terrainColors.append(getTerrainColor(map, terrain))
+        indices = [terrainIdToIndex[id(terrain)] for terrain in terrains]
+        if indices:
+            pixels[isWall] = numpy.array(terrainColors)[indices]
+    else:
+        pixels[map.blocks == generator.BLOCK_WALL] = wallColor
+
+    if map.platformsQuadTree is not None:
+        for platform in map.platformsQuadTree.getObjects():
+            first = max(0, int(platform.loc.x - platform.width / 2.0))
+            last = min(numCols, int(platform.loc.x + platform.width / 2.0))
+            if 0 <= platform.loc.iy < numRows:
+                pixels[first:last, platform.loc.iy] = platformColor
+
+    if scale != 1:
+        imageCols = (numpy.arange(max(1, int(numCols * scale))) / 
+                     float(scale)).astype(int)
+        imageRows = (numpy.arange(max(1, int(numRows * scale))) / 
+                     float(scale)).astype(int)
+        pixels = pixels[imageCols[:, numpy.newaxis], 
+                        imageRows[numpy.newaxis, :]]
+    return pixels
+
+
+## Return a boolean grid, indexed by [x, y], marking the spaces of the map
+# that have the named environmental effect.
+def getEnvEffectMask(map, name):
+    result = numpy.zeros((map.numCols, map.numRows), bool)
+    (cols, rows) = numpy.nonzero(numpy.not_equal(map.envGrid, None))
+    for i, j in zip(cols.tolist(), rows.tolist()):
+        for effect in map.envGrid[i, j]:
+            if effect.name == name:
+                result[i, j] = True
+    return result
+
+
+## Return the color of the given TerrainInfo's region, as an (r, g, b) 
+# tuple.
+def getTerrainColor(map, terrain):
+    return tuple(map.zoneData[terrain.zone]['regions'][terrain.region]['color'][:3])
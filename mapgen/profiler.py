@@ -0,0 +1,144 @@
+import logger
+
+import os
+import time
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; we just won't report memory usage there.
+    resource = None
+
+## @package profiler
+# Instrumentation for map generation. Map.createMap() is broken up into
+# stages (marking regions, expanding seeds, etc.); a StageProfiler records,
+# for each stage, how long it took in wall-clock and CPU time, the peak
+# memory usage of the process by the time it finished, and a set of counts
+# that describe the size of the map at that point (number of cells, seeds,
+# tunnel edges, etc.). The results for one map can be written out as a JSON
+# report, and the reports for a batch of maps can be combined with
+# aggregateReports().
+
+
+## Tracks the stages of generating a single map.
+class StageProfiler:
+    ## \param getCounts Function that returns a dict of counts (e.g.
+    # {'seeds' : 1000}) describing the map. Called at the end of each stage.
+    def __init__(self, getCounts = None):
+        self.getCounts = getCounts
+        ## List of dicts, one per finished stage, in order. Each has the
+        # following keys:
+        # - name: name of the stage.
+        # - wallTime: seconds of wall-clock time taken.
+        # - cpuTime: seconds of user + system CPU time taken.
+        # - peakMemory: peak resident set size of the process, in kilobytes,
+        #   as of the end of the stage, or None if we can't tell.
+        # - counts: the result of getCounts() at the end of the stage.
+        self.stages = []
+        ## (name, wall time, CPU time) for the current stage, or None if no
+        # stage is running.
+        self.curStage = None
+
+
+    ## Finish the current stage, if any, and start a new one.
+    def startStage(self, name):
+        self.finishStage()
+        self.curStage = (name, time.time(), getCPUTime())
+
+
+    ## Record the current stage, if any.
+    def finishStage(self):
+        if self.curStage is None:
+            return
+        (name, startTime, startCPUTime) = self.curStage
+        self.curStage = None
+        counts = dict()
+        if self.getCounts is not None:
+            counts = self.getCounts()
+        self.stages.append({
+            'name' : name,
+            'wallTime' : time.time() - startTime,
+            'cpuTime' : getCPUTime() - startCPUTime,
+            'peakMemory' : getPeakMemory(),
+            'counts' : counts,
+        })
+
+
+    ## Return a list of (stage name, wall-clock seconds) pairs.
+    def getStageTimes(self):
+        return [(stage['name'], stage['wallTime']) for stage in self.stages]
+
+
+    ## Return the total wall-clock and CPU time taken by all finished stages.
+    def getTotals(self):
+        return (sum([stage['wallTime'] for stage in self.stages]),
+                sum([stage['cpuTime'] for stage in self.stages]))
+
+
+## Return the user + system CPU time used by this process so far.
+def getCPUTime():
+    times = os.times()
+    return times[0] + times[1]
+
+
+## Return the peak resident set size of this process so far, in kilobytes,
+# or None if that isn't available.
+def getPeakMemory():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+## Combine the stages of several per-map reports (dicts with a 'stages' key
+# holding StageProfiler.stages) into per-stage statistics. Returns a list of
+# dicts, one per stage in the order in which stages first appear, with the
+# stage's name, the number of maps it appeared in, the mean, minimum, and
+# maximum of wallTime and cpuTime, the maximum peakMemory, and the mean of
+# each count.
+def aggregateReports(reports):
+    stageNames = []
+    nameToStages = dict()
+    for report in reports:
+        for stage in report['stages']:
+            if stage['name'] not in nameToStages:
+                stageNames.append(stage['name'])
+                nameToStages[stage['name']] = []
+            nameToStages[stage['name']].append(stage)
+
+    result = []
+    for name in stageNames:
+        stages = nameToStages[name]
+        summary = {'name' : name, 'numMaps' : len(stages)}
+        for key in ['wallTime', 'cpuTime']:
+            values = [stage[key] for stage in stages]
+            summary[key] = {
+                'mean' : sum(values) / len(values),
+                'min' : min(values),
+                'max' : max(values),
+            }
+        memories = [stage['peakMemory'] for stage in stages
+                    if stage['peakMemory'] is not None]
+        summary['peakMemory'] = None
+        if memories:
+            summary['peakMemory'] = max(memories)
+        counts = dict()
+        for stage in stages:
+            for key, value in stage['counts'].iteritems():
+                counts[key] = counts.get(key, 0) + value
+        for key in counts:
+            counts[key] /= float(len(stages))
+        summary['counts'] = counts
+        result.append(summary)
+    return result
+
+
+## Log the per-stage statistics returned by aggregateReports().
+def logAggregate(summaries):
+    logger.inform("%-28s %10s %10s %10s %12s" % ("Stage", "mean wall",
+            "max wall", "mean CPU", "peak mem KB"))
+    for summary in summaries:
+        peakMemory = summary['peakMemory']
+        if peakMemory is None:
+            peakMemory = '?'
+        logger.inform("%-28s %9.3fs %9.3fs %9.3fs %12s" % (summary['name'],
+                summary['wallTime']['mean'], summary['wallTime']['max'],
+                summary['cpuTime']['mean'], peakMemory))
@@ -0,0 +1,126 @@
+import numpy
+
+## @package raster
+# Whole-grid operations on the numpy arrays used during map generation. Each
+# function here replaces a per-cell Python loop in mapgen.generator with a
+# handful of array operations, and is meant to produce exactly the same
+# result as the loop it replaces. Grids are indexed by [x, y], as with
+# Map.blocks.
+
+
+## Return the sums of every (2 * radius + 1)-wide window along the given axis
+# of the grid, centered on each cell. Cells past the edge of the grid
+# contribute nothing. This costs the same regardless of radius, since it works
+# off of a running total.
+def boxSum(grid, radius, axis):
+    grid = numpy.asarray(grid, numpy.int32)
+    length = grid.shape[axis]
+    padShape = list(grid.shape)
+    padShape[axis] = length + 2 * radius + 1
+    padded = numpy.zeros(padShape, numpy.int32)
+    # Leave one leading zero so that the difference of the running total
+    # gives us window sums directly.
+    index = [slice(None)] * grid.ndim
+    index[axis] = slice(radius + 1, radius + 1 + length)
+    padded[tuple(index)] = grid
+    totals = numpy.cumsum(padded, axis = axis)
+    upper = [slice(None)] * grid.ndim
+    upper[axis] = slice(2 * radius + 1, 2 * radius + 1 + length)
+    lower = [slice(None)] * grid.ndim
+    lower[axis] = slice(0, length)
+    return totals[tuple(upper)] - totals[tuple(lower)]
+
+
+## Return a boolean grid that is true for every cell within radius (in the
+# Chebyshev sense, i.e. a square of side 2 * radius + 1) of a true cell in
+# the provided mask. This is a binary dilation with a square kernel, done as
+# two separable passes.
+def dilate(mask, radius):
+    if radius <= 0:
+        return numpy.array(mask, bool)
+    sums = boxSum(mask, radius, 0)
+    sums = boxSum(sums != 0, radius, 1)
+    return sums != 0
+
+
+## Return an int16 grid holding the 9-bit adjacency signature of every cell,
+# in the format produced by util.adjacencyArrayToSignatures(): the neighbor
+# at offset (dx, dy) sets bit (dy + 1) * 3 + (dx + 1) when it is occupied.
+# Cells past the edge of the grid count as occupied.
+# \param occupied Boolean grid that is true for filled cells.
+def adjacencySignatures(occupied):
+    (numCols, numRows) = occupied.shape
+    padded = numpy.ones((numCols + 2, numRows + 2), numpy.int16)
+    padded[1:-1, 1:-1] = occupied
+    result = numpy.zeros((numCols, numRows), numpy.int16)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            bit = (dy + 1) * 3 + (dx + 1)
+            neighbors = padded[1 + dx : 1 + dx + numCols, 
+                               1 + dy : 1 + dy + numRows]
+            result |= neighbors << bit
+    return result
+
+
+## Label the 4-connected components of the true cells in the provided mask.
+# Returns a tuple of (labels, sizes). labels is an int32 grid holding, for
+# each cell in the mask, the index of its component, and -1 elsewhere. 
+# Components are numbered in the order in which their first cells are
+# reached by iterating over x and then y (i.e. in the order of 
+# Map.getIterBlocks()). sizes holds the number of cells in each component.
+# \param keys Optional grid; if provided, adjacent cells are only connected
+# if their keys are equal (e.g. for finding areas with the same owner).
+def labelComponents(mask, keys = None):
+    mask = numpy.asarray(mask, bool)
+    (numCols, numRows) = mask.shape
+    labels = numpy.empty((numCols, numRows), numpy.int32)
+    labels.fill(-1)
+    if not mask.any():
+        return (labels, numpy.zeros(0, numpy.int32))
+
+    # First pass: split each column into runs of connected cells.
+    isRunStart = mask.copy()
+    isConnected = mask[:, 1:] & mask[:, :-1]
+    if keys is not None:
+        isConnected &= keys[:, 1:] == keys[:, :-1]
+    isRunStart[:, 1:] &= ~isConnected
+    runIds = numpy.cumsum(isRunStart.ravel()).reshape(mask.shape) - 1
+    numRuns = int(runIds[-1, -1]) + 1
+
+    # Find the pairs of runs that touch across adjacent columns.
+    isConnected = mask[1:, :] & mask[:-1, :]
+    if keys is not None:
+        isConnected &= keys[1:, :] == keys[:-1, :]
+    left = runIds[:-1, :][isConnected]
+    right = runIds[1:, :][isConnected]
+
+    # Second pass: merge touching runs. Each run points at the lowest run ID
+    # it is known to be connected to; repeatedly hook the roots of touching
+    # runs together and flatten the result until nothing changes.
+    parents = numpy.arange(numRuns)
+    if len(left):
+        pairs = numpy.unique(left * numRuns + right)
+        left = pairs // numRuns
+        right = pairs % numRuns
+        while True:
+            leftRoots = parents[left]
+            rightRoots = parents[right]
+            if numpy.array_equal(leftRoots, rightRoots):
+                break
+            lowest = numpy.minimum(leftRoots, rightRoots)
+            numpy.minimum.at(parents, leftRoots, lowest)
+            numpy.minimum.at(parents, rightRoots, lowest)
+            while True:
+                grandparents = parents[parents]
+                if numpy.array_equal(grandparents, parents):
+                    break
+                parents = grandparents
+
+    # Run IDs increase in iteration order and each component's root is its
+    # lowest run ID, so numbering the roots in sorted order numbers the
+    # components by their first cells.
+    (roots, runLabels) = numpy.unique(parents, return_inverse = True)
+    labels[mask] = runLabels[runIds[mask]]
+    sizes = numpy.bincount(labels[mask], minlength = len(roots))
+    return (labels, sizes.astype(numpy.int32))
+
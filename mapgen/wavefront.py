@@ -0,0 +1,207 @@
+import constants
+import generator
+
+import numpy
+
+## @package wavefront
+# An alternative engine for the spacefilling automaton in
+# Map.expandSeeds(). Instead of keeping a dict of Seed instances keyed by
+# Vector2D and allocating new Seeds and perimeter vectors for every cell in
+# every generation, it keeps owner ID, life, and age rasters for the live
+# seeds and the next generation of seeds, and an owner ID raster for the dead
+# seeds, and steps the frontier using flat indices into those rasters.
+#
+# The automaton is sensitive to the order in which seeds are processed within
+# a generation (e.g. which of two seeds gets to plant a given cell first), and
+# the original processes them in dict iteration order. To produce exactly the
+# same walls and dead seeds, we record each generation's frontier in a dict
+# whose integer keys hash the same as the Vector2D keys the original uses;
+# since the sequence of insertions is the same, so is the iteration order.
+#
+# The rasters are flat lists indexed by x * numRows + y; element access on
+# lists is considerably faster than on numpy arrays when done from Python.
+
+## Owner ID for cells that have no seed.
+NO_OWNER = -1
+
+## Offsets to the neighbors of a cell, in the same order as
+# Vector2D.perimeter().
+perimeterOffsets = [(0, -1), (1, -1), (1, 0), (1, 1),
+                    (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+
+
+## Expand the provided seeds across the provided grid; see Map.expandSeeds()
+# for a description of the automaton. Returns a tuple of the modified grid, an
+# int32 grid of the IDs of the owners of the dead seeds (NO_OWNER where there
+# are none), and a list mapping those IDs to the owners themselves. Seeds 
+# that start out of bounds are ignored.
+# \param seeds A mapping of locations to Seed instances
+# \param blocks A numpy grid of BLOCK_* values
+def expandSeeds(seeds, blocks):
+    BLOCK_EMPTY = generator.BLOCK_EMPTY
+    BLOCK_UNALLOCATED = generator.BLOCK_UNALLOCATED
+    BLOCK_WALL = generator.BLOCK_WALL
+    (numCols, numRows) = blocks.shape
+    numCells = numCols * numRows
+    maxX = numCols - 1
+    maxY = numRows - 1
+
+    # Owners are compared by equality, so equal owners share an ID.
+    owners = []
+    ownerToId = dict()
+
+    cells = blocks.ravel().tolist()
+    curOwner = [NO_OWNER] * numCells
+    curLife = [0] * numCells
+    curAge = [0] * numCells
+    nextOwner = [NO_OWNER] * numCells
+    nextLife = [0] * numCells
+    nextAge = [0] * numCells
+    deadOwner = [NO_OWNER] * numCells
+
+    frontier = []
+    for loc, curSeed in seeds.iteritems():
+        (x, y) = (loc.ix, loc.iy)
+        if x < 0 or x > maxX or y < 0 or y > maxY:
+            continue
+        if curSeed.owner not in ownerToId:
+            ownerToId[curSeed.owner] = len(owners)
+            owners.append(curSeed.owner)
+        p = x * numRows + y
+        curOwner[p] = ownerToId[curSeed.owner]
+        curLife[p] = curSeed.life
+        curAge[p] = curSeed.age
+        frontier.append(p)
+
+    offsets = [dx * numRows + dy for (dx, dy) in perimeterOffsets]
+    while frontier:
+        nextOrder = dict()
+        for p in frontier:
+            owner = curOwner[p]
+            if curLife[p] <= 0 and cells[p] != BLOCK_EMPTY:
+                # The counter expired while the seed is not in open space;
+                # replace it with a wall.
+                deadOwner[p] = owner
+                cells[p] = BLOCK_WALL
+                continue
+
+            x = p // numRows
+            y = p - x * numRows
+            if 0 < x < maxX and 0 < y < maxY:
+                neighbors = [p + offset for offset in offsets]
+            else:
+                neighbors = []
+                for (dx, dy) in perimeterOffsets:
+                    if 0 <= x + dx <= maxX and 0 <= y + dy <= maxY:
+                        neighbors.append(p + dx * numRows + dy)
+
+            if cells[p] == BLOCK_WALL:
+                # A wall sprung up under us. If there's a dead seed here, try
+                # to merge with it, and carry on expanding either way.
+                if deadOwner[p] == NO_OWNER:
+                    continue
+                if getCanMergeDeadSeed(owner, p, neighbors,
+                        curOwner, deadOwner):
+                    addToOrder(nextOrder, p, numRows)
+                    nextOwner[p] = owner
+                    nextLife[p] = curLife[p] - 1
+                    nextAge[p] = curAge[p] + 1
+                    deadOwner[p] = NO_OWNER
+                    cells[p] = BLOCK_UNALLOCATED
+
+            if cells[p] == BLOCK_EMPTY:
+                # No seeds on empty space
+                deadOwner[p] = owner
+                continue
+
+            for q in neighbors:
+                if curOwner[q] != NO_OWNER or nextOwner[q] != NO_OWNER:
+                    # Two adjacent seeds; either merge or make wall. Seeds
+                    # in the current generation take precedence.
+                    if curOwner[q] != NO_OWNER:
+                        (altOwner, altLife, altAge) = (curOwner[q],
+                                curLife[q], curAge[q])
+                    else:
+                        (altOwner, altLife, altAge) = (nextOwner[q],
+                                nextLife[q], nextAge[q])
+                    if altOwner == owner:
+                        # Merge the seeds
+                        addToOrder(nextOrder, q, numRows)
+                        nextOwner[q] = owner
+                        nextLife[q] = max(curLife[p], altLife) - 1
+                        nextAge[q] = max(curAge[p], altAge) + 1
+                    else:
+                        # Conflict; make a wall.
+                        if curOwner[q] != NO_OWNER:
+                            curLife[q] = 0
+                            curAge[q] = constants.BIGNUM
+                        else:
+                            nextLife[q] = 0
+                            nextAge[q] = constants.BIGNUM
+                        curLife[p] = 0
+                        curAge[p] = constants.BIGNUM
+                        cells[p] = BLOCK_WALL
+                        cells[q] = BLOCK_WALL
+                elif cells[p] == BLOCK_UNALLOCATED:
+                    # No seed there; plant one.
+                    addToOrder(nextOrder, q, numRows)
+                    nextOwner[q] = owner
+                    nextLife[q] = curLife[p] - 1
+                    nextAge[q] = curAge[p] + 1
+                elif cells[q] != BLOCK_EMPTY and deadOwner[q] != NO_OWNER:
+                    # Hit a wall containing a dead seed; try to merge with it.
+                    qx = q // numRows
+                    qy = q - qx * numRows
+                    qNeighbors = []
+                    for (dx, dy) in perimeterOffsets:
+                        if 0 <= qx + dx <= maxX and 0 <= qy + dy <= maxY:
+                            qNeighbors.append(q + dx * numRows + dy)
+                    if getCanMergeDeadSeed(owner, q, qNeighbors,
+                            curOwner, deadOwner):
+                        addToOrder(nextOrder, q, numRows)
+                        nextOwner[q] = owner
+                        nextLife[q] = curLife[p] - 1
+                        nextAge[q] = curAge[p] + 1
+                        deadOwner[q] = NO_OWNER
+                        cells[q] = BLOCK_UNALLOCATED
+
+            # Done expanding; zero our location if we didn't wall it earlier.
+            if cells[p] != BLOCK_WALL:
+                cells[p] = BLOCK_EMPTY
+            deadOwner[p] = owner
+
+        # Advance to the next generation.
+        for p in frontier:
+            curOwner[p] = NO_OWNER
+        (curOwner, nextOwner) = (nextOwner, curOwner)
+        (curLife, nextLife) = (nextLife, curLife)
+        (curAge, nextAge) = (nextAge, curAge)
+        frontier = nextOrder.values()
+
+    blocks.flat[:] = cells
+    ownerGrid = numpy.array(deadOwner, numpy.int32).reshape(blocks.shape)
+    return (blocks, ownerGrid, owners)
+
+
+## Record that a seed has been created at the given index in the next
+# generation. The key has the same hash as the corresponding Vector2D.
+def addToOrder(order, p, numRows):
+    x = p // numRows
+    key = (x << 20) ^ (p - x * numRows)
+    if key not in order:
+        order[key] = p
+
+
+## Return true if a seed with the given owner can merge with the dead seed at
+# the given index: the dead seed must have the same owner, and no live or
+# dead seed around it may have a different one.
+def getCanMergeDeadSeed(owner, p, neighbors, curOwner, deadOwner):
+    if deadOwner[p] != owner:
+        return False
+    for q in neighbors:
+        if curOwner[q] != NO_OWNER and curOwner[q] != owner:
+            return False
+        if deadOwner[q] != NO_OWNER and deadOwner[q] != owner:
+            return False
+    return True
+
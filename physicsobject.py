@@ -57,6 +57,10 @@ class PhysicsObject:
         self.health = constants.BIGNUM
         ## Current state for movement logic
         self.state = objectstate.ObjectState(self)
+        ## LooseQuadTree node that holds us, if any; set by the tree.
+        self.treeNode = None
+        ## Our index in self.treeNode.objects; set by the tree.
+        self.treeIndex = None
 
 
     ## Set a new state for our movement logic.
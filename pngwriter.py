@@ -0,0 +1,63 @@
+import logger
+
+import struct
+import zlib
+import numpy
+
+## @package pngwriter This package writes PNG images a few rows at a time, so
+# that images far too big to hold in memory (or in a PyGame Surface) can 
+# still be saved. Only 8-bit RGBA images are supported.
+
+## The first eight bytes of every PNG file.
+pngSignature = '\x89PNG\r\n\x1a\n'
+
+## Writes a PNG file from the top down.
+class PNGWriter:
+    ## Open the file and write the PNG header. 
+    def __init__(self, filename, width, height):
+        self.width = width
+        self.height = height
+        ## Number of rows passed to writeRows() so far.
+        self.numRowsWritten = 0
+        self.compressor = zlib.compressobj()
+        self.fh = open(filename, 'wb')
+        self.fh.write(pngSignature)
+        # 8 bits per channel, RGBA, default compression and filtering, no 
+        # interlacing.
+        self.writeChunk('IHDR', struct.pack('>IIBBBBB', width, height, 
+                                            8, 6, 0, 0, 0))
+
+
+    ## Append rows to the image. 
+    # \param rows A uint8 numpy array of shape (number of rows, width, 4).
+    def writeRows(self, rows):
+        if self.numRowsWritten + len(rows) > self.height:
+            logger.fatal("Tried to write",self.numRowsWritten + len(rows),
+                         "rows to a PNG with only",self.height,"rows")
+        # Each row is prefixed with its filter type, which is always 0 (no 
+        # filtering).
+        data = numpy.zeros((len(rows), 1 + self.width * 4), numpy.uint8)
+        data[:, 1:] = rows.reshape(len(rows), self.width * 4)
+        compressed = self.compressor.compress(data.tostring())
+        if compressed:
+            self.writeChunk('IDAT', compressed)
+        self.numRowsWritten += len(rows)
+
+
+    ## Finish the image and close the file.
+    def close(self):
+        if self.numRowsWritten != self.height:
+            logger.fatal("Closed a PNG after writing",self.numRowsWritten,
+                         "of its",self.height,"rows")
+        self.writeChunk('IDAT', self.compressor.flush())
+        self.writeChunk('IEND', '')
+        self.fh.close()
+
+
+    ## Write a single PNG chunk of the given type.
+    def writeChunk(self, type, data):
+        self.fh.write(struct.pack('>I', len(data)))
+        self.fh.write(type)
+        self.fh.write(data)
+        checksum = zlib.crc32(data, zlib.crc32(type))
+        self.fh.write(struct.pack('>I', checksum & 0xffffffff))
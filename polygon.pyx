@@ -1,26 +1,47 @@
 import constants
 import util
-import range1d
 from vector2d cimport Vector2D
 from range1d cimport Range1D
 import logger
 import pygame
 
-## Maximum number of already-calculated projections onto vectors that we 
-# should cache for this polygon.
-maxCachedProjections = 30
+from stdlib cimport malloc, free
+
+cdef extern from "math.h":
+    double fabs(double x)
+
+cdef double epsilon = constants.EPSILON
+cdef double bigNum = constants.BIGNUM
+
+## Result of colliding two polygons that don't overlap.
+noCollision = (0, None)
 
 ## The Polygon class represents convex bounding polygons used for collision 
-# detection.
+# detection. Besides the list of points, each polygon keeps its points, the
+# vectors it is projected onto for SAT, and its projections onto those vectors
+# in C arrays, so that collision detection doesn't need to make any Python 
+# objects until it has a result.
+#
+# Polygons whose edges are all horizontal or vertical (like most terrain 
+# blocks) are flagged as axis-aligned boxes. SAT against a box only uses the 
+# box's own projection vectors, which are the X and Y axes, and the 
+# projection of any polygon onto those is just its bounding box; so collisions
+# against boxes skip projecting the other polygon's points, while giving 
+# exactly the same results as the general test.
 cdef class Polygon:
     cdef list points
     cdef public bool hit
     cdef list projectionVectors
-    cdef dict vectorToProjectionCache
-    cdef int projectionCacheUseCounter
     cdef public Vector2D upperLeft
     cdef public Vector2D lowerRight
     cdef rect
+    cdef int numPoints
+    cdef double *coords
+    cdef double *axes
+    cdef double *axisMins
+    cdef double *axisMaxes
+    cdef double minX, minY, maxX, maxY
+    cdef readonly bint isAxisAlignedBox
     def __init__(self, points):
         ## Array of points in the polygon. 
         self.points = points
@@ -71,10 +92,219 @@ cdef class Polygon:
             vector = prevPoint.sub(point).normalize().invert()
             self.projectionVectors.append(vector)
             prevPoint = point
-        ## Cache of vectors we've been projected onto in the past.
-        self.vectorToProjectionCache = dict()
-        ## Incrementing counter to track how old elements in the cache are.
-        self.projectionCacheUseCounter = 0
+        self.makeArrays()
+
+
+    ## Copy our points and projection vectors into C arrays, and project 
+    # ourselves onto each of the projection vectors. Also work out our 
+    # bounding box, and if we are an axis-aligned box.
+    cdef void makeArrays(Polygon self):
+        cdef int i
+        cdef Vector2D vector
+        self.numPoints = len(self.points)
+        ## X and Y coordinates of each point, interleaved.
+        self.coords = <double *>malloc(2 * self.numPoints * sizeof(double))
+        ## X and Y components of each projection vector, interleaved.
+        self.axes = <double *>malloc(2 * self.numPoints * sizeof(double))
+        ## Range of our projection onto each projection vector, when we are
+        # at the origin.
+        self.axisMins = <double *>malloc(self.numPoints * sizeof(double))
+        self.axisMaxes = <double *>malloc(self.numPoints * sizeof(double))
+        for i from 0 <= i < self.numPoints:
+            vector = self.points[i]
+            self.coords[2 * i] = vector.x
+            self.coords[2 * i + 1] = vector.y
+            vector = self.projectionVectors[i]
+            self.axes[2 * i] = vector.x
+            self.axes[2 * i + 1] = vector.y
+        for i from 0 <= i < self.numPoints:
+            self.project(self.axes[2 * i], self.axes[2 * i + 1],
+                         &self.axisMins[i], &self.axisMaxes[i])
+
+        ## Bounding box, when we are at the origin.
+        self.minX = self.minY = bigNum
+        self.maxX = self.maxY = -bigNum
+        ## True if all of our projection vectors lie exactly along the X or 
+        # Y axis; see collideBox().
+        self.isAxisAlignedBox = self.numPoints > 0
+        for i from 0 <= i < self.numPoints:
+            if self.coords[2 * i] < self.minX:
+                self.minX = self.coords[2 * i]
+            if self.coords[2 * i] > self.maxX:
+                self.maxX = self.coords[2 * i]
+            if self.coords[2 * i + 1] < self.minY:
+                self.minY = self.coords[2 * i + 1]
+            if self.coords[2 * i + 1] > self.maxY:
+                self.maxY = self.coords[2 * i + 1]
+            if self.axes[2 * i] != 0 and self.axes[2 * i + 1] != 0:
+                self.isAxisAlignedBox = False
+
+
+    def __dealloc__(self):
+        if self.coords != NULL:
+            free(self.coords)
+            free(self.axes)
+            free(self.axisMins)
+            free(self.axisMaxes)
+
+
+    ## Project our points, assuming we are at the origin, onto the vector
+    # (vx, vy), and store the range that they cover in rangeMin and rangeMax.
+    cdef void project(Polygon self, double vx, double vy, 
+                      double *rangeMin, double *rangeMax):
+        cdef int i
+        cdef double component
+        rangeMin[0] = bigNum
+        rangeMax[0] = -bigNum
+        for i from 0 <= i < self.numPoints:
+            component = getComponent(self.coords[2 * i], 
+                                     self.coords[2 * i + 1], vx, vy)
+            if component < rangeMin[0]:
+                rangeMin[0] = component
+            if component > rangeMax[0]:
+                rangeMax[0] = component
+
+
+    ## Run SAT between us at (myX, myY) and alt at (altX, altY); see 
+    # runSAT(). Return false if they don't collide. Otherwise, return true 
+    # and store the overlap and the ejection vector in the given pointers.
+    cdef bint collide(Polygon self, double myX, double myY, 
+                      Polygon alt, double altX, double altY,
+                      double *overlapResult, double *vxResult, 
+                      double *vyResult):
+        if self.isAxisAlignedBox:
+            return self.collideBox(myX, myY, alt, altX, altY, 
+                                   overlapResult, vxResult, vyResult)
+        return self.collideConvex(myX, myY, alt, altX, altY, 
+                                  overlapResult, vxResult, vyResult)
+
+
+    ## As collide(), for any convex polygon.
+    cdef bint collideConvex(Polygon self, double myX, double myY, 
+                            Polygon alt, double altX, double altY,
+                            double *overlapResult, double *vxResult, 
+                            double *vyResult):
+        cdef int i
+        cdef int bestAxis = -1
+        cdef double smallestOverlap = bigNum
+        cdef double vx, vy, myOffset, altOffset
+        cdef double altMin, altMax, overlap
+        for i from 0 <= i < self.numPoints:
+            vx = self.axes[2 * i]
+            vy = self.axes[2 * i + 1]
+            myOffset = getComponent(myX, myY, vx, vy)
+            alt.project(vx, vy, &altMin, &altMax)
+            altOffset = getComponent(altX, altY, vx, vy)
+            overlap = getOverlap(self.axisMins[i] + myOffset, 
+                                 self.axisMaxes[i] + myOffset, 
+                                 altMin + altOffset, altMax + altOffset)
+            if overlap < epsilon:
+                # Non-overlap means no collision
+                return False
+            if overlap < smallestOverlap:
+                smallestOverlap = overlap
+                bestAxis = i
+        if bestAxis == -1:
+            return False
+        self.hit = True
+        alt.hit = True
+        vx = self.axes[2 * bestAxis]
+        vy = self.axes[2 * bestAxis + 1]
+        # The projection vectors may be pointing in the wrong direction; 
+        # flip the vector if needed. Check by comparing the overlap if we 
+        # move alt along the vector to the overlap we've already obtained.
+        myOffset = getComponent(myX, myY, vx, vy)
+        alt.project(vx, vy, &altMin, &altMax)
+        altOffset = getComponent(altX + vx, altY + vy, vx, vy)
+        overlap = getOverlap(self.axisMins[bestAxis] + myOffset,
+                             self.axisMaxes[bestAxis] + myOffset,
+                             altMin + altOffset, altMax + altOffset)
+        if overlap > smallestOverlap:
+            vx = -vx
+            vy = -vy
+        overlapResult[0] = smallestOverlap
+        vxResult[0] = vx
+        vyResult[0] = vy
+        return True
+
+
+    ## As collide(), for when we are an axis-aligned box. This follows 
+    # collideConvex() step for step, but since one component of each of our 
+    # projection vectors is exactly 0, getComponent() reduces to dividing 
+    # the other coordinate by the other component, and alt's projection is 
+    # the matching side of its bounding box (in reverse for negative 
+    # vectors). The arithmetic is the same, so the results are too.
+    cdef bint collideBox(Polygon self, double myX, double myY, 
+                         Polygon alt, double altX, double altY,
+                         double *overlapResult, double *vxResult, 
+                         double *vyResult):
+        cdef int i
+        cdef int bestAxis = -1
+        cdef double smallestOverlap = bigNum
+        cdef double vx, vy, myOffset, altOffset
+        cdef double altMin, altMax, overlap
+        for i from 0 <= i < self.numPoints:
+            vx = self.axes[2 * i]
+            vy = self.axes[2 * i + 1]
+            if vy == 0:
+                myOffset = myX / vx
+                altOffset = altX / vx
+            else:
+                myOffset = myY / vy
+                altOffset = altY / vy
+            alt.projectExtents(vx, vy, &altMin, &altMax)
+            overlap = getOverlap(self.axisMins[i] + myOffset, 
+                                 self.axisMaxes[i] + myOffset, 
+                                 altMin + altOffset, altMax + altOffset)
+            if overlap < epsilon:
+                return False
+            if overlap < smallestOverlap:
+                smallestOverlap = overlap
+                bestAxis = i
+        if bestAxis == -1:
+            return False
+        self.hit = True
+        alt.hit = True
+        vx = self.axes[2 * bestAxis]
+        vy = self.axes[2 * bestAxis + 1]
+        if vy == 0:
+            myOffset = myX / vx
+            altOffset = (altX + vx) / vx
+        else:
+            myOffset = myY / vy
+            altOffset = (altY + vy) / vy
+        alt.projectExtents(vx, vy, &altMin, &altMax)
+        overlap = getOverlap(self.axisMins[bestAxis] + myOffset,
+                             self.axisMaxes[bestAxis] + myOffset,
+                             altMin + altOffset, altMax + altOffset)
+        if overlap > smallestOverlap:
+            vx = -vx
+            vy = -vy
+        overlapResult[0] = smallestOverlap
+        vxResult[0] = vx
+        vyResult[0] = vy
+        return True
+
+
+    ## Project our bounding box, assuming we are at the origin, onto the 
+    # vector (vx, vy), one of whose components must be exactly 0, and store 
+    # the range that it covers in rangeMin and rangeMax. This is the same
+    # range that project() would find.
+    cdef void projectExtents(Polygon self, double vx, double vy,
+                             double *rangeMin, double *rangeMax):
+        if vy == 0:
+            if vx > 0:
+                rangeMin[0] = self.minX / vx
+                rangeMax[0] = self.maxX / vx
+            else:
+                rangeMin[0] = self.maxX / vx
+                rangeMax[0] = self.minX / vx
+        elif vy > 0:
+            rangeMin[0] = self.minY / vy
+            rangeMax[0] = self.maxY / vy
+        else:
+            rangeMin[0] = self.maxY / vy
+            rangeMax[0] = self.minY / vy
 
 
     ## Use the Separating Axis Theorem to collide two convex polygons.
@@ -83,40 +313,51 @@ cdef class Polygon:
     # moved distance * vector then it would no longer overlap.
     cpdef public tuple runSAT(Polygon self, Vector2D myLoc, 
                               Polygon alt, Vector2D altLoc):
-        projectionVectors = self.getProjectionVectors()
-
-        cdef:
-            double smallestOverlap = constants.BIGNUM
-            Vector2D overlapVector = None
-            Vector2D displacedLoc
-            Range1D range1
-            Range1D range2
-            double overlap
-        for vector in projectionVectors:
-            range1 = self.projectOntoVector(myLoc, vector)
-            range2 = alt.projectOntoVector(altLoc, vector)
-            overlap = range1.getOverlap(range2)
-            if overlap < constants.EPSILON:
-                # Non-overlap means no collision
-                return (0, None)
-            if overlap < smallestOverlap:
-                smallestOverlap = overlap
-                overlapVector = vector
-        if overlapVector is not None:
-            self.hit = True
-            alt.hit = True
-            # The projection vectors may be pointing in the wrong direction; 
-            # flip the vector if needed. Check by comparing the overlap 
-            # if we move alt along overlapVector to the overlap we've already
-            # obtained.
-            displacedLoc = altLoc.add(overlapVector)
-            range1 = self.projectOntoVector(myLoc, overlapVector)
-            range2 = alt.projectOntoVector(displacedLoc, overlapVector)
-            if range1.getOverlap(range2) > smallestOverlap:
-                # overlapVector points in the wrong direction.
-                overlapVector = overlapVector.multiply(-1)
-
-        return (smallestOverlap, overlapVector)
+        cdef double overlap, vx, vy
+        if self.numPoints == 0:
+            return (bigNum, None)
+        if not self.collide(myLoc.x, myLoc.y, alt, altLoc.x, altLoc.y,
+                            &overlap, &vx, &vy):
+            return noCollision
+        return (overlap, Vector2D(vx, vy))
+
+
+    ## As runSAT(), but always use the general test, even if we are an 
+    # axis-aligned box. Only useful for checking the box test against.
+    cpdef public tuple runFullSAT(Polygon self, Vector2D myLoc, 
+                                  Polygon alt, Vector2D altLoc):
+        cdef double overlap, vx, vy
+        if self.numPoints == 0:
+            return (bigNum, None)
+        if not self.collideConvex(myLoc.x, myLoc.y, alt, altLoc.x, altLoc.y,
+                                  &overlap, &vx, &vy):
+            return noCollision
+        return (overlap, Vector2D(vx, vy))
+
+
+    ## Collide us, at loc, against each of the given polygons at the 
+    # corresponding locations in alts, as if by calling 
+    # alts[i].runSAT(altLocs[i], self, loc) for each i. Return a list of the
+    # resulting (distance, vector) tuples. Vectors are only made for polygons
+    # that we hit.
+    cpdef public list runSATBatch(Polygon self, Vector2D loc, 
+                                  list alts, list altLocs):
+        cdef int i
+        cdef double overlap, vx, vy
+        cdef Polygon alt
+        cdef Vector2D altLoc
+        cdef list result = []
+        for i from 0 <= i < len(alts):
+            alt = alts[i]
+            altLoc = altLocs[i]
+            if alt.numPoints == 0:
+                result.append((bigNum, None))
+            elif alt.collide(altLoc.x, altLoc.y, self, loc.x, loc.y,
+                             &overlap, &vx, &vy):
+                result.append((overlap, Vector2D(vx, vy)))
+            else:
+                result.append(noCollision)
+        return result
 
 
     cpdef public list getProjectionVectors(Polygon self):
@@ -126,32 +367,10 @@ cdef class Polygon:
     ## Project us onto the given vector assuming we are at loc. Return the 
     # range (min, max) along the vector formed by that projection.
     cpdef public Range1D projectOntoVector(Polygon self, Vector2D loc, Vector2D vector):
-        cdef Range1D result
-        if vector in self.vectorToProjectionCache:
-            result = self.vectorToProjectionCache[vector]['result']
-            return result.addScalar(loc.getComponentOn(vector))
-        result = range1d.Range1D()
-        for point in self.points:
-            distanceFromOrigin = point.getComponentOn(vector)
-            result = result.extend(distanceFromOrigin)
-        
-        self.vectorToProjectionCache[vector] = {
-            'use' : self.projectionCacheUseCounter,
-            'result' : result
-        }
-        self.projectionCacheUseCounter += 1
-        if len(self.vectorToProjectionCache) > maxCachedProjections:
-            logger.inform("Cache has grown too big")
-            oldestProjectionVector = None
-            oldestUse = self.projectionCacheUseCounter
-            for key, projectionData in self.vectorToProjectionCache.iteritems():
-                if projectionData['use'] < oldestUse:
-                    oldestUse = projectionData['use']
-                    oldestProjectionVector = key
-            logger.inform("Removing entry for",oldestProjectionVector)
-            del self.vectorToProjectionCache[oldestProjectionVector]
-        return result.addScalar(loc.getComponentOn(vector))
-        return result
+        cdef double rangeMin, rangeMax
+        cdef double offset = getComponent(loc.x, loc.y, vector.x, vector.y)
+        self.project(vector.x, vector.y, &rangeMin, &rangeMax)
+        return Range1D(rangeMin + offset, rangeMax + offset)
 
 
     ## Return the ejection distance of the given polygon out of ourselves along
@@ -264,3 +483,32 @@ cdef class Polygon:
         return result
 
 
+## Return the multiplier of the vector (vx, vy) that gets it closest to the
+# point (x, y); this matches Vector2D.getComponentOn().
+cdef inline double getComponent(double x, double y, double vx, double vy):
+    cdef double slope
+    if fabs(vx) > epsilon:
+        slope = vy / vx
+        return (slope * y + x) / (slope * slope + 1) / vx
+    return y / vy
+
+
+## Return the amount of overlap between the ranges [min1, max1] and 
+# [min2, max2]; this matches Range1D.getOverlap().
+cdef inline double getOverlap(double min1, double max1, 
+                              double min2, double max2):
+    if max1 >= min2 and max1 <= max2 and min1 <= min2:
+        return max1 - min2
+    elif max2 >= min1 and max2 <= max1 and min2 <= min1:
+        return max2 - min1
+    elif max1 >= min2 and max1 <= max2 and min1 >= min2 and min1 <= max2:
+        if max2 - min1 < max1 - min2:
+            return max2 - min1
+        return max1 - min2
+    elif max2 >= min1 and max2 <= max1 and min2 >= min1 and min2 <= max1:
+        if max1 - min2 < max2 - min1:
+            return max1 - min2
+        return max2 - min1
+    elif fabs(max1 - max2) <= epsilon and fabs(min1 - min2) <= epsilon:
+        return max1 - min1
+    return -1
@@ -241,24 +241,16 @@ class QuadTree:
 
     ## Draw the objects in this node and all children, that intersect with the 
     # current view.
-    # \todo The culling of what to draw doesn't take into account zoom factors.
-    # \param shouldPrune True if we should cull objects that we don't think are
-    #        visible. We turn this off for drawing the entire map.
-    def draw(self, progress, shouldPrune = True):
-        screenRect = None
-        if shouldPrune:
-            # Generate a rect to prune out objects not in the view.
-            screenRect = pygame.rect.Rect(0, 0, constants.sw, constants.sh)
-            screenRect.center = game.camera.getDrawLoc().tuple()
-            size = Vector2D(screenRect.bottomright).sub(Vector2D(screenRect.topleft))
-            screenRect.width = size.x
-            screenRect.height = size.y
+    # \param viewRect Rect of the visible part of the world, in realspace (see
+    #        Camera.getViewRect()), used to cull objects that aren't visible.
+    #        If None, everything is drawn (e.g. for drawing the entire map).
+    def draw(self, progress, viewRect = None):
         for object in self.objects:
-            if not shouldPrune or object.getBounds().colliderect(screenRect):
+            if viewRect is None or object.getBounds().colliderect(viewRect):
                 object.draw(progress)
         for child in self.children:
-            if not shouldPrune or child.rect.colliderect(screenRect):
-                child.draw(progress, shouldPrune)
+            if viewRect is None or child.rect.colliderect(viewRect):
+                child.draw(progress, viewRect)
             
 
     ## Remove the specified object from the tree. Return True if we deleted it;
@@ -314,3 +306,241 @@ class QuadTree:
                 str(Vector2D(self.rect.bottomright)) +
                 ' with ' + str(len(self.objects)) + ' objects here and ' + 
                 str(len(self.getObjects())) + ' objects overall]')
+
+
+
+## Factor by which the bounds of a LooseQuadTree node are scaled up, about
+# the node's center, to get its loose bounds. At 2, any object no bigger than
+# a node fits in that node's loose bounds wherever its center is.
+looseness = 2
+
+
+## LooseQuadTree is a variant of QuadTree for objects that move around every
+# frame. Each node accepts any object whose bounding rect is inside the node's
+# loose bounds (its rect scaled up by looseness), and objects are placed in
+# the child whose rect holds their center, so objects that straddle the
+# midpoint of a node don't get stuck there. Each object records the node that
+# holds it (as object.treeNode) and its index in that node's list of objects
+# (as object.treeIndex), so removing an object doesn't need to search the
+# tree, and a moved object only has to be relocated when it leaves its node's
+# loose bounds. Children are made as they are needed, and each node counts
+# the objects in it and its descendants, so that traversals can skip empty
+# parts of the tree. LooseQuadTree implements the broadphase interface used by
+# the gameobjectmanager module. It isn't a subclass of QuadTree, since 
+# QuadTree's methods for updating and rebalancing the tree shuffle objects 
+# between nodes without keeping that bookkeeping up to date.
+class LooseQuadTree:
+
+    def __init__(self, rect, parent = None, depth = 0):
+        self.id = constants.globalId
+        constants.globalId += 1
+        ## Bounding box for the node, used to pick which child an object 
+        # goes in.
+        self.rect = rect
+        ## Loose bounding box for the node; unless the node is the root of the
+        # tree, no objects in the node will extend beyond these bounds.
+        self.looseRect = getLooseRect(rect)
+        ## List of children of this node. Empty until an object needs to be 
+        # pushed down into them.
+        self.children = []
+        ## Rects for the children of this node, in the same order as
+        # self.children. Empty if the node is too small to be split.
+        self.childRects = []
+        if self.rect.width > minCellDim:
+            dims = (self.rect.width / 2.0, self.rect.height / 2.0)
+            self.childRects = [
+                pygame.rect.Rect(self.rect.topleft, dims),
+                pygame.rect.Rect(self.rect.midtop, dims),
+                pygame.rect.Rect(self.rect.midleft, dims),
+                pygame.rect.Rect(self.rect.center, dims)
+            ]
+        ## Loose bounding boxes for the children of this node.
+        self.childLooseRects = [getLooseRect(childRect) 
+                                for childRect in self.childRects]
+        ## Parent node. If this is the root, then parent is None.
+        self.parent = parent
+        ## Depth in the tree.
+        self.depth = depth
+        ## List of objects in this node.
+        self.objects = []
+        ## Number of objects in this node and all of its descendants.
+        self.numObjects = 0
+
+
+    ## Create four children for this node.
+    def extendTree(self):
+        for rect in self.childRects:
+            self.children.append(LooseQuadTree(rect, self, self.depth + 1))
+
+
+    ## Add an object to the tree, as deep as it will go below this node.
+    def addObject(self, object):
+        self.insertObject(object, object.getBounds())
+
+
+    ## Add many objects by iteratively calling self.addObject().
+    def addObjects(self, objects):
+        for object in objects:
+            self.addObject(object)
+
+
+    ## Add an object with the given bounds to the deepest node, at or below 
+    # this one, that can hold it.
+    def insertObject(self, object, bounds):
+        node = self
+        index = node.getChildIndexFor(bounds)
+        while index is not None:
+            if not node.children:
+                node.extendTree()
+            node = node.children[index]
+            index = node.getChildIndexFor(bounds)
+        object.treeNode = node
+        object.treeIndex = len(node.objects)
+        node.objects.append(object)
+        while node is not None:
+            node.numObjects += 1
+            node = node.parent
+
+
+    ## Return the index of the child that an object with the given bounds 
+    # should go in, or None if it should stay in this node.
+    def getChildIndexFor(self, bounds):
+        if not self.childRects:
+            return None
+        (x, y) = bounds.center
+        index = 0
+        if x >= self.rect.centerx:
+            index += 1
+        if y >= self.rect.centery:
+            index += 2
+        if self.childLooseRects[index].contains(bounds):
+            return index
+        return None
+
+
+    ## Remove the specified object from the tree, in constant time (save for
+    # updating object counts). Return True if we deleted it; False otherwise.
+    # Note that this changes the order of the objects in the node that held
+    # the object.
+    def removeObject(self, object):
+        node = getattr(object, 'treeNode', None)
+        if node is None:
+            return False
+        lastObject = node.objects.pop()
+        if lastObject is not object:
+            node.objects[object.treeIndex] = lastObject
+            lastObject.treeIndex = object.treeIndex
+        object.treeNode = None
+        object.treeIndex = None
+        while node is not None:
+            node.numObjects -= 1
+            node = node.parent
+        return True
+
+
+    ## Move the given object, which must already be in the tree, to the node
+    # that should hold it now. Objects that are still inside their node's 
+    # loose bounds, and that can't be pushed down into a child, are left 
+    # alone. Return True if the object was moved.
+    def relocateObject(self, object):
+        node = object.treeNode
+        bounds = object.getBounds()
+        if (node.getChildIndexFor(bounds) is None and 
+                (node.parent is None or node.looseRect.contains(bounds))):
+            return False
+        # Climb up to the nearest node that can hold the object, and push it
+        # down from there.
+        target = node
+        while (target.parent is not None and 
+                not target.looseRect.contains(bounds)):
+            target = target.parent
+        self.removeObject(object)
+        target.insertObject(object, bounds)
+        return True
+
+
+    ## Yield each pair of objects in the tree whose bounding rects overlap, 
+    # once. Since the loose bounds of sibling nodes overlap, an object can
+    # touch objects anywhere in the tree whose nodes' loose bounds overlap it,
+    # not just those in its own node and its ancestors, so each object looks
+    # for its neighbors with getObjectsIntersectingRect().
+    def getCollisionPairs(self):
+        objects = self.getObjects()
+        idToIndex = dict([(id(object), i) for i, object in enumerate(objects)])
+        for i, firstObject in enumerate(objects):
+            firstRect = firstObject.getBounds()
+            for secondObject in self.getObjectsIntersectingRect(firstRect):
+                if idToIndex[id(secondObject)] > i:
+                    yield (firstObject, secondObject)
+
+
+    ## Draw the objects in this node and all children, that intersect with 
+    # the current view.
+    # \param viewRect Rect of the visible part of the world, in realspace (see
+    #        Camera.getViewRect()), used to cull objects that aren't visible.
+    #        If None, everything is drawn.
+    def draw(self, progress, viewRect = None):
+        for object in self.objects:
+            if viewRect is None or object.getBounds().colliderect(viewRect):
+                object.draw(progress)
+        for child in self.children:
+            if (child.numObjects and 
+                    (viewRect is None or 
+                     child.looseRect.colliderect(viewRect))):
+                child.draw(progress, viewRect)
+
+
+    ## Return the number of objects in this node and any child nodes.
+    def getNumObjects(self):
+        return self.numObjects
+
+
+    ## Return all objects in this node and any child nodes.
+    def getObjects(self):
+        result = list(self.objects)
+        for child in self.children:
+            if child.numObjects:
+                result.extend(child.getObjects())
+        return result
+
+
+    ## Return all objects whose bounding rects intersect the given rect, in
+    # this node and any child nodes.
+    def getObjectsIntersectingRect(self, rect):
+        result = [object for object in self.objects if rect.colliderect(object.getBounds())]
+        for child in self.children:
+            if child.numObjects and child.looseRect.colliderect(rect):
+                result.extend(child.getObjectsIntersectingRect(rect))
+        return result
+
+
+    ## Return true if this node's loose bounds can fully contain the given 
+    # object.
+    def canAcceptObject(self, object):
+        return self.looseRect.contains(object.getBounds())
+
+
+    ## Recursively print the tree
+    def printTree(self):
+        logger.debug(self)
+        for child in self.children:
+            child.printTree()
+
+
+    ## Convert to string, non-recursively.
+    def __str__(self):
+        nodeTypeStr = ' (leaf) '
+        if len(self.children):
+            nodeTypeStr = ''
+        return ('[LooseQuadTree ID ' + str(self.id)  + ' at depth ' + 
+                str(self.depth) + nodeTypeStr + ' bounds ' + 
+                str(Vector2D(self.rect.topleft)) + ' to ' + 
+                str(Vector2D(self.rect.bottomright)) +
+                ' with ' + str(len(self.objects)) + ' objects here and ' + 
+                str(self.numObjects) + ' objects overall]')
+
+
+## Return the loose bounds for a LooseQuadTree node with the given rect.
+def getLooseRect(rect):
+    return rect.inflate(rect.width * (looseness - 1), 
+                        rect.height * (looseness - 1))
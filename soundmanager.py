@@ -10,14 +10,17 @@ class SoundManager:
     ## Load all sounds. 
     # \todo: Make this configurable.
     def __init__(self):
-        pygame.mixer.quit()
-        pygame.mixer.init(22050, -16, 1, 1024)
         ## Maps individual sound names (i.e. their paths) to PyGame Sound 
         # instances.
         self.nameToSoundMap = dict()
         ## Maps names of sound directories to lists of the PyGame Sound
         # instances found in those directories.
         self.nameToSoundListMap = dict()
+        if constants.isHeadless:
+            # No mixer, so nothing to play sounds with.
+            return
+        pygame.mixer.quit()
+        pygame.mixer.init(22050, -16, 1, 1024)
         self.loadSoundDirectory(constants.soundPath)
 
 
@@ -38,6 +41,8 @@ class SoundManager:
 
     ## Play an individual sound by its name.
     def playSound(self, soundName):
+        if constants.isHeadless:
+            return
         if soundName in self.nameToSoundMap:
             self.nameToSoundMap[soundName].play()
         elif soundName in self.nameToSoundListMap:
@@ -0,0 +1,168 @@
+import constants
+
+## @package spatialhash This package holds SpatialHash, a broadphase for
+# dynamic objects that buckets them by a uniform grid. See the
+# gameobjectmanager module for the broadphase interface.
+
+## Width and height of the cells of the hash, in realspace. A multiple of the
+# block size, so that cells line up with the map grid; it should be at least
+# as big as a typical creature, so that most objects only touch a few cells.
+cellSize = constants.blockSize * 4
+
+
+## SpatialHash instances hold 2D objects in a uniform grid of square cells.
+# Each object is listed in every cell that its bounding rect touches; only
+# occupied cells are stored, in a dict keyed by (column, row). Unlike a
+# QuadTree, crowds of objects in one area are spread across many small cells
+# instead of piling up in a few nodes, so the cost of finding collisions
+# depends on how crowded each cell is rather than on how crowded the area is.
+class SpatialHash:
+    ## \param rect Bounds of the map; objects outside of it are still handled.
+    def __init__(self, rect):
+        self.rect = rect
+        ## Maps (column, row) tuples to lists of the objects in that cell.
+        self.cells = dict()
+        ## List of all objects in the hash.
+        self.objects = []
+        ## Maps IDs of objects to their indices in self.objects.
+        self.idToIndex = dict()
+        ## Maps IDs of objects to the (min column, min row, max column, max
+        # row) range of cells that they are listed in.
+        self.idToCellRange = dict()
+
+
+    ## Add an object to the hash.
+    def addObject(self, object):
+        self.idToIndex[id(object)] = len(self.objects)
+        self.objects.append(object)
+        cellRange = getCellRange(object.getBounds())
+        self.idToCellRange[id(object)] = cellRange
+        self.addToCells(object, cellRange)
+
+
+    ## Add many objects by iteratively calling self.addObject().
+    def addObjects(self, objects):
+        for object in objects:
+            self.addObject(object)
+
+
+    ## Remove the specified object from the hash. Return True if we deleted
+    # it; False otherwise. Note that this changes the order of the remaining
+    # objects.
+    def removeObject(self, object):
+        if id(object) not in self.idToIndex:
+            return False
+        index = self.idToIndex.pop(id(object))
+        lastObject = self.objects.pop()
+        if lastObject is not object:
+            self.objects[index] = lastObject
+            self.idToIndex[id(lastObject)] = index
+        self.removeFromCells(object, self.idToCellRange.pop(id(object)))
+        return True
+
+
+    ## Update the cells that the given object, which must already be in the
+    # hash, is listed in. Objects that still touch the same cells are left
+    # alone. Return True if the object was moved.
+    def relocateObject(self, object):
+        cellRange = getCellRange(object.getBounds())
+        oldCellRange = self.idToCellRange[id(object)]
+        if cellRange == oldCellRange:
+            return False
+        self.removeFromCells(object, oldCellRange)
+        self.addToCells(object, cellRange)
+        self.idToCellRange[id(object)] = cellRange
+        return True
+
+
+    ## List the object in each of the cells in the given range.
+    def addToCells(self, object, cellRange):
+        (minCol, minRow, maxCol, maxRow) = cellRange
+        for col in xrange(minCol, maxCol + 1):
+            for row in xrange(minRow, maxRow + 1):
+                key = (col, row)
+                if key in self.cells:
+                    self.cells[key].append(object)
+                else:
+                    self.cells[key] = [object]
+
+
+    ## Remove the object from each of the cells in the given range, dropping
+    # cells that end up empty.
+    def removeFromCells(self, object, cellRange):
+        (minCol, minRow, maxCol, maxRow) = cellRange
+        for col in xrange(minCol, maxCol + 1):
+            for row in xrange(minRow, maxRow + 1):
+                key = (col, row)
+                cell = self.cells[key]
+                if len(cell) == 1:
+                    del self.cells[key]
+                else:
+                    cell.remove(object)
+
+
+    ## Yield each pair of objects in the hash whose bounding rects overlap,
+    # once. Objects that share several cells are only paired in the first
+    # cell (lowest column, then lowest row) of the overlap of their ranges.
+    def getCollisionPairs(self):
+        for (key, cell) in self.cells.items():
+            if len(cell) < 2:
+                continue
+            (col, row) = key
+            rects = [object.getBounds() for object in cell]
+            ranges = [self.idToCellRange[id(object)] for object in cell]
+            for i, firstObject in enumerate(cell):
+                firstRect = rects[i]
+                (firstMinCol, firstMinRow) = ranges[i][:2]
+                for j in xrange(i + 1, len(cell)):
+                    (secondMinCol, secondMinRow) = ranges[j][:2]
+                    if (max(firstMinCol, secondMinCol) != col or
+                            max(firstMinRow, secondMinRow) != row):
+                        continue
+                    if firstRect.colliderect(rects[j]):
+                        yield (firstObject, cell[j])
+
+
+    ## Return the number of objects in the hash.
+    def getNumObjects(self):
+        return len(self.objects)
+
+
+    ## Return all objects in the hash.
+    def getObjects(self):
+        return list(self.objects)
+
+
+    ## Return all objects whose bounding rects intersect the given rect.
+    def getObjectsIntersectingRect(self, rect):
+        (minCol, minRow, maxCol, maxRow) = getCellRange(rect)
+        if (maxCol - minCol + 1) * (maxRow - minRow + 1) > len(self.cells):
+            # Cheaper to look at every occupied cell than every cell in the
+            # range.
+            cells = [cell for (col, row), cell in self.cells.iteritems()
+                     if minCol <= col <= maxCol and minRow <= row <= maxRow]
+        else:
+            cells = []
+            for col in xrange(minCol, maxCol + 1):
+                for row in xrange(minRow, maxRow + 1):
+                    if (col, row) in self.cells:
+                        cells.append(self.cells[(col, row)])
+        result = []
+        seenIds = set()
+        for cell in cells:
+            for object in cell:
+                if (id(object) not in seenIds and
+                        rect.colliderect(object.getBounds())):
+                    seenIds.add(id(object))
+                    result.append(object)
+        return result
+
+
+## Return the (min column, min row, max column, max row) range of cells that
+# the given realspace Rect touches. Rects with no width or height are treated
+# as being 1 unit wide or tall, since Rect.colliderect() still lets them
+# overlap other rects.
+def getCellRange(rect):
+    return (int(rect.left // cellSize), int(rect.top // cellSize),
+            int((max(rect.right, rect.left + 1) - 1) // cellSize),
+            int((max(rect.bottom, rect.top + 1) - 1) // cellSize))
@@ -4,8 +4,9 @@ import constants
 import pygame
 import pygame.locals
 import os
-import OpenGL.GL as GL
-import OpenGL.GLU as GLU
+if not constants.isHeadless:
+    import OpenGL.GL as GL
+    import OpenGL.GLU as GLU
 
 ## This class handles the splash screen display at the start of the game. As
 # such, it has very few dependencies (and in fact, duplicates some code found
@@ -119,16 +120,22 @@ class SplashScreen:
 
         pygame.display.flip()
 
-## Module-global singleton
-splashscreen.splashScreen = SplashScreen()
+## Module-global singleton. There is no splash screen when running headless.
+if constants.isHeadless:
+    splashscreen.splashScreen = None
+else:
+    splashscreen.splashScreen = SplashScreen()
 
 ## Passthrough to SplashScreen.updateMessage
 def updateMessage(message):
-    splashscreen.splashScreen.updateMessage(message)
+    if splashscreen.splashScreen is not None:
+        splashscreen.splashScreen.updateMessage(message)
 
 ## Since SplashScreen has the main PyGame screen surface, we need to be able 
-# to retrieve it.
+# to retrieve it. Returns None if we are running headless.
 def getScreen():
+    if splashscreen.splashScreen is None:
+        return None
     return splashscreen.splashScreen.screen
 
 ## Unset the singleton so that we can stop sending log messages to it.
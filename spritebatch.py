@@ -0,0 +1,69 @@
+import constants
+
+import numpy
+if not constants.isHeadless:
+    import OpenGL.GL as GL
+
+## @package spritebatch This package collects the quads for sprites that are
+# drawn during a frame, so that they can be sent to OpenGL in a handful of 
+# calls rather than one glBegin()/glEnd() pair (and a dozen other calls) per 
+# sprite. See ImageManager.drawGameObjectAt() and 
+# ImageManager.flushSprites().
+
+## Number of floats per vertex in the interleaved vertex array: texture 
+# coordinates (u, v) followed by a location (x, y, z), as GL_T2F_V3F expects.
+floatsPerVertex = 5
+
+## Collects textured quads and draws them all at once.
+class SpriteBatch:
+    def __init__(self):
+        ## Texture IDs of the queued quads, in the order they were added.
+        self.textureIds = []
+        ## For each queued quad, a tuple of its left, top, right, and bottom
+        # edges in realspace, followed by its texture coordinates.
+        self.quads = []
+
+
+    ## Queue a frame for drawing with its top-left corner at the given 
+    # realspace location.
+    def addQuad(self, frame, loc):
+        self.textureIds.append(frame.textureId)
+        self.quads.append((loc.x, loc.y, loc.x + frame.width, 
+                           loc.y + frame.height) + frame.texCoords)
+
+
+    ## Draw all queued quads, and empty the queue. Quads are grouped by 
+    # texture, with one draw call per texture; quads that share a texture 
+    # are drawn in the order they were added.
+    def flush(self):
+        if not self.quads:
+            return
+        textureIds = numpy.array(self.textureIds)
+        order = numpy.argsort(textureIds, kind = 'mergesort')
+        textureIds = textureIds[order]
+        quads = numpy.array(self.quads, numpy.float32)[order]
+        self.textureIds = []
+        self.quads = []
+
+        (left, top, right, bottom, 
+                texLeft, texTop, texRight, texBottom) = quads.T
+        # The Y axis is flipped, as in ImageManager.drawQuad().
+        (top, bottom) = (-top, -bottom)
+        zero = numpy.zeros(len(quads), numpy.float32)
+        vertices = numpy.empty((len(quads), 4, floatsPerVertex), 
+                               numpy.float32)
+        vertices[:, 0] = numpy.column_stack((texLeft, texTop, left, top, zero))
+        vertices[:, 1] = numpy.column_stack((texRight, texTop, right, top, zero))
+        vertices[:, 2] = numpy.column_stack((texRight, texBottom, right, bottom, zero))
+        vertices[:, 3] = numpy.column_stack((texLeft, texBottom, left, bottom, zero))
+
+        # Indices of the first quad for each texture.
+        starts = [0] + (numpy.flatnonzero(textureIds[1:] != textureIds[:-1]) + 1).tolist()
+        ends = starts[1:] + [len(quads)]
+
+        GL.glInterleavedArrays(GL.GL_T2F_V3F, 0, vertices)
+        for start, end in zip(starts, ends):
+            GL.glBindTexture(GL.GL_TEXTURE_2D, int(textureIds[start]))
+            GL.glDrawArrays(GL.GL_QUADS, start * 4, (end - start) * 4)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_TEXTURE_COORD_ARRAY)
@@ -0,0 +1,454 @@
+import bisect
+
+import pygame
+
+## @package sweepandprune This package holds SweepAndPrune, a broadphase for
+# dynamic objects that keeps their bounding rects sorted along each axis. See
+# the gameobjectmanager module for the broadphase interface.
+
+## Largest number of objects added since the last query that are inserted one
+# at a time; past this, the sorted lists and the overlapping pairs are rebuilt
+# from scratch instead.
+maxIncrementalAdds = 8
+
+## Indices of the fields of an endpoint. Endpoints are lists of [value,
+# isMin, object ID, index in the axis's list of endpoints]; they're lists,
+# rather than instances of a class, because they're compared and swapped a
+# lot.
+(VALUE, IS_MIN, OWNER, INDEX) = range(4)
+
+
+## SweepAndPrune instances hold 2D objects as intervals along the X and Y
+# axes. Each axis has a list of the objects' interval endpoints, sorted by
+# position, which is kept from tick to tick; when an object moves, its
+# endpoints are moved along the lists by insertion sort. Since objects only
+# move a little between ticks, each endpoint only passes a few others. Two
+# rects overlap exactly when their intervals overlap on both axes, and their
+# intervals start or stop overlapping on an axis exactly when a min endpoint
+# of one passes a max endpoint of the other, so the set of overlapping pairs
+# is kept up to date from those swaps, without retesting every pair each
+# tick. The bounds of each object are only fetched once per move, and stored
+# in its endpoints.
+#
+# Besides the broadphase interface, getPairChanges() reports which pairs
+# started or stopped overlapping since it was last called.
+class SweepAndPrune:
+    ## \param rect Bounds of the map; objects outside of it are still handled.
+    def __init__(self, rect):
+        self.rect = rect
+        ## Sorted lists of endpoints along the X and Y axes.
+        self.axes = ([], [])
+        ## List of all objects, including ones that haven't been put in the
+        # sorted lists yet.
+        self.objects = []
+        ## Maps IDs of objects to their indices in self.objects.
+        self.idToIndex = dict()
+        ## Maps IDs of objects to the objects.
+        self.idToObject = dict()
+        ## Maps IDs of objects to their (min X, max X, min Y, max Y)
+        # endpoints.
+        self.idToEndpoints = dict()
+        ## Maps IDs of objects to sets of the IDs of objects that they overlap.
+        self.idToPartners = dict()
+        ## Maps IDs of objects whose bounds have no width or height to their
+        # bounds. Their endpoints are widened (see getExtents()), so their
+        # overlaps are confirmed with Rect.colliderect().
+        self.idToFlatRect = dict()
+        ## Objects that have been added since the last query, and aren't in
+        # the sorted lists yet.
+        self.pendingObjects = []
+        ## Whether to record changes to which pairs overlap. Turned on by the
+        # first call to getPairChanges(), so that nothing piles up if no one
+        # asks for them.
+        self.shouldTrackPairChanges = False
+        ## Set of (lower ID, higher ID) pairs whose endpoints have started or
+        # stopped overlapping since the last call to getPairChanges().
+        self.changedPairs = set()
+        ## IDs of the objects that had no width or height as of the last call
+        # to getPairChanges().
+        self.reportedFlatIds = set()
+        ## Set of (lower ID, higher ID) pairs, involving at least one of the
+        # objects in self.reportedFlatIds, that were overlapping as of the 
+        # last call to getPairChanges().
+        self.reportedFlatPairs = set()
+
+
+    ## Add an object. It is put into the sorted lists the next time they're
+    # needed, so that many objects can be added at once cheaply.
+    def addObject(self, object):
+        self.idToIndex[id(object)] = len(self.objects)
+        self.objects.append(object)
+        self.idToObject[id(object)] = object
+        self.pendingObjects.append(object)
+
+
+    ## Add many objects by iteratively calling self.addObject().
+    def addObjects(self, objects):
+        for object in objects:
+            self.addObject(object)
+
+
+    ## Remove the specified object. Return True if we deleted it; False
+    # otherwise. Note that this changes the order of the remaining objects.
+    def removeObject(self, object):
+        objectId = id(object)
+        if objectId not in self.idToIndex:
+            return False
+        index = self.idToIndex.pop(objectId)
+        lastObject = self.objects.pop()
+        if lastObject is not object:
+            self.objects[index] = lastObject
+            self.idToIndex[id(lastObject)] = index
+        del self.idToObject[objectId]
+        self.idToFlatRect.pop(objectId, None)
+
+        if object in self.pendingObjects:
+            self.pendingObjects.remove(object)
+            return True
+        for partnerId in list(self.idToPartners[objectId]):
+            self.endOverlap(objectId, partnerId)
+        del self.idToPartners[objectId]
+        endpoints = self.idToEndpoints.pop(objectId)
+        for axis in xrange(2):
+            endpointList = self.axes[axis]
+            # Remove the later endpoint first, so the earlier one's index is
+            # still right.
+            for endpoint in (endpoints[axis * 2 + 1], endpoints[axis * 2]):
+                del endpointList[endpoint[INDEX]]
+                for i in xrange(endpoint[INDEX], len(endpointList)):
+                    endpointList[i][INDEX] = i
+        return True
+
+
+    ## Move the object's endpoints to match its current bounds, updating
+    # the set of overlapping pairs as they pass other endpoints. Return True
+    # if the object's bounds changed.
+    def relocateObject(self, object):
+        objectId = id(object)
+        if objectId not in self.idToEndpoints:
+            # Still pending; it'll get its current bounds when inserted.
+            return False
+        endpoints = self.idToEndpoints[objectId]
+        bounds = self.getObjectExtents(object)
+        if bounds == tuple([endpoint[VALUE] for endpoint in endpoints]):
+            return False
+        # Finish one axis before starting on the other, so that the overlap
+        # checks made while moving along one axis see the other axis as it
+        # is in its sorted list.
+        for axis in xrange(2):
+            (minEndpoint, maxEndpoint) = endpoints[axis * 2 : axis * 2 + 2]
+            newMin = bounds[axis * 2]
+            newMax = bounds[axis * 2 + 1]
+            # Move the endpoints in an order that never lets them cross each
+            # other.
+            if newMax > maxEndpoint[VALUE]:
+                order = ((maxEndpoint, newMax), (minEndpoint, newMin))
+            else:
+                order = ((minEndpoint, newMin), (maxEndpoint, newMax))
+            for (endpoint, value) in order:
+                if value != endpoint[VALUE]:
+                    endpoint[VALUE] = value
+                    self.sortEndpoint(axis, endpoint)
+        return True
+
+
+    ## Move the given endpoint, whose value has changed, to its sorted
+    # position along the given axis, starting or ending overlaps as it passes
+    # the endpoints of other objects. Endpoints are sorted by value, and then
+    # with max endpoints before min endpoints, so that rects that just touch
+    # don't overlap, as for Rect.colliderect().
+    def sortEndpoint(self, axis, endpoint):
+        endpointList = self.axes[axis]
+        otherAxis = 1 - axis
+        (value, isMin, ownerId, index) = endpoint
+        # Move towards the start of the list.
+        while index > 0:
+            other = endpointList[index - 1]
+            if (other[VALUE] < value or
+                    (other[VALUE] == value and other[IS_MIN] <= isMin)):
+                break
+            if isMin and not other[IS_MIN]:
+                self.startAxisOverlap(ownerId, other[OWNER], otherAxis)
+            elif not isMin and other[IS_MIN]:
+                self.endOverlap(ownerId, other[OWNER])
+            endpointList[index] = other
+            other[INDEX] = index
+            index -= 1
+        # Move towards the end of the list.
+        lastIndex = len(endpointList) - 1
+        while index < lastIndex:
+            other = endpointList[index + 1]
+            if (other[VALUE] > value or
+                    (other[VALUE] == value and other[IS_MIN] >= isMin)):
+                break
+            if not isMin and other[IS_MIN]:
+                self.startAxisOverlap(ownerId, other[OWNER], otherAxis)
+            elif isMin and not other[IS_MIN]:
+                self.endOverlap(ownerId, other[OWNER])
+            endpointList[index] = other
+            other[INDEX] = index
+            index += 1
+        endpointList[index] = endpoint
+        endpoint[INDEX] = index
+
+
+    ## The two objects have just started to overlap along one axis; if they
+    # also overlap along the other axis, then start their overlap.
+    def startAxisOverlap(self, firstId, secondId, otherAxis):
+        if self.getDoOverlapOnAxis(firstId, secondId, otherAxis):
+            self.startOverlap(firstId, secondId)
+
+
+    ## Return true if the two objects' intervals overlap along the given
+    # axis.
+    def getDoOverlapOnAxis(self, firstId, secondId, axis):
+        firstEndpoints = self.idToEndpoints[firstId]
+        secondEndpoints = self.idToEndpoints[secondId]
+        return (firstEndpoints[axis * 2][VALUE] <
+                    secondEndpoints[axis * 2 + 1][VALUE] and
+                secondEndpoints[axis * 2][VALUE] <
+                    firstEndpoints[axis * 2 + 1][VALUE])
+
+
+    ## Record that the two objects now overlap.
+    def startOverlap(self, firstId, secondId):
+        self.idToPartners[firstId].add(secondId)
+        self.idToPartners[secondId].add(firstId)
+        self.recordPairChange(firstId, secondId, True)
+
+
+    ## Record that the two objects no longer overlap, if they did.
+    def endOverlap(self, firstId, secondId):
+        if secondId not in self.idToPartners[firstId]:
+            return
+        self.idToPartners[firstId].remove(secondId)
+        self.idToPartners[secondId].remove(firstId)
+        self.recordPairChange(firstId, secondId, False)
+
+
+    ## Note that the pair's endpoints started or stopped overlapping. A 
+    # change that undoes an earlier one since the last getPairChanges() 
+    # cancels it out.
+    def recordPairChange(self, firstId, secondId, didStart):
+        if not self.shouldTrackPairChanges:
+            return
+        key = (min(firstId, secondId), max(firstId, secondId))
+        if key in self.changedPairs:
+            self.changedPairs.remove(key)
+        else:
+            self.changedPairs.add(key)
+
+
+    ## Put all pending objects into the sorted lists, finding what they
+    # overlap.
+    def insertPendingObjects(self):
+        if not self.pendingObjects:
+            return
+        if len(self.pendingObjects) > maxIncrementalAdds:
+            self.rebuild()
+            return
+        for object in self.pendingObjects:
+            objectId = id(object)
+            bounds = self.getObjectExtents(object)
+            endpoints = self.makeEndpoints(objectId, bounds)
+            for axis in xrange(2):
+                endpointList = self.axes[axis]
+                for endpoint in endpoints[axis * 2 : axis * 2 + 2]:
+                    index = bisect.bisect_left(endpointList, endpoint)
+                    endpointList.insert(index, endpoint)
+                    for i in xrange(index, len(endpointList)):
+                        endpointList[i][INDEX] = i
+            for otherId in self.idToEndpoints:
+                if (otherId != objectId and
+                        self.getDoOverlapOnAxis(objectId, otherId, 0) and
+                        self.getDoOverlapOnAxis(objectId, otherId, 1)):
+                    self.startOverlap(objectId, otherId)
+        self.pendingObjects = []
+
+
+    ## Return the extents (see getExtents()) of the object's bounds, keeping
+    # track of whether it has no width or height.
+    def getObjectExtents(self, object):
+        rect = object.getBounds()
+        if rect.width > 0 and rect.height > 0:
+            self.idToFlatRect.pop(id(object), None)
+        else:
+            self.idToFlatRect[id(object)] = pygame.rect.Rect(rect)
+        return getExtents(rect)
+
+
+    ## Return the bounds of the given object as of its last relocation.
+    def getStoredRect(self, objectId):
+        if objectId in self.idToFlatRect:
+            return self.idToFlatRect[objectId]
+        (left, right, top, bottom) = [endpoint[VALUE] 
+                for endpoint in self.idToEndpoints[objectId]]
+        return pygame.rect.Rect(left, top, right - left, bottom - top)
+
+
+    ## Set up the endpoints and partners for the given object, and return the
+    # endpoints.
+    def makeEndpoints(self, objectId, bounds):
+        endpoints = tuple([[bounds[i], i % 2 == 0, objectId, None]
+                           for i in xrange(4)])
+        self.idToEndpoints[objectId] = endpoints
+        self.idToPartners[objectId] = set()
+        return endpoints
+
+
+    ## Add all pending objects by re-sorting each axis from scratch and then
+    # sweeping along the X axis to find overlapping pairs.
+    def rebuild(self):
+        for object in self.pendingObjects:
+            self.makeEndpoints(id(object), self.getObjectExtents(object))
+        self.pendingObjects = []
+        for axis in xrange(2):
+            endpointList = []
+            for endpoints in self.idToEndpoints.itervalues():
+                endpointList.extend(endpoints[axis * 2 : axis * 2 + 2])
+            endpointList.sort(key = lambda endpoint: endpoint[:2])
+            for i, endpoint in enumerate(endpointList):
+                endpoint[INDEX] = i
+            self.axes[axis][:] = endpointList
+
+        activeIds = set()
+        for (value, isMin, ownerId, index) in self.axes[0]:
+            if not isMin:
+                activeIds.remove(ownerId)
+                continue
+            for otherId in activeIds:
+                if (otherId not in self.idToPartners[ownerId] and
+                        self.getDoOverlapOnAxis(ownerId, otherId, 1)):
+                    self.startOverlap(ownerId, otherId)
+            activeIds.add(ownerId)
+
+
+    ## Yield each pair of objects whose bounding rects overlap, once, as of
+    # their last relocation. Pairs are sorted by the objects' order in
+    # getObjects().
+    def getCollisionPairs(self):
+        self.insertPendingObjects()
+        pairs = []
+        for (objectId, partnerIds) in self.idToPartners.iteritems():
+            index = self.idToIndex[objectId]
+            isFlat = objectId in self.idToFlatRect
+            for partnerId in partnerIds:
+                partnerIndex = self.idToIndex[partnerId]
+                if index > partnerIndex:
+                    continue
+                if ((isFlat or partnerId in self.idToFlatRect) and
+                        not self.getDoPartnersOverlap(objectId, partnerId)):
+                    continue
+                pairs.append((index, partnerIndex))
+        pairs.sort()
+        for (index, partnerIndex) in pairs:
+            yield (self.objects[index], self.objects[partnerIndex])
+
+
+    ## Return true if the two objects, whose endpoints overlap, have bounding
+    # rects that overlap. This only needs checking if one of them has no
+    # width or height (see getExtents()).
+    def getDoPartnersOverlap(self, firstId, secondId):
+        if (firstId not in self.idToFlatRect and 
+                secondId not in self.idToFlatRect):
+            return True
+        return self.getStoredRect(firstId).colliderect(
+                self.getStoredRect(secondId))
+
+
+    ## Return true if the pair with the given (lower ID, higher ID) key is 
+    # overlapping, as getCollisionPairs() would report it.
+    def getIsPairOverlapping(self, key):
+        return (key[0] in self.idToPartners and 
+                key[1] in self.idToPartners[key[0]] and
+                self.getDoPartnersOverlap(key[0], key[1]))
+
+
+    ## Return a tuple of the lists of (first object, second object) pairs
+    # that have started overlapping and that have stopped overlapping since
+    # the last call, in no particular order; together with 
+    # getCollisionPairs(), these agree with the pairs it reported then and 
+    # now. Objects that have been removed since then are given as None. 
+    # Changes are only recorded from the first call on, so that call returns
+    # nothing.
+    #
+    # Only pairs whose endpoints have started or stopped overlapping can have
+    # changed, except for pairs involving objects with no width or height, 
+    # whose endpoints are widened; those are checked directly.
+    def getPairChanges(self):
+        self.insertPendingObjects()
+        started = []
+        stopped = []
+        if self.shouldTrackPairChanges:
+            flatIds = self.reportedFlatIds.union(self.idToFlatRect)
+            keys = self.changedPairs.union(self.reportedFlatPairs)
+            for objectId in flatIds:
+                for partnerId in self.idToPartners.get(objectId, ()):
+                    keys.add((min(objectId, partnerId), 
+                              max(objectId, partnerId)))
+            for key in keys:
+                isOverlapping = self.getIsPairOverlapping(key)
+                if (key[0] in self.reportedFlatIds or 
+                        key[1] in self.reportedFlatIds):
+                    wasOverlapping = key in self.reportedFlatPairs
+                else:
+                    # The endpoints, and so the rects, overlapped then 
+                    # unless that has changed since.
+                    wasOverlapping = ((key[0] in self.idToPartners and
+                                       key[1] in self.idToPartners[key[0]])
+                                      != (key in self.changedPairs))
+                if isOverlapping != wasOverlapping:
+                    pair = (self.idToObject.get(key[0]), 
+                            self.idToObject.get(key[1]))
+                    if isOverlapping:
+                        started.append(pair)
+                    else:
+                        stopped.append(pair)
+        self.shouldTrackPairChanges = True
+        self.changedPairs = set()
+        self.reportedFlatIds = set(self.idToFlatRect)
+        self.reportedFlatPairs = set()
+        for objectId in self.reportedFlatIds:
+            for partnerId in self.idToPartners[objectId]:
+                key = (min(objectId, partnerId), max(objectId, partnerId))
+                if self.getDoPartnersOverlap(objectId, partnerId):
+                    self.reportedFlatPairs.add(key)
+        return (started, stopped)
+
+
+    ## Return the number of objects.
+    def getNumObjects(self):
+        return len(self.objects)
+
+
+    ## Return all objects.
+    def getObjects(self):
+        return list(self.objects)
+
+
+    ## Return all objects whose bounding rects intersect the given rect, as
+    # of their last relocation.
+    def getObjectsIntersectingRect(self, rect):
+        self.insertPendingObjects()
+        (left, right, top, bottom) = getExtents(rect)
+        isFlat = rect.width <= 0 or rect.height <= 0
+        result = []
+        for object in self.objects:
+            endpoints = self.idToEndpoints[id(object)]
+            if (endpoints[0][VALUE] < right and left < endpoints[1][VALUE] and
+                    endpoints[2][VALUE] < bottom and top < endpoints[3][VALUE]):
+                if ((isFlat or id(object) in self.idToFlatRect) and
+                        not rect.colliderect(self.getStoredRect(id(object)))):
+                    continue
+                result.append(object)
+        return result
+
+
+## Return the (left, right, top, bottom) extents of the given Rect. Rects with
+# no width or height are treated as being 1 unit across, so that every
+# object's min endpoints come before its max endpoints. That makes them 
+# overlap some rects that Rect.colliderect() says they don't, so overlaps
+# involving them need checking; see SweepAndPrune.getDoPartnersOverlap().
+def getExtents(rect):
+    return (rect.left, max(rect.right, rect.left + 1),
+            rect.top, max(rect.bottom, rect.top + 1))
@@ -9,7 +9,8 @@ from pygame.locals import *
 import sys
 import random
 
-import OpenGL.GL as GL
+if not constants.isHeadless:
+    import OpenGL.GL as GL
 
 ## @package util
 # The functions in util are general utility functions that are not tied to any
@@ -109,6 +110,14 @@ def adjacencyArrayToSignatures(kernel):
     return dict().fromkeys(result).keys()
 
 
+## Return the smallest power of 2 that is at least the given value.
+def getNextPowerOfTwo(value):
+    result = 1
+    while result < value:
+        result *= 2
+    return result
+
+
 ## Switch to orthographic drawing
 def setOrtho():
     GL.glPushMatrix()
@@ -7,6 +7,7 @@ from vector2d import Vector2D
 import sys
 import os
 import random
+import numpy
 
 zonePlacementIterations = 100
 zoneGravityMultiplier = -.005
@@ -104,3 +105,40 @@ def placeZones(zoneConfigData):
 
     return zonePoints
 
+
+## Divide a cols x rows grid covering the area [[0, 1], [0, 1]] among the 
+# zones, by assigning each cell (i, j) to the zone whose point (from 
+# placeZones()) is closest to (i / cols, j / rows). Ties go to the zone that
+# comes first in zonePoints' iteration order. Returns a tuple of:
+# - The names of the zones, in zonePoints' iteration order.
+# - An int32 grid, indexed by [i, j], of indices into that list.
+# - A dict mapping each zone name to a list of its cells, as flat indices
+#   (i * rows + j) in increasing order. Zones that got no cells are omitted.
+def assignZones(zonePoints, cols, rows):
+    zoneNames = []
+    zoneXs = []
+    zoneYs = []
+    for zoneName, zoneLoc in zonePoints.iteritems():
+        zoneNames.append(zoneName)
+        zoneXs.append(zoneLoc.x)
+        zoneYs.append(zoneLoc.y)
+    # Cell locations, broadcast against zone points along the first axis.
+    cellXs = (numpy.arange(cols) / float(cols)).reshape(1, cols, 1)
+    cellYs = (numpy.arange(rows) / float(rows)).reshape(1, 1, rows)
+    zoneXs = numpy.array(zoneXs).reshape(len(zoneNames), 1, 1)
+    zoneYs = numpy.array(zoneYs).reshape(len(zoneNames), 1, 1)
+    distances = numpy.sqrt((cellXs - zoneXs) ** 2 + (cellYs - zoneYs) ** 2)
+    # argmin picks the first of several equal distances.
+    zoneGrid = numpy.argmin(distances, axis = 0).astype(numpy.int32)
+
+    # Group cells by zone; a stable sort keeps each zone's cells in order.
+    flatZones = zoneGrid.ravel()
+    order = numpy.argsort(flatZones, kind = 'mergesort')
+    counts = numpy.bincount(flatZones, minlength = len(zoneNames))
+    zoneToCells = dict()
+    start = 0
+    for index, count in enumerate(counts.tolist()):
+        if count:
+            zoneToCells[zoneNames[index]] = order[start : start + count].tolist()
+        start += count
+    return (zoneNames, zoneGrid, zoneToCells)